@@ -0,0 +1,238 @@
+import json
+from datetime import date, datetime
+from itertools import groupby
+from flask import Blueprint, request, Response
+from flask_login import current_user
+from sqlalchemy import select, func
+from models import db, Cliente, Venta, VentaItem, PagoCliente, SaldoCliente
+from replica import lectura_replica
+from fechas import inicio_dia, rango_dias
+
+try:
+    import orjson
+except ImportError:  # sin orjson se usa json, más lento pero compatible
+    orjson = None
+
+
+# API de solo lectura para los cobradores: /api/v1/<recurso>?fields=...&despues=...
+api = Blueprint("api_v1", __name__, url_prefix="/api/v1")
+
+LIMITE_POR_DEFECTO = 100
+LIMITE_MAXIMO = 500
+
+# recurso -> campo pedible con fields= -> columna. La primera es la clave del cursor.
+CAMPOS = {
+    "clientes": {
+        "id": Cliente.id,
+        "nombre": Cliente.nombre,
+        "domicilio": Cliente.domicilio,
+        "localidad": Cliente.localidad,
+        "documento": Cliente.documento,
+        "telefono": Cliente.telefono,
+        "ingresos": Cliente.ingresos,
+        "lugar_trabajo": Cliente.lugar_trabajo,
+        "monto_autorizado": Cliente.monto_autorizado,
+        "saldo": func.coalesce(SaldoCliente.saldo, 0),
+    },
+    "ventas": {
+        "id": Venta.id,
+        "cliente_id": Venta.cliente_id,
+        "fecha": Venta.fecha,
+        "total": Venta.total,
+        "pago_a_cuenta": Venta.pago_a_cuenta,
+        "metodo_pago": Venta.metodo_pago,
+        "descripcion": Venta.descripcion,
+        "saldo_anterior": Venta.saldo_anterior,
+        "saldo_posterior": Venta.saldo_posterior,
+    },
+    "pagos": {
+        "id": PagoCliente.id,
+        "cliente_id": PagoCliente.cliente_id,
+        "fecha": PagoCliente.fecha,
+        "monto": PagoCliente.monto,
+        "metodo_pago": PagoCliente.metodo_pago,
+        "saldo_anterior": PagoCliente.saldo_anterior,
+        "saldo_posterior": PagoCliente.saldo_posterior,
+    },
+    "saldos": {
+        "cliente_id": SaldoCliente.cliente_id,
+        "saldo": SaldoCliente.saldo,
+        "actualizado": SaldoCliente.actualizado,
+    },
+}
+
+# Las ventas además pueden traer sus ítems (una consulta extra por página)
+CAMPOS_ITEM = ("cantidad", "descripcion", "precio_unitario", "total")
+CAMPOS_EXTRA = {"ventas": {"items"}}
+
+POR_DEFECTO = {
+    "clientes": ["id", "nombre", "documento", "telefono", "monto_autorizado", "saldo"],
+    "ventas": ["id", "cliente_id", "fecha", "total", "pago_a_cuenta", "metodo_pago", "items"],
+    "pagos": ["id", "cliente_id", "fecha", "monto", "metodo_pago"],
+    "saldos": ["cliente_id", "saldo", "actualizado"],
+}
+
+
+class PedidoInvalido(ValueError):
+    pass
+
+
+def _json_por_defecto(valor):
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    raise TypeError(f"{type(valor).__name__} no es serializable")
+
+
+def _json(datos, estado=200):
+    if orjson is not None:
+        cuerpo = orjson.dumps(datos, default=_json_por_defecto)
+    else:
+        cuerpo = json.dumps(datos, separators=(",", ":"), ensure_ascii=False, default=_json_por_defecto)
+    return Response(cuerpo, status=estado, mimetype="application/json")
+
+
+def _campos(recurso):
+    """Campos pedidos en fields= (o los por defecto), con la clave siempre primero."""
+    disponibles = CAMPOS[recurso]
+    extra = CAMPOS_EXTRA.get(recurso, set())
+    pedido = request.args.get("fields")
+    campos = [c.strip() for c in pedido.split(",") if c.strip()] if pedido else POR_DEFECTO[recurso]
+
+    desconocidos = [c for c in campos if c not in disponibles and c not in extra]
+    if desconocidos:
+        raise PedidoInvalido(f"Campos desconocidos: {', '.join(desconocidos)}")
+
+    clave = next(iter(disponibles))
+    return [clave] + [c for c in dict.fromkeys(campos) if c != clave]
+
+
+def _fecha(nombre):
+    valor = request.args.get(nombre)
+    if not valor:
+        return None
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise PedidoInvalido(f"{nombre} debe ser una fecha AAAA-MM-DD")
+
+
+def _entero(nombre, defecto=None):
+    valor = request.args.get(nombre)
+    if valor in (None, ""):
+        return defecto
+    try:
+        return int(valor)
+    except ValueError:
+        raise PedidoInvalido(f"{nombre} debe ser un número entero")
+
+
+def _consulta(recurso, campos):
+    """SELECT solo de las columnas pedidas, más los filtros de la query string."""
+    disponibles = CAMPOS[recurso]
+    consulta = select(*[disponibles[c].label(c) for c in campos if c in disponibles])
+
+    if recurso == "clientes":
+        consulta = consulta.select_from(Cliente)
+        if "saldo" in campos:
+            consulta = consulta.outerjoin(SaldoCliente, SaldoCliente.cliente_id == Cliente.id)
+
+    elif recurso in ("ventas", "pagos"):
+        modelo = Venta if recurso == "ventas" else PagoCliente
+        consulta = consulta.select_from(modelo)
+        cliente_id = _entero("cliente_id")
+        if cliente_id is not None:
+            consulta = consulta.where(modelo.cliente_id == cliente_id)
+        # Días de Buenos Aires, rango semiabierto: usa el índice de fecha
+        desde, hasta = rango_dias(_fecha("desde"), _fecha("hasta"))
+        if desde:
+            consulta = consulta.where(modelo.fecha >= desde)
+        if hasta:
+            consulta = consulta.where(modelo.fecha < hasta)
+
+    elif recurso == "saldos":
+        consulta = consulta.select_from(SaldoCliente)
+        if request.args.get("con_deuda") == "1":
+            consulta = consulta.where(SaldoCliente.saldo > 0)
+        # Para sincronizar: solo los saldos que cambiaron desde la última vez
+        desde = _fecha("desde")
+        if desde:
+            consulta = consulta.where(SaldoCliente.actualizado >= inicio_dia(desde))
+
+    return consulta
+
+
+def _agregar_items(filas):
+    """Agrega a cada venta la lista de sus ítems, en una sola consulta."""
+    ids = [f["id"] for f in filas]
+    items = db.session.execute(
+        select(VentaItem.venta_id, *[getattr(VentaItem, c) for c in CAMPOS_ITEM])
+        .where(VentaItem.venta_id.in_(ids))
+        .order_by(VentaItem.venta_id, VentaItem.id)
+    )
+    por_venta = {
+        venta_id: [dict(zip(CAMPOS_ITEM, item[1:])) for item in grupo]
+        for venta_id, grupo in groupby(items, key=lambda item: item[0])
+    }
+    for fila in filas:
+        fila["items"] = por_venta.get(fila["id"], [])
+
+
+def _filas(recurso, campos, consulta):
+    filas = [dict(fila._mapping) for fila in db.session.execute(consulta)]
+    if "items" in campos and filas:
+        _agregar_items(filas)
+    return filas
+
+
+def _listar(recurso):
+    """
+    Página de `recurso` ordenada por su clave. `despues` es la clave de la
+    última fila de la página anterior (el `siguiente` de la respuesta).
+    """
+    campos = _campos(recurso)
+    limite = min(max(_entero("limite", LIMITE_POR_DEFECTO), 1), LIMITE_MAXIMO)
+    clave = next(iter(CAMPOS[recurso].values()))
+
+    consulta = _consulta(recurso, campos).order_by(clave).limit(limite + 1)
+    despues = _entero("despues")
+    if despues is not None:
+        consulta = consulta.where(clave > despues)
+
+    filas = _filas(recurso, campos, consulta)
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = filas[-1][campos[0]]
+    return _json({"datos": filas, "siguiente": siguiente})
+
+
+def _obtener(recurso, id):
+    campos = _campos(recurso)
+    clave = next(iter(CAMPOS[recurso].values()))
+    filas = _filas(recurso, campos, _consulta(recurso, campos).where(clave == id))
+    if not filas:
+        return _json({"error": "No encontrado"}, 404)
+    return _json(filas[0])
+
+
+@api.before_request
+def _autenticado():
+    if not current_user.is_authenticated:
+        return _json({"error": "No autenticado"}, 401)
+
+
+@api.errorhandler(PedidoInvalido)
+def _pedido_invalido(e):
+    return _json({"error": str(e)}, 400)
+
+
+@api.route("/<any(clientes, ventas, pagos, saldos):recurso>")
+@lectura_replica
+def listar(recurso):
+    return _listar(recurso)
+
+
+@api.route("/<any(clientes, ventas, pagos, saldos):recurso>/<int:id>")
+@lectura_replica
+def obtener(recurso, id):
+    return _obtener(recurso, id)
@@ -1,50 +1,100 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash
+from flask import Flask, Blueprint, current_app, render_template, request, redirect, url_for, jsonify, flash, Response, stream_with_context, abort, send_file
 from config import Config
-from models import db, Cliente, Garante, Venta, VentaItem, PagoCliente, Usuario
-from datetime import date, datetime, time
-from sqlalchemy import func, and_, extract
-from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+from forms import safe_float, safe_id
+from models import db, Cliente, Garante, Venta, PagoCliente, Usuario, SaldoCliente, SaldoApertura
+from saldos import (
+    ajustar_saldo, bloquear_saldo, deuda_venta, reconstruir_saldos,
+    recalcular_snapshots, encolar_reparacion, encolar_verificaciones
+)
+from reportes import consultar_morosos, resumen_morosos, consultar_movimientos, TRAMOS
+from caja_diaria import restar_de_caja, restar_cliente_de_caja, reconstruir_caja, consolidar_caja, resumen_caja
+from busqueda import consulta_clientes, buscar_clientes
+from operaciones import OperacionRechazada, validar_items, crear_venta, crear_pago, insertar_items
+from perfilado import init_perfilado
+from migraciones import aplicar_migraciones, crear_tablas, migraciones_pendientes, verificar_planes
+from intercambio import exportar, importar, ENTIDADES, FORMATOS
+from archivo import archivar_clientes, cerrar_periodo, borrar_historial
+from idempotencia import idempotente, guardar_respuesta, nueva_clave, purgar_claves
+from usuarios_cache import cargar_usuario, iniciar_sesion
+from replica import init_replica, lectura_replica
+from api import api
+from estaticos import init_estaticos, construir_assets
+from compresion import init_compresion
+from comprobantes import responder_comprobante, prerenderizar, encolar_prerender, invalidar_comprobantes
+from tareas import tarea, trabajar, reintentar, resumen_tareas, purgar_tareas, PENDIENTE, EN_CURSO, HECHA, FALLIDA
+from estados_cuenta import generar_estados, iniciar_generacion, estado_generacion, ruta_zip, rango_mes
+from fechas import a_local, hoy, inicio_dia
+from datetime import date, datetime
+from sqlalchemy import delete
+from flask_login import LoginManager, logout_user, login_required, current_user
 import json
-import pytz
 import os
+import weakref
+import click
 from dotenv import load_dotenv
 from sqlalchemy.sql import text
+from sqlalchemy.orm import joinedload
 
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-app = Flask(
-    __name__,
-    static_folder=os.path.join(BASE_DIR, "static"),
-    template_folder=os.path.join(BASE_DIR, "templates")
-)
+# Rutas y comandos se registran en la app que arma create_app()
+bp = Blueprint("principal", __name__, cli_group=None)
 
-app.secret_key = 'tu_clave_secreta_aqui'  # Reemplazala por algo más seguro
+# Apps armadas en este proceso, para descartar sus conexiones después de un fork
+_apps = weakref.WeakSet()
 
-app.config.from_object(Config)
 
-# Vincular app con SQLAlchemy
-db.init_app(app)
+def _descartar_conexiones():
+    """En el proceso hijo (gunicorn --preload) no se reusan las conexiones del padre."""
+    for app in list(_apps):
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
 
-# Crear tablas automáticamente (solo en desarrollo)
-with app.app_context():
-    db.create_all()
 
+# Se registra una sola vez por proceso, no en cada create_app (no existe en Windows)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_descartar_conexiones)
 
-# ---------- FUNCIÓN AUXILIAR ----------
-def safe_float(value):
-    """Convierte cadenas vacías o con coma a float o None."""
-    try:
-        if not value or value.strip() == "":
-            return None
-        value = value.replace(",", ".")
-        return float(value)
-    except ValueError:
-        return None
+
+def create_app(config=Config):
+    """
+    Arma la aplicación sin tocar la base: ni conexiones ni create_all.
+
+    Las tablas se crean con `flask esquema` / `flask migrar`. Se puede usar
+    con `gunicorn --preload`: después del fork cada worker descarta las
+    conexiones heredadas del proceso padre.
+    """
+    app = Flask(
+        __name__,
+        static_folder=os.path.join(BASE_DIR, "static"),
+        template_folder=os.path.join(BASE_DIR, "templates")
+    )
+
+    app.secret_key = 'tu_clave_secreta_aqui'  # Reemplazala por algo más seguro
+
+    app.config.from_object(config)
+
+    # Vincular app con SQLAlchemy
+    db.init_app(app)
+    init_perfilado(app)
+    init_replica(app)
+    init_estaticos(app)
+    init_compresion(app)
+    login_manager.init_app(app)
+    app.register_blueprint(bp)
+    app.register_blueprint(api)
+
+    _apps.add(app)
+    return app
+
+
+CLIENTES_POR_PAGINA = 50
 
 
 # ---------- RUTAS CLIENTES ----------
-@app.route("/", methods=["GET", "POST"])
+@bp.route("/", methods=["GET", "POST"])
 @login_required
 def index():
     if request.method == "POST":
@@ -59,6 +109,8 @@ def index():
             monto_autorizado=safe_float(request.form["monto_autorizado"]),
         )
         db.session.add(cliente)
+        db.session.flush()
+        db.session.add(SaldoCliente(cliente_id=cliente.id, saldo=0))
         db.session.commit()
 
         garante = Garante(
@@ -73,13 +125,19 @@ def index():
         )
         db.session.add(garante)
         db.session.commit()
-        return redirect(url_for("index"))
+        return redirect(url_for(".index"))
 
-    clientes = Cliente.query.all()
-    return render_template("index.html", clientes=clientes)
+    q = request.args.get("q", "")
+    clientes = (
+        consulta_clientes(q)
+        .options(joinedload(Cliente.garante))
+        .limit(CLIENTES_POR_PAGINA)
+        .all()
+    )
+    return render_template("index.html", clientes=clientes, q=q, limite=CLIENTES_POR_PAGINA)
 
 
-@app.route("/editar/<int:id>", methods=["GET", "POST"])
+@bp.route("/editar/<int:id>", methods=["GET", "POST"])
 @login_required
 def editar_cliente(id):
     cliente = Cliente.query.get_or_404(id)
@@ -106,74 +164,48 @@ def editar_cliente(id):
             garante.ingresos = safe_float(request.form.get("ingresos_garante", ""))
             garante.lugar_trabajo = request.form["trabajo_garante"]
 
+        invalidar_comprobantes(cliente.id)
         db.session.commit()
-        return redirect(url_for("index"))
+        return redirect(url_for(".index"))
 
     return render_template("editar.html", cliente=cliente, garante=garante)
 
 
-@app.route("/eliminar/<int:id>", methods=["POST"])
+@bp.route("/eliminar/<int:id>", methods=["POST"])
 @login_required
 def eliminar_cliente(id):
     cliente = Cliente.query.get_or_404(id)
 
-    # Primero eliminamos registros relacionados
-    if cliente.garante:
-        db.session.delete(cliente.garante)
-
-    # Eliminar ventas y sus ítems asociados
-    for venta in cliente.ventas:
-        for item in venta.items:
-            db.session.delete(item)
-        db.session.delete(venta)
+    restar_cliente_de_caja(cliente.id)
+    borrar_historial(cliente.id)
 
-    # Eliminar pagos asociados
-    for pago in cliente.pagos:
-        db.session.delete(pago)
-
-    # Finalmente eliminar el cliente
-    db.session.delete(cliente)
+    # Garante, ventas, ítems, pagos y saldos los borra la base (ON DELETE CASCADE)
+    db.session.execute(delete(Cliente).where(Cliente.id == cliente.id))
     db.session.commit()
 
-    return redirect(url_for("index"))
+    return redirect(url_for(".index"))
 
 
 # ---------- RUTAS VENTAS ----------
 # ---------- RUTAS VENTAS ----------
-from sqlalchemy.orm import aliased
 
-@app.route("/ventas")
+@bp.route("/ventas")
 @login_required
 def ventas():
-    saldos = dict(
-        db.session.query(
-            Venta.cliente_id,
-            func.coalesce(
-                func.sum(Venta.total - func.coalesce(Venta.pago_a_cuenta, 0)),
-                0
-            )
-        )
-        .group_by(Venta.cliente_id)
-        .all()
-    )
-
-    clientes = Cliente.query.all()
-
-    for c in clientes:
-        c.saldo_calculado = saldos.get(c.id, 0)
-
+    # El cliente se elige con el buscador (/api/clientes/buscar)
     return render_template(
         "ventas.html",
-        clientes=clientes,
-        fecha_hoy=date.today().strftime("%Y-%m-%d")
+        fecha_hoy=hoy().strftime("%Y-%m-%d"),
+        clave_idempotencia=nueva_clave()
     )
 
 
 
-@app.route("/ventas/guardar", methods=["POST"])
+@bp.route("/ventas/guardar", methods=["POST"])
 @login_required
+@idempotente
 def guardar_venta():
-    cliente_id = request.form.get("cliente_id")
+    cliente_id = request.form.get("cliente_id", type=int)
     metodo_pago = request.form.get("metodo_pago")
 
     try:
@@ -186,207 +218,291 @@ def guardar_venta():
     except json.JSONDecodeError:
         items = []
 
-    total_operacion = sum(item["cantidad"] * item["precio_unitario"] for item in items)
-    saldo_resultante = total_operacion - pago_a_cuenta
-
-    tz_ar = pytz.timezone("America/Argentina/Buenos_Aires")
-    ahora_ar = datetime.now(tz_ar).replace(tzinfo=None)
+    try:
+        items = validar_items(items)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    venta = Venta(
-        cliente_id=cliente_id,
-        total=total_operacion,
-        pago_a_cuenta=pago_a_cuenta,
-        saldo_resultante=saldo_resultante,
-        fecha=ahora_ar,
-        metodo_pago=metodo_pago
-    )
-    db.session.add(venta)
-    db.session.flush()
+    try:
+        venta, filas_items = crear_venta(cliente_id, items, pago_a_cuenta, metodo_pago)
+    except OperacionRechazada as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 409
+
+    insertar_items(filas_items)
+    # El cajero casi siempre abre o comparte el comprobante enseguida
+    encolar_prerender("venta", venta.id)
+    respuesta = guardar_respuesta(jsonify({"redirect_url": url_for('.comprobante', venta_id=venta.id)}))
+    db.session.commit()
+    return respuesta
 
-    for item in items:
-        venta_item = VentaItem(
-            venta_id=venta.id,
-            cantidad=item["cantidad"],
-            descripcion=item["descripcion"],
-            precio_unitario=item["precio_unitario"],
-            total=item["total"]
-        )
-        db.session.add(venta_item)
 
+@bp.route("/api/ventas/lote", methods=["POST"])
+@login_required
+@idempotente
+def guardar_ventas_lote():
+    """
+    Registra varias ventas en una sola transacción (ventas encoladas offline).
+
+    Cuerpo JSON: lista de ventas {cliente_id, items, pago_a_cuenta, metodo_pago,
+    fecha?}. Cada venta va en su propio savepoint: una inválida no frena a las
+    demás. Los ítems de todo el lote se escriben juntos al final.
+    """
+    datos = request.get_json(silent=True)
+    if isinstance(datos, dict):
+        datos = datos.get("ventas")
+    if not isinstance(datos, list):
+        return jsonify({"error": "Se espera una lista de ventas"}), 400
+
+    ids_pedidos = {safe_id(v.get("cliente_id")) for v in datos if isinstance(v, dict)} - {None}
+    clientes_existentes = {
+        cid for (cid,) in db.session.query(Cliente.id).filter(Cliente.id.in_(ids_pedidos))
+    } if ids_pedidos else set()
+
+    # Se bloquean los saldos en orden de id: dos lotes con los mismos clientes
+    # en distinto orden no pueden trabarse entre sí
+    for cliente_id in sorted(clientes_existentes):
+        bloquear_saldo(cliente_id)
+
+    resultados = []
+    filas_items = []
+    clientes_con_fecha = set()
+    for indice, datos_venta in enumerate(datos):
+        try:
+            if not isinstance(datos_venta, dict):
+                raise ValueError("venta inválida")
+            cliente_id = safe_id(datos_venta.get("cliente_id"))
+            if cliente_id not in clientes_existentes:
+                raise ValueError("cliente inexistente")
+            items = validar_items(datos_venta.get("items", []))
+            pago_a_cuenta = float(datos_venta.get("pago_a_cuenta") or 0)
+            fecha = datos_venta.get("fecha")
+            # Sin zona horaria se toma como hora de Buenos Aires
+            fecha = a_local(datetime.fromisoformat(fecha)) if fecha else None
+        except (TypeError, ValueError) as e:
+            resultados.append({"indice": indice, "error": str(e)})
+            continue
+
+        try:
+            with db.session.begin_nested():
+                venta, filas = crear_venta(cliente_id, items, pago_a_cuenta, datos_venta.get("metodo_pago"), fecha=fecha)
+        except OperacionRechazada as e:
+            resultados.append({"indice": indice, "error": str(e)})
+            continue
+
+        filas_items.extend(filas)
+        if fecha:
+            clientes_con_fecha.add(cliente_id)
+        resultados.append({
+            "indice": indice,
+            "id": venta.id,
+            "comprobante": url_for(".comprobante", venta_id=venta.id)
+        })
+
+    insertar_items(filas_items)
+    # Ventas con fecha pasada pueden caer antes de movimientos ya registrados
+    for cliente_id in clientes_con_fecha:
+        recalcular_snapshots(cliente_id)
+    respuesta = guardar_respuesta(jsonify({"resultados": resultados}))
     db.session.commit()
-    return jsonify({"redirect_url": url_for('comprobante', venta_id=venta.id)})
+    return respuesta
 
 
 # ---------- API CLIENTE ----------
-@app.route("/api/cliente/<int:cliente_id>")
+@bp.route("/api/clientes/buscar")
+@login_required
+def api_buscar_clientes():
+    return jsonify(buscar_clientes(request.args.get("q", "")))
+
+
+@bp.route("/api/cliente/<int:cliente_id>")
+@login_required
+@lectura_replica
 def api_cliente(cliente_id):
-    cliente = Cliente.query.get(cliente_id)
+    """Resumen de un cliente con su saldo (la API completa está en /api/v1)."""
+    cliente = db.session.get(Cliente, cliente_id)
     if not cliente:
         return {"error": "Cliente no encontrado"}, 404
 
-    total_deuda = db.session.query(
-        func.coalesce(func.sum(Venta.total - Venta.pago_a_cuenta), 0)
-    ).filter(Venta.cliente_id == cliente_id).scalar()
-
     return {
         "id": cliente.id,
         "nombre": cliente.nombre,
         "monto_autorizado": round(cliente.monto_autorizado or 0, 2),
-        "saldo": round(total_deuda or 0, 2)
+        "saldo": cliente.saldo_deudor
     }
 
 
-# ---------- MOVIMIENTOS ----------
-from sqlalchemy.orm import joinedload
+# ---------- EXPORTAR / IMPORTAR ----------
+@bp.route("/exportar/<entidad>.<formato>")
+@login_required
+def exportar_datos(entidad, formato):
+    if entidad not in ENTIDADES or formato not in FORMATOS:
+        return {"error": "Exportación no disponible"}, 404
+
+    mimetype = "text/csv" if formato == "csv" else "application/x-ndjson"
+    return Response(
+        stream_with_context(exportar(entidad, formato)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={entidad}.{formato}"},
+    )
+
 
-@app.route("/movimientos")
+@bp.route("/importar/<entidad>", methods=["POST"])
 @login_required
-def movimientos():
-    cliente_id = request.args.get("cliente_id")
-    clientes = Cliente.query.all()
-    movimientos = []
+def importar_datos(entidad):
+    archivo = request.files.get("archivo")
+    if entidad not in ENTIDADES or not archivo:
+        return {"error": "Falta el archivo o la entidad no existe"}, 400
 
-    tz_ar = pytz.timezone("America/Argentina/Buenos_Aires")
+    formato = "jsonl" if archivo.filename.lower().endswith((".jsonl", ".ndjson")) else "csv"
+    formato = request.form.get("formato", formato)
+    if formato not in FORMATOS:
+        return {"error": "Formato no soportado"}, 400
 
-    if cliente_id:
-        # 👇 CARGA ITEMS EN LA MISMA QUERY (ELIMINA N+1)
-        ventas = (
-            Venta.query
-            .options(joinedload(Venta.items))
-            .filter_by(cliente_id=cliente_id)
-            .all()
-        )
+    return jsonify(importar(entidad, archivo.stream, formato))
 
-        pagos = PagoCliente.query.filter_by(cliente_id=cliente_id).all()
-
-        for v in ventas:
-            fecha = v.fecha
-            if isinstance(fecha, date) and not isinstance(fecha, datetime):
-                fecha = datetime.combine(fecha, time.min)
-            fecha = tz_ar.localize(fecha) if fecha.tzinfo is None else fecha.astimezone(tz_ar)
-
-            movimientos.append({
-                "id": v.id,
-                "fecha": fecha,
-                "total": v.total,
-                "pago_a_cuenta": v.pago_a_cuenta,
-                "saldo_resultante": v.saldo_resultante,
-                "tipo": "venta",
-                "descripcion": v.descripcion,
-                "items": [
-                    {
-                        "cantidad": item.cantidad,
-                        "descripcion": item.descripcion,
-                        "precio_unitario": item.precio_unitario,
-                        "total": item.total
-                    }
-                    for item in v.items
-                ]
-            })
-
-        for p in pagos:
-            fecha = p.fecha
-            if isinstance(fecha, date) and not isinstance(fecha, datetime):
-                fecha = datetime.combine(fecha, time.min)
-            fecha = tz_ar.localize(fecha) if fecha.tzinfo is None else fecha.astimezone(tz_ar)
-
-            movimientos.append({
-                "id": f"pago-{p.id}",
-                "fecha": fecha,
-                "total": 0,
-                "pago_a_cuenta": p.monto,
-                "saldo_resultante": None,
-                "tipo": "pago",
-                "descripcion": "Pago suelto",
-                "items": []
-            })
-
-        movimientos.sort(key=lambda x: x["fecha"], reverse=True)
+
+# ---------- MOVIMIENTOS ----------
+@bp.route("/movimientos")
+@login_required
+@lectura_replica
+def movimientos():
+    cliente_id = request.args.get("cliente_id")
+    cliente_seleccionado = Cliente.query.get(cliente_id) if cliente_id else None
+    movimientos = []
+    siguiente = None
+
+    # Cursor "fecha_tipo_id" del último movimiento de la página anterior
+    despues = None
+    cursor = request.args.get("despues", "")
+    if cursor.count("_") >= 2:
+        fecha_cursor, tipo_cursor, id_cursor = cursor.rsplit("_", 2)
+        try:
+            despues = (a_local(datetime.fromisoformat(fecha_cursor)), tipo_cursor, int(id_cursor))
+        except ValueError:
+            despues = None
+
+    # Con historial=1 se ven los períodos cerrados (tablas de archivo)
+    historial = request.args.get("historial") == "1"
+    tiene_historial = False
+    if cliente_seleccionado:
+        movimientos, siguiente = consultar_movimientos(cliente_seleccionado.id, despues=despues, historial=historial)
+        tiene_historial = db.session.get(SaldoApertura, cliente_seleccionado.id) is not None
 
     return render_template(
         "movimientos.html",
-        clientes=clientes,
+        cliente_seleccionado=cliente_seleccionado,
         movimientos=movimientos,
-        cliente_id_seleccionado=cliente_id
+        cliente_id_seleccionado=cliente_id,
+        historial=historial,
+        tiene_historial=tiene_historial,
+        siguiente=f"{siguiente[0].isoformat()}_{siguiente[1]}_{siguiente[2]}" if siguiente else None
     )
 
 
 # ---------- PAGOS ----------
-@app.route("/pagos", methods=["GET", "POST"])
+@bp.route("/pagos", methods=["GET", "POST"])
 @login_required
+@idempotente
 def registrar_pago():
-    clientes = Cliente.query.all()
-
     if request.method == "POST":
-        cliente_id = request.form["cliente_id"]
-        monto = float(request.form["monto"])
+        cliente_id = request.form.get("cliente_id", type=int)
+        monto = safe_float(request.form.get("monto"))
         metodo_pago = request.form["metodo_pago"]
 
-        cliente = Cliente.query.get(cliente_id)
-        if cliente:
-            nuevo_pago = PagoCliente(cliente_id=cliente.id, monto=monto, metodo_pago=metodo_pago)
-            db.session.add(nuevo_pago)
-            db.session.commit()
-            return redirect(url_for('pago_exitoso', pago_id=nuevo_pago.id))
+        try:
+            nuevo_pago = crear_pago(cliente_id, monto, metodo_pago)
+        except OperacionRechazada as e:
+            db.session.rollback()
+            return render_template(
+                "pago_cliente.html", error=f"No se registró el pago: {e}", clave_idempotencia=nueva_clave()
+            ), 409
 
-    return render_template("pago_cliente.html", clientes=clientes)
+        encolar_prerender("pago", nuevo_pago.id)
+        respuesta = guardar_respuesta(redirect(url_for('.pago_exitoso', pago_id=nuevo_pago.id)))
+        db.session.commit()
+        return respuesta
+
+    return render_template("pago_cliente.html", clave_idempotencia=nueva_clave())
 
 
-@app.route("/pago-exitoso/<int:pago_id>")
+@bp.route("/pago-exitoso/<int:pago_id>")
 def pago_exitoso(pago_id):
     return render_template("pago_exitoso.html", pago_id=pago_id)
 
 
 # ---------- COMPROBANTES ----------
-@app.route("/comprobante/<int:venta_id>")
-def comprobante(venta_id):
-    venta = Venta.query.get_or_404(venta_id)
-    cliente = Cliente.query.get_or_404(venta.cliente_id)
+def _html_comprobante(venta_id):
+    venta = db.session.get(Venta, venta_id)
+    cliente = db.session.get(Cliente, venta.cliente_id)
+    return render_template("comprobante.html",
+                           venta=venta,
+                           cliente=cliente,
+                           deuda_anterior=venta.saldo_anterior,
+                           deuda_total=venta.saldo_posterior)
 
-    ventas_anteriores = db.session.query(
-        func.coalesce(func.sum(Venta.total - Venta.pago_a_cuenta), 0)
-    ).filter(Venta.cliente_id == cliente.id, Venta.id < venta.id).scalar()
 
-    pagos_anteriores = db.session.query(
-        func.coalesce(func.sum(PagoCliente.monto), 0)
-    ).filter(PagoCliente.cliente_id == cliente.id, PagoCliente.fecha < venta.fecha).scalar()
+def _html_comprobante_pago(pago_id):
+    pago = db.session.get(PagoCliente, pago_id)
+    cliente = db.session.get(Cliente, pago.cliente_id)
+    return render_template("comprobante_pago.html",
+                           pago=pago,
+                           cliente=cliente,
+                           saldo_antes=pago.saldo_anterior,
+                           saldo_actual=pago.saldo_posterior)
 
-    deuda_anterior = round((ventas_anteriores or 0) - (pagos_anteriores or 0), 2)
-    deuda_total = round(deuda_anterior + venta.saldo_resultante, 2)
 
-    return render_template("comprobante.html",
-                           venta=venta,
-                           cliente=cliente,
-                           deuda_anterior=deuda_anterior,
-                           deuda_total=deuda_total)
+@bp.route("/comprobante/<int:venta_id>")
+def comprobante(venta_id):
+    return responder_comprobante("venta", venta_id, lambda: _html_comprobante(venta_id))
 
 
-@app.route("/comprobante-pago/<int:pago_id>")
+@bp.route("/comprobante-pago/<int:pago_id>")
 def comprobante_pago(pago_id):
-    pago = PagoCliente.query.get_or_404(pago_id)
-    cliente = Cliente.query.get_or_404(pago.cliente_id)
+    return responder_comprobante("pago", pago_id, lambda: _html_comprobante_pago(pago_id))
 
-    saldo_antes = cliente.saldo_deudor + pago.monto
-    saldo_actual = cliente.saldo_deudor
 
-    return render_template("comprobante_pago.html",
-                           pago=pago,
-                           cliente=cliente,
-                           saldo_antes=saldo_antes,
-                           saldo_actual=saldo_actual)
+@tarea("prerenderizar_comprobante")
+def prerenderizar_comprobante(tipo, id, host):
+    """Renderiza en el worker el comprobante de una venta o pago recién guardado."""
+    renderizar = {"venta": _html_comprobante, "pago": _html_comprobante_pago}[tipo]
+    with current_app.test_request_context(base_url=host):
+        prerenderizar(tipo, id, lambda: renderizar(id))
 
 
 # ---------- MOROSOS ----------
-@app.route("/morosos")
+@bp.route("/morosos")
+@lectura_replica
 def morosos():
-    clientes = Cliente.query.all()
-    clientes_morosos = [c for c in clientes if c.saldo_deudor > 0]
-    total_deuda = sum(c.saldo_deudor for c in clientes_morosos)
-    return render_template("morosos.html", clientes=clientes_morosos, total_deuda=total_deuda)
+    orden = "asc" if request.args.get("orden") == "asc" else "desc"
+
+    # Cursor "saldo_id" de la última fila de la página anterior
+    despues = None
+    cursor = request.args.get("despues", "")
+    if "_" in cursor:
+        saldo_cursor, id_cursor = cursor.rsplit("_", 1)
+        try:
+            despues = (float(saldo_cursor), int(id_cursor))
+        except ValueError:
+            despues = None
+
+    clientes, siguiente = consultar_morosos(despues=despues, orden=orden)
+    por_tramo = resumen_morosos()
+    total_deuda = sum(t["deuda"] for t in por_tramo.values())
+
+    return render_template(
+        "morosos.html",
+        clientes=clientes,
+        total_deuda=total_deuda,
+        por_tramo=por_tramo,
+        tramos=[etiqueta for etiqueta, _ in TRAMOS],
+        orden=orden,
+        siguiente=f"{siguiente[0]!r}_{siguiente[1]}" if siguiente else None
+    )
 
 
 # ---------- ELIMINAR MOVIMIENTO ----------
-@app.route("/eliminar_movimiento/<tipo>/<int:id>", methods=["POST"])
+@bp.route("/eliminar_movimiento/<tipo>/<int:id>", methods=["POST"])
 @login_required
 def eliminar_movimiento(tipo, id):
     if tipo == "venta":
@@ -397,7 +513,17 @@ def eliminar_movimiento(tipo, id):
         flash("Tipo de movimiento inválido", "danger")
         return redirect(request.referrer)
 
+    if tipo == "venta":
+        delta = -deuda_venta(movimiento)
+    else:
+        delta = movimiento.monto
+
     db.session.delete(movimiento)
+    db.session.flush()
+    ajustar_saldo(movimiento.cliente_id, delta)
+    restar_de_caja(movimiento)
+    # Los snapshots de los movimientos siguientes se corrigen en el worker
+    encolar_reparacion(movimiento)
     db.session.commit()
     flash("Movimiento eliminado correctamente", "success")
     return redirect(request.referrer)
@@ -405,96 +531,130 @@ def eliminar_movimiento(tipo, id):
 
 # ---------- CAJA ----------
 # ---------- CAJA ----------
-@app.route("/caja", methods=["GET", "POST"])
+@bp.route("/caja", methods=["GET", "POST"])
 @login_required
+@lectura_replica
 def caja():
     desde = request.args.get("desde")
     hasta = request.args.get("hasta")
 
-    # =========================
-    # TOTALES GENERALES
-    # =========================
-    ventas_total_q = db.session.query(
-        func.coalesce(func.sum(Venta.total), 0)
-    )
-    pagos_total_q = db.session.query(
-        func.coalesce(func.sum(PagoCliente.monto), 0)
-    )
-    ventas_ingresado_q = db.session.query(
-        func.coalesce(func.sum(Venta.pago_a_cuenta), 0)
-    )
-
+    # Todo sale de caja_diaria en una sola consulta
+    resumen = {"total_ventas": 0.0, "total_ingresado": 0.0, "por_metodo": {}, "por_dia": {}, "por_mes": {}}
     if desde and hasta:
-        ventas_total_q = ventas_total_q.filter(Venta.fecha.between(desde, hasta))
-        pagos_total_q = pagos_total_q.filter(PagoCliente.fecha.between(desde, hasta))
-        ventas_ingresado_q = ventas_ingresado_q.filter(Venta.fecha.between(desde, hasta))
-
-    total_ventas = float(ventas_total_q.scalar() or 0)
-    total_ingresado = float(ventas_ingresado_q.scalar() or 0) + float(pagos_total_q.scalar() or 0)
-
-    # =========================
-    # TOTALES POR MÉTODO DE PAGO
-    # =========================
-    ventas_por_metodo_q = (
-        db.session.query(
-            Venta.metodo_pago,
-            func.coalesce(func.sum(Venta.pago_a_cuenta), 0)
-        )
-        .filter(Venta.pago_a_cuenta.isnot(None))
-    )
+        try:
+            resumen = resumen_caja(date.fromisoformat(desde), date.fromisoformat(hasta))
+        except ValueError:
+            flash("Rango de fechas inválido", "danger")
+    else:
+        resumen = resumen_caja()
 
-    pagos_por_metodo_q = (
-        db.session.query(
-            PagoCliente.metodo_pago,
-            func.coalesce(func.sum(PagoCliente.monto), 0)
-        )
+    return render_template(
+        "caja.html",
+        total_ventas=resumen["total_ventas"],
+        total_ingresado=resumen["total_ingresado"],
+        totales_por_metodo=resumen["por_metodo"],
+        por_dia=resumen["por_dia"],
+        por_mes=resumen["por_mes"],
+        desde=desde,
+        hasta=hasta
     )
 
-    if desde and hasta:
-        ventas_por_metodo_q = ventas_por_metodo_q.filter(Venta.fecha.between(desde, hasta))
-        pagos_por_metodo_q = pagos_por_metodo_q.filter(PagoCliente.fecha.between(desde, hasta))
 
-    ventas_por_metodo = ventas_por_metodo_q.group_by(Venta.metodo_pago).all()
-    pagos_por_metodo = pagos_por_metodo_q.group_by(PagoCliente.metodo_pago).all()
+# ---------- ESTADOS DE CUENTA ----------
+def _mes_pedido():
+    mes = request.values.get("mes", "")
+    try:
+        rango_mes(mes)
+    except ValueError as e:
+        abort(400, str(e))
+    return mes
 
-    # =========================
-    # UNIFICAR RESULTADOS
-    # =========================
-    totales_por_metodo = {}
 
-    for metodo, total in ventas_por_metodo:
-        if metodo:
-            totales_por_metodo[metodo] = totales_por_metodo.get(metodo, 0) + float(total or 0)
+@bp.route("/estados-cuenta", methods=["GET", "POST"])
+@login_required
+def estados_cuenta():
+    # POST mes=AAAA-MM encola la generación; GET ?mes= informa el progreso
+    if current_user.role != "admin":
+        abort(403)
+    mes = _mes_pedido()
+    if request.method == "POST":
+        iniciar_generacion(mes)
+        db.session.commit()
+        return redirect(url_for(".estados_cuenta", mes=mes), code=303)
 
-    for metodo, total in pagos_por_metodo:
-        if metodo:
-            totales_por_metodo[metodo] = totales_por_metodo.get(metodo, 0) + float(total or 0)
+    estado = estado_generacion(mes)
+    if estado is None:
+        return jsonify({"estado": "sin generar"}), 404
+    if estado["estado"] == "listo":
+        estado["descarga"] = url_for(".descargar_estados_cuenta", mes=mes)
+    return jsonify(estado)
 
-    return render_template(
-        "caja.html",
-        total_ventas=total_ventas,
-        total_ingresado=total_ingresado,
-        totales_por_metodo=totales_por_metodo,
-        desde=desde,
-        hasta=hasta
-    )
+
+@bp.route("/estados-cuenta/descargar")
+@login_required
+def descargar_estados_cuenta():
+    if current_user.role != "admin":
+        abort(403)
+    mes = _mes_pedido()
+    estado = estado_generacion(mes)
+    if not estado or estado["estado"] != "listo":
+        abort(404)
+    return send_file(ruta_zip(mes), mimetype="application/zip", as_attachment=True, download_name=f"estados-{mes}.zip")
+
+
+# ---------- TAREAS ----------
+@bp.route("/tareas")
+@login_required
+def tareas():
+    if current_user.role != "admin":
+        abort(403)
+    return render_template("tareas.html", estados=[PENDIENTE, EN_CURSO, HECHA, FALLIDA], **resumen_tareas())
 
 
+@bp.route("/tareas/<int:tarea_id>/reintentar", methods=["POST"])
+@login_required
+def reintentar_tarea(tarea_id):
+    if current_user.role != "admin":
+        abort(403)
+    reintentar(tarea_id)
+    db.session.commit()
+    return redirect(url_for(".tareas"))
+
+
+# ---------- SALUD ----------
+@bp.route("/healthz")
+def healthz():
+    # Vivo: el proceso responde (no toca la base)
+    return {"estado": "ok"}
+
+
+@bp.route("/readyz")
+def readyz():
+    # Listo para recibir tráfico: la base responde y el esquema está al día
+    try:
+        db.session.execute(text("SELECT 1"))
+        pendientes = len(migraciones_pendientes())
+    except Exception as e:
+        db.session.rollback()
+        return {"estado": "sin base", "error": str(e)}, 503
+    if pendientes:
+        return {"estado": "migraciones pendientes", "pendientes": pendientes}, 503
+    return {"estado": "listo"}
+
 
 # ---------- LOGIN ----------
 login_manager = LoginManager()
 login_manager.login_message = "Por favor, iniciá sesión para continuar."
 login_manager.login_message_category = "warning"
-login_manager.init_app(app)
-login_manager.login_view = "login"
+login_manager.login_view = "principal.login"
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return Usuario.query.get(int(user_id))
+    return cargar_usuario(user_id)
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form['username']
@@ -502,31 +662,192 @@ def login():
         user = Usuario.query.filter_by(username=username).first()
 
         if user and user.check_password(password):
-            login_user(user)
+            iniciar_sesion(user)
             flash('Inicio de sesión exitoso', 'success')
-            return redirect(url_for('index'))
+            return redirect(url_for('.index'))
         else:
             flash('Usuario o contraseña incorrectos', 'danger')
 
     return render_template('login.html')
 
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
     flash('Has cerrado sesión', 'info')
-    return redirect(url_for('login'))
+    return redirect(url_for('.login'))
+
+
+# ---------- COMANDOS ----------
+@bp.cli.command("saldos")
+@click.option("--verificar", is_flag=True, help="Solo informa diferencias, no corrige.")
+@click.option("--snapshots", is_flag=True, help="Además reescribe el saldo antes/después de cada movimiento.")
+def saldos_command(verificar, snapshots):
+    """Recalcula el saldo persistido de cada cliente desde ventas y pagos."""
+    if snapshots and not verificar:
+        for (cliente_id,) in db.session.query(Cliente.id):
+            recalcular_snapshots(cliente_id)
+        db.session.commit()
+
+    diferencias = reconstruir_saldos(solo_verificar=verificar)
+    for cliente_id, guardado, calculado in diferencias:
+        click.echo(f"cliente {cliente_id}: guardado={guardado} calculado={calculado}")
+    accion = "encontradas" if verificar else "corregidas"
+    click.echo(f"{len(diferencias)} diferencias {accion}")
+    if verificar and diferencias:
+        raise SystemExit(1)
+
+
+@bp.cli.command("verificar-saldos")
+@click.option("--muestra", default=100, show_default=True, help="Clientes al azar a verificar.")
+def verificar_saldos_command(muestra):
+    """Encola la verificación del saldo de una muestra de clientes (para un cron)."""
+    ids = encolar_verificaciones(muestra)
+    click.echo(f"{len(ids)} verificaciones encoladas")
+
+
+@bp.cli.command("esquema")
+def esquema_command():
+    """Crea las tablas que falten (no modifica las existentes)."""
+    crear_tablas()
+    click.echo("Tablas creadas")
+
+
+@bp.cli.command("migrar")
+@click.option("--listar", is_flag=True, help="Solo muestra las migraciones pendientes.")
+def migrar_command(listar):
+    """Crea las tablas que falten y aplica las migraciones de esquema pendientes."""
+    if listar:
+        for version, descripcion, _ in migraciones_pendientes():
+            click.echo(f"{version}: {descripcion}")
+        return
+    aplicadas = aplicar_migraciones(log=click.echo)
+    click.echo(f"{aplicadas} migraciones aplicadas")
+
+
+@bp.cli.command("planes")
+def planes_command():
+    """Falla si alguna consulta crítica recorre una tabla entera."""
+    problemas = verificar_planes()
+    for nombre, plan in problemas.items():
+        click.echo(f"{nombre}:")
+        for linea in plan:
+            click.echo(f"    {linea}")
+    if problemas:
+        raise SystemExit(1)
+    click.echo("Todas las consultas críticas usan índices")
+
+
+@bp.cli.command("generar-datos")
+@click.option("--clientes", default=1000, show_default=True)
+@click.option("--ventas-por-cliente", default=50, show_default=True)
+@click.option("--pagos-por-cliente", default=30, show_default=True)
+@click.option("--semilla", default=1, show_default=True)
+def generar_datos_command(clientes, ventas_por_cliente, pagos_por_cliente, semilla):
+    """Carga datos sintéticos reproducibles (para benchmarks, nunca en producción)."""
+    from datos_prueba import generar_datos
+    generar_datos(
+        clientes=clientes,
+        ventas_por_cliente=ventas_por_cliente,
+        pagos_por_cliente=pagos_por_cliente,
+        semilla=semilla,
+        log=click.echo
+    )
+
+
+@bp.cli.command("caja")
+def caja_command():
+    """Regenera la tabla caja_diaria desde ventas y pagos."""
+    filas = reconstruir_caja()
+    click.echo(f"caja_diaria reconstruida: {filas} filas")
+
+
+@bp.cli.command("consolidar-caja")
+def consolidar_caja_command():
+    """Pasa a caja_diaria los aportes pendientes de caja_movimientos (lo mismo que hace el worker)."""
+    aportes = consolidar_caja()
+    db.session.commit()
+    click.echo(f"{aportes} aportes consolidados")
+
+
+@bp.cli.command("archivar-clientes")
+@click.option("--meses", default=24, show_default=True, help="Meses sin movimientos para considerar inactivo.")
+@click.option("--lote", default=500, show_default=True, help="Clientes por transacción.")
+@click.option("--simular", is_flag=True, help="Solo cuenta los clientes que se archivarían.")
+def archivar_clientes_command(meses, lote, simular):
+    """Mueve los clientes inactivos con saldo cancelado a las tablas de archivo."""
+    total = archivar_clientes(meses=meses, lote=lote, simular=simular, log=click.echo)
+    if not simular:
+        click.echo(f"{total} clientes archivados")
+
+
+@bp.cli.command("cerrar-periodo")
+@click.option("--hasta", help="Primer día del período nuevo (AAAA-MM-DD). Por defecto, el 1 de enero de este año.")
+@click.option("--lote", default=500, show_default=True, help="Clientes por transacción.")
+def cerrar_periodo_command(hasta, lote):
+    """Archiva ventas y pagos anteriores a --hasta y guarda el saldo de apertura de cada cliente."""
+    hasta = inicio_dia(date.fromisoformat(hasta) if hasta else date(hoy().year, 1, 1))
+    try:
+        total = cerrar_periodo(hasta, lote=lote, log=click.echo)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Período cerrado: {total} movimientos archivados")
+
+
+@bp.cli.command("assets")
+@click.option("--sin-tailwind", is_flag=True, help="No recompila static/tailwind.css.")
+@click.option("--sin-lucide", is_flag=True, help="No descarga static/lucide.min.js.")
+def assets_command(sin_tailwind, sin_lucide):
+    """Genera los assets locales (Tailwind compilado y lucide) y sus versiones .gz/.br."""
+    construir_assets(tailwind=not sin_tailwind, lucide=not sin_lucide, log=click.echo)
+
+
+@bp.cli.command("estados-cuenta")
+@click.option("--mes", required=True, help="Mes a generar (AAAA-MM).")
+@click.option("--salida", help="Carpeta o archivo .zip. Por defecto, estados-AAAA-MM.zip.")
+@click.option("--procesos", type=int, help="Procesos para renderizar. Por defecto, uno por CPU.")
+def estados_cuenta_command(mes, salida, procesos):
+    """Genera los estados de cuenta del mes de todos los clientes con movimientos."""
+    def progreso(hechos, total):
+        click.echo(f"{hechos}/{total} estados")
+
+    try:
+        total = generar_estados(mes, salida or f"estados-{mes}.zip", procesos=procesos, progreso=progreso)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"{total} estados de cuenta generados")
+
+
+@bp.cli.command("worker")
+@click.option("--espera", default=1.0, show_default=True, help="Segundos entre consultas con la cola vacía.")
+@click.option("--una-vez", is_flag=True, help="Sale cuando no quedan tareas disponibles.")
+def worker_command(espera, una_vez):
+    """Ejecuta las tareas en segundo plano (snapshots, verificación de saldos, estados de cuenta)."""
+    ejecutadas = trabajar(espera=espera, una_vez=una_vez, log=click.echo)
+    click.echo(f"{ejecutadas} tareas ejecutadas")
+
+
+@bp.cli.command("purgar-tareas")
+def purgar_tareas_command():
+    """Borra las tareas hechas hace más de TAREAS_RETENER_DIAS días."""
+    click.echo(f"{purgar_tareas()} tareas borradas")
+
+
+@bp.cli.command("purgar-claves")
+def purgar_claves_command():
+    """Borra las Idempotency-Key vencidas (IDEMPOTENCIA_TTL_HORAS)."""
+    click.echo(f"{purgar_claves()} claves borradas")
 
 
 # ---------- MAIN ----------
 # if __name__ == "__main__":
 #     load_dotenv()
-#     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
+#     create_app().run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
 if __name__ == "__main__":
     from waitress import serve
     load_dotenv()
-    serve(app, host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
+    serve(create_app(), host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
 
 
 
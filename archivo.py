@@ -0,0 +1,187 @@
+from datetime import timedelta
+from sqlalchemy import select, insert, delete, func, or_, and_
+from models import (
+    db, Cliente, Garante, Venta, VentaItem, PagoCliente, SaldoCliente, SaldoApertura, CierrePeriodo,
+    ClienteArchivo, GaranteArchivo, VentaArchivo, VentaItemArchivo, PagoClienteArchivo
+)
+from saldos import DEUDA_VENTA
+from reportes import primeras_impagas
+from fechas import ahora
+
+
+# Clientes que se mueven por transacción
+ARCHIVO_LOTE = 500
+
+# Por debajo de esto el saldo se considera cancelado
+SALDO_CERO = 0.005
+
+
+def _clientes_inactivos(desde, limite):
+    """
+    Ids de clientes con saldo cancelado, algún movimiento y ninguno desde `desde`.
+
+    Se exige al menos un movimiento para no archivar clientes recién dados de
+    alta que todavía no compraron (cliente no guarda fecha de alta).
+    """
+    venta_reciente = select(Venta.id).where(Venta.cliente_id == Cliente.id, Venta.fecha >= desde).exists()
+    pago_reciente = select(PagoCliente.id).where(PagoCliente.cliente_id == Cliente.id, PagoCliente.fecha >= desde).exists()
+    con_ventas = select(Venta.id).where(Venta.cliente_id == Cliente.id).exists()
+    con_pagos = select(PagoCliente.id).where(PagoCliente.cliente_id == Cliente.id).exists()
+    # Movimientos de períodos cerrados: ya están en el archivo
+    con_cierre = select(SaldoApertura.cliente_id).where(SaldoApertura.cliente_id == Cliente.id).exists()
+    venta_cerrada_reciente = select(VentaArchivo.c.id).where(
+        VentaArchivo.c.cliente_id == Cliente.id, VentaArchivo.c.fecha >= desde).exists()
+    pago_cerrado_reciente = select(PagoClienteArchivo.c.id).where(
+        PagoClienteArchivo.c.cliente_id == Cliente.id, PagoClienteArchivo.c.fecha >= desde).exists()
+
+    return [
+        cid for (cid,) in db.session.query(Cliente.id)
+        .outerjoin(SaldoCliente, SaldoCliente.cliente_id == Cliente.id)
+        .filter(
+            func.abs(func.coalesce(SaldoCliente.saldo, 0)) < SALDO_CERO,
+            or_(con_ventas, con_pagos, con_cierre),
+            ~venta_reciente,
+            ~pago_reciente,
+            ~venta_cerrada_reciente,
+            ~pago_cerrado_reciente,
+        )
+        .order_by(Cliente.id)
+        .limit(limite)
+    ]
+
+
+def _copiar(archivo, modelo, filtro):
+    columnas = list(modelo.__table__.columns)
+    db.session.execute(
+        insert(archivo).from_select([c.name for c in columnas], select(*columnas).where(filtro))
+    )
+
+
+def _mover(ids):
+    """Copia los clientes `ids` y toda su historia al archivo y los borra (sin commit)."""
+    ventas = select(Venta.id).where(Venta.cliente_id.in_(ids))
+    _copiar(ClienteArchivo, Cliente, Cliente.id.in_(ids))
+    _copiar(GaranteArchivo, Garante, Garante.cliente_id.in_(ids))
+    _copiar(VentaArchivo, Venta, Venta.cliente_id.in_(ids))
+    _copiar(VentaItemArchivo, VentaItem, VentaItem.venta_id.in_(ventas))
+    _copiar(PagoClienteArchivo, PagoCliente, PagoCliente.cliente_id.in_(ids))
+
+    # Garante, ventas, ítems, pagos y saldo caen por ON DELETE CASCADE
+    db.session.execute(delete(Cliente).where(Cliente.id.in_(ids)))
+
+
+def archivar_clientes(meses=24, lote=ARCHIVO_LOTE, simular=False, log=print):
+    """
+    Mueve a las tablas *_archivo los clientes sin movimientos en los últimos
+    `meses` y con saldo cancelado, de a `lote` clientes por transacción.
+
+    caja_diaria no se toca: los movimientos archivados siguen contando en la
+    caja de su día. Devuelve cuántos clientes se archivaron (o se archivarían).
+    """
+    desde = ahora() - timedelta(days=30 * meses)
+
+    if simular:
+        total = len(_clientes_inactivos(desde, None))
+        log(f"{total} clientes para archivar")
+        return total
+
+    total = 0
+    while True:
+        ids = _clientes_inactivos(desde, lote)
+        if not ids:
+            break
+        _mover(ids)
+        db.session.commit()
+        total += len(ids)
+        log(f"{total} clientes archivados")
+    return total
+
+
+# ---------- CIERRE DE PERÍODO ----------
+# Ventas y pagos de los períodos cerrados van a las tablas *_archivo (las de
+# los clientes archivados) y cada cliente queda con una fila en
+# saldo_apertura. Los cálculos de saldo leen esa fila más el período vigente.
+
+def inicio_periodo():
+    """Fecha en que empieza el período vigente (None si nunca se cerró uno)."""
+    return db.session.query(func.max(CierrePeriodo.hasta)).scalar()
+
+
+def _sumas_por_cliente(columna, modelo, hasta):
+    return dict(
+        db.session.query(modelo.cliente_id, func.sum(columna))
+        .filter(modelo.fecha < hasta)
+        .group_by(modelo.cliente_id)
+        .all()
+    )
+
+
+def _cerrar_clientes(ids, hasta, ventas, pagos, impagas):
+    """Actualiza la apertura de los clientes `ids` y archiva sus movimientos anteriores a `hasta` (sin commit)."""
+    aperturas = {a.cliente_id: a for a in SaldoApertura.query.filter(SaldoApertura.cliente_id.in_(ids))}
+    for cid in ids:
+        apertura = aperturas.get(cid) or SaldoApertura(cliente_id=cid, saldo=0)
+        apertura.saldo = round((apertura.saldo or 0) + float(ventas.get(cid) or 0) - float(pagos.get(cid) or 0), 2)
+        apertura.desde = hasta
+        apertura.primera_impaga = impagas.get(cid)
+        db.session.add(apertura)
+
+    filtro_ventas = and_(Venta.cliente_id.in_(ids), Venta.fecha < hasta)
+    filtro_pagos = and_(PagoCliente.cliente_id.in_(ids), PagoCliente.fecha < hasta)
+    _copiar(VentaArchivo, Venta, filtro_ventas)
+    _copiar(VentaItemArchivo, VentaItem, VentaItem.venta_id.in_(select(Venta.id).where(filtro_ventas)))
+    _copiar(PagoClienteArchivo, PagoCliente, filtro_pagos)
+
+    # Los ítems caen por ON DELETE CASCADE
+    movidos = db.session.execute(delete(Venta).where(filtro_ventas)).rowcount
+    movidos += db.session.execute(delete(PagoCliente).where(filtro_pagos)).rowcount
+    return movidos
+
+
+def cerrar_periodo(hasta, lote=ARCHIVO_LOTE, log=print):
+    """
+    Cierra el período que termina en `hasta` (sin incluirlo): las ventas y
+    pagos anteriores pasan a las tablas *_archivo y el saldo de apertura de
+    cada cliente los reemplaza, de a `lote` clientes por transacción.
+
+    El saldo de cada cliente y la caja no cambian. Si se corta se puede volver
+    a correr con el mismo `hasta`. Devuelve cuántos movimientos archivó.
+    """
+    if hasta > ahora():
+        raise ValueError("No se puede cerrar un período que todavía no terminó")
+    cierre = db.session.get(CierrePeriodo, hasta)
+    vigente = inicio_periodo()
+    if cierre is None and vigente is not None and hasta <= vigente:
+        raise ValueError(f"Ya está cerrado el período hasta {vigente:%Y-%m-%d}")
+
+    # Desde acá las ventas con fecha anterior a `hasta` se rechazan (ver operaciones.py)
+    if cierre is None:
+        cierre = CierrePeriodo(hasta=hasta, movimientos=0)
+        db.session.add(cierre)
+        db.session.commit()
+
+    ventas = _sumas_por_cliente(DEUDA_VENTA, Venta, hasta)
+    pagos = _sumas_por_cliente(PagoCliente.monto, PagoCliente, hasta)
+    impagas = primeras_impagas(hasta)
+    ids = sorted(set(ventas) | set(pagos))
+    log(f"{len(ids)} clientes con movimientos anteriores a {hasta:%Y-%m-%d}")
+
+    total = 0
+    for inicio in range(0, len(ids), lote):
+        movidos = _cerrar_clientes(ids[inicio:inicio + lote], hasta, ventas, pagos, impagas)
+        cierre.movimientos = (cierre.movimientos or 0) + movidos
+        db.session.commit()
+        total += movidos
+        log(f"{min(inicio + lote, len(ids))}/{len(ids)} clientes, {total} movimientos archivados")
+
+    cierre.terminado = ahora()
+    db.session.commit()
+    return total
+
+
+def borrar_historial(cliente_id):
+    """Borra del archivo los movimientos de períodos cerrados de un cliente que se elimina (sin commit)."""
+    ventas = select(VentaArchivo.c.id).where(VentaArchivo.c.cliente_id == cliente_id)
+    db.session.execute(delete(VentaItemArchivo).where(VentaItemArchivo.c.venta_id.in_(ventas)))
+    db.session.execute(delete(VentaArchivo).where(VentaArchivo.c.cliente_id == cliente_id))
+    db.session.execute(delete(PagoClienteArchivo).where(PagoClienteArchivo.c.cliente_id == cliente_id))
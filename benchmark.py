@@ -0,0 +1,234 @@
+"""
+Benchmark de las rutas principales sobre datos sintéticos.
+
+    python benchmark.py --db sqlite:///bench.db --clientes 2000 --salida antes.json
+    python benchmark.py --db sqlite:///bench.db --no-generar --comparar antes.json --salida despues.json
+    python benchmark.py --db postgresql://... --gunicorn --workers 4
+
+Por defecto usa el cliente de pruebas de Flask en el mismo proceso. Con
+--gunicorn levanta un gunicorn local y le pega por HTTP (la memoria no se mide
+en ese modo). Las consultas por request salen del header Server-Timing, así
+que se fuerza PERFILADO=1.
+
+Además guarda en "escaneos_completos" las consultas críticas (ver
+migraciones.verificar_planes) que recorren una tabla entera: los reportes por
+rango de fechas tienen que resolverse con el índice de fecha.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import urllib.parse
+import urllib.request
+from datetime import date, timedelta
+from http.cookiejar import CookieJar
+
+
+USUARIO = ("benchmark", "benchmark")
+
+
+def _argumentos():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--db", default="sqlite:///benchmark.db", help="DATABASE_URL a usar")
+    p.add_argument("--clientes", type=int, default=1000)
+    p.add_argument("--ventas-por-cliente", type=int, default=50)
+    p.add_argument("--pagos-por-cliente", type=int, default=30)
+    p.add_argument("--semilla", type=int, default=1)
+    p.add_argument("--no-generar", action="store_true", help="Usa los datos que ya están en la base")
+    p.add_argument("--repeticiones", type=int, default=30)
+    p.add_argument("--gunicorn", action="store_true", help="Mide contra un gunicorn local")
+    p.add_argument("--workers", type=int, default=2)
+    p.add_argument("--puerto", type=int, default=8765)
+    p.add_argument("--salida", help="Archivo JSON con los resultados")
+    p.add_argument("--comparar", help="JSON de una corrida anterior para mostrar diferencias")
+    return p.parse_args()
+
+
+def _percentil(valores, q):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(q * len(ordenados)))]
+
+
+def _consultas(server_timing):
+    m = re.search(r'desc="(\d+) consultas"', server_timing or "")
+    return int(m.group(1)) if m else None
+
+
+class ClienteFlask:
+    def __init__(self, app):
+        self.cliente = app.test_client()
+
+    def pedir(self, metodo, url, datos=None):
+        r = self.cliente.open(url, method=metodo, data=datos)
+        return r.status_code, r.headers.get("Server-Timing")
+
+
+class ClienteHTTP:
+    def __init__(self, base):
+        self.base = base
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+    def pedir(self, metodo, url, datos=None):
+        cuerpo = urllib.parse.urlencode(datos).encode() if datos else None
+        pedido = urllib.request.Request(self.base + url, data=cuerpo, method=metodo)
+        try:
+            with self.opener.open(pedido) as r:
+                r.read()
+                return r.status, r.headers.get("Server-Timing")
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get("Server-Timing")
+
+
+def _rutas(rnd, ids_clientes, ids_ventas):
+    """(nombre, función que arma (método, url, datos)) de cada ruta medida."""
+    hoy = date.today()
+    items = json.dumps([{"cantidad": 1, "descripcion": "Benchmark", "precio_unitario": 1000.0, "total": 1000.0}])
+    return [
+        ("GET /", lambda: ("GET", "/", None)),
+        ("GET /ventas", lambda: ("GET", "/ventas", None)),
+        ("GET /movimientos", lambda: ("GET", f"/movimientos?cliente_id={rnd.choice(ids_clientes)}", None)),
+        ("GET /morosos", lambda: ("GET", "/morosos", None)),
+        ("GET /caja (30 días)", lambda: ("GET", f"/caja?desde={hoy - timedelta(days=30)}&hasta={hoy}", None)),
+        ("GET /caja (1 año)", lambda: ("GET", f"/caja?desde={hoy - timedelta(days=365)}&hasta={hoy}", None)),
+        ("GET /api/v1/ventas (7 días)", lambda: ("GET", f"/api/v1/ventas?desde={hoy - timedelta(days=7)}&hasta={hoy}&limite=500", None)),
+        ("GET /api/v1/pagos (7 días)", lambda: ("GET", f"/api/v1/pagos?desde={hoy - timedelta(days=7)}&hasta={hoy}&limite=500", None)),
+        ("GET /comprobante", lambda: ("GET", f"/comprobante/{rnd.choice(ids_ventas)}", None)),
+        ("POST /ventas/guardar", lambda: ("POST", "/ventas/guardar", {
+            "cliente_id": rnd.choice(ids_clientes), "metodo_pago": "efectivo",
+            "pago_a_cuenta": "0", "items_json": items,
+        })),
+        ("POST /pagos", lambda: ("POST", "/pagos", {
+            "cliente_id": rnd.choice(ids_clientes), "monto": "500", "metodo_pago": "efectivo",
+        })),
+    ]
+
+
+def _medir(cliente, rutas, repeticiones, medir_memoria):
+    resultados = {}
+    for nombre, armar in rutas:
+        tiempos, consultas, errores = [], [], 0
+        if medir_memoria:
+            tracemalloc.start()
+        for _ in range(repeticiones):
+            metodo, url, datos = armar()
+            inicio = time.perf_counter()
+            estado, server_timing = cliente.pedir(metodo, url, datos)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+            if estado >= 400:
+                errores += 1
+            n = _consultas(server_timing)
+            if n is not None:
+                consultas.append(n)
+        pico = None
+        if medir_memoria:
+            pico = tracemalloc.get_traced_memory()[1] // 1024
+            tracemalloc.stop()
+
+        resultados[nombre] = {
+            "p50_ms": round(_percentil(tiempos, 0.5), 2),
+            "p90_ms": round(_percentil(tiempos, 0.9), 2),
+            "p99_ms": round(_percentil(tiempos, 0.99), 2),
+            "media_ms": round(statistics.mean(tiempos), 2),
+            "consultas": statistics.median(consultas) if consultas else None,
+            "memoria_pico_kb": pico,
+            "errores": errores,
+        }
+        print(f"{nombre:<24} p50={resultados[nombre]['p50_ms']:>8} ms  p99={resultados[nombre]['p99_ms']:>8} ms  "
+              f"consultas={resultados[nombre]['consultas']}  memoria={pico} KB  errores={errores}")
+    return resultados
+
+
+def _comparar(actual, archivo):
+    with open(archivo) as f:
+        previo = json.load(f)["rutas"]
+    print(f"\nComparación con {archivo} (p50):")
+    for nombre, r in actual.items():
+        if nombre in previo:
+            antes, ahora = previo[nombre]["p50_ms"], r["p50_ms"]
+            cambio = (ahora - antes) / antes * 100 if antes else 0
+            print(f"{nombre:<24} {antes:>8} ms -> {ahora:>8} ms ({cambio:+.0f}%)")
+
+
+def main():
+    args = _argumentos()
+    os.environ["DATABASE_URL"] = args.db
+    os.environ["PERFILADO"] = "1"
+    os.environ.setdefault("PERFILADO_LENTA_MS", "100000")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+
+    from app import create_app
+    from migraciones import aplicar_migraciones, verificar_planes
+    from models import db, Cliente, Venta
+    from datos_prueba import generar_datos, asegurar_usuario
+
+    app = create_app()
+    with app.app_context():
+        aplicar_migraciones(log=lambda *a: None)
+        datos = None
+        if not args.no_generar:
+            datos = generar_datos(
+                clientes=args.clientes,
+                ventas_por_cliente=args.ventas_por_cliente,
+                pagos_por_cliente=args.pagos_por_cliente,
+                semilla=args.semilla,
+            )
+        asegurar_usuario(*USUARIO)
+        ids_clientes = [i for (i,) in db.session.query(Cliente.id)]
+        ids_ventas = [i for (i,) in db.session.query(Venta.id)]
+        dialecto = db.engine.dialect.name
+        escaneos = verificar_planes()
+    for nombre, plan in escaneos.items():
+        print(f"Escaneo completo en '{nombre}': {'; '.join(plan)}")
+
+    gunicorn = None
+    if args.gunicorn:
+        gunicorn = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "app:create_app()", "-w", str(args.workers), "-b", f"127.0.0.1:{args.puerto}"],
+            env=os.environ.copy(),
+        )
+        time.sleep(3)
+        cliente = ClienteHTTP(f"http://127.0.0.1:{args.puerto}")
+    else:
+        cliente = ClienteFlask(app)
+
+    try:
+        cliente.pedir("POST", "/login", {"username": USUARIO[0], "password": USUARIO[1]})
+        rnd = random.Random(args.semilla)
+        rutas = _medir(cliente, _rutas(rnd, ids_clientes, ids_ventas), args.repeticiones, not args.gunicorn)
+    finally:
+        if gunicorn:
+            gunicorn.terminate()
+            gunicorn.wait()
+
+    resultado = {
+        "meta": {
+            "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "base": dialecto,
+            "modo": "gunicorn" if args.gunicorn else "flask",
+            "repeticiones": args.repeticiones,
+            "datos_generados": datos,
+            "clientes": len(ids_clientes),
+            "ventas": len(ids_ventas),
+        },
+        "rutas": rutas,
+        "escaneos_completos": escaneos,
+    }
+
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados en {args.salida}")
+    if args.comparar:
+        _comparar(rutas, args.comparar)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+from sqlalchemy import or_, case
+from models import db, Cliente
+
+
+BUSQUEDA_LIMITE = 20
+
+
+def _escapar_like(valor):
+    return valor.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def consulta_clientes(q):
+    """
+    Clientes cuyo nombre o documento coinciden con `q`.
+
+    En Postgres se busca por substring con ILIKE (lo resuelven los índices
+    trigram). En SQLite se busca por prefijo con LIKE, que usa los índices
+    NOCASE. Sin `q` se devuelven los clientes más recientes.
+    """
+    q = (q or "").strip()
+    consulta = Cliente.query
+
+    if not q:
+        return consulta.order_by(Cliente.id.desc())
+
+    prefijo = _escapar_like(q) + "%"
+
+    if db.engine.dialect.name == "postgresql":
+        patron = "%" + _escapar_like(q) + "%"
+        consulta = consulta.filter(or_(
+            Cliente.nombre.ilike(patron, escape="\\"),
+            Cliente.documento.ilike(patron, escape="\\"),
+        ))
+        # Primero los que empiezan con lo buscado
+        return consulta.order_by(
+            case((Cliente.nombre.ilike(prefijo, escape="\\"), 0), else_=1),
+            Cliente.nombre,
+        )
+
+    consulta = consulta.filter(or_(
+        Cliente.nombre.like(prefijo, escape="\\"),
+        Cliente.documento.like(prefijo, escape="\\"),
+    ))
+    return consulta.order_by(Cliente.nombre)
+
+
+def buscar_clientes(q, limite=BUSQUEDA_LIMITE):
+    """Resultado acotado y compacto para el buscador de clientes."""
+    if not (q or "").strip():
+        return []
+
+    return [
+        {
+            "id": c.id,
+            "nombre": c.nombre,
+            "documento": c.documento,
+            "monto_autorizado": round(c.monto_autorizado or 0, 2),
+            "saldo": c.saldo_deudor,
+        }
+        for c in consulta_clientes(q).limit(limite)
+    ]
+
@@ -0,0 +1,249 @@
+from datetime import date, datetime
+from itertools import chain
+from sqlalchemy import func, delete, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Venta, PagoCliente, CajaDiaria, CajaMovimiento, VentaArchivo, PagoClienteArchivo
+from fechas import a_local, dia_local
+from tareas import tarea, encolar
+
+
+# Cada venta, pago o anulación agrega su aporte como una fila nueva de
+# caja_movimientos: no se toca ninguna fila compartida, así que ventas de
+# clientes distintos no se esperan entre sí. El worker (tarea
+# "consolidar_caja") o `flask consolidar-caja` pasan esos aportes a
+# caja_diaria; los reportes suman las dos tablas, así que no dependen de eso.
+
+
+def _valores(movimiento):
+    """(fecha, metodo, origen, total, ingresado) con que un movimiento suma en caja (día de Buenos Aires)."""
+    fecha = a_local(movimiento.fecha).date() if isinstance(movimiento.fecha, datetime) else movimiento.fecha
+    metodo = movimiento.metodo_pago or ""
+    if isinstance(movimiento, Venta):
+        return fecha, metodo, "venta", movimiento.total or 0, movimiento.pago_a_cuenta or 0
+    return fecha, metodo, "pago", 0, movimiento.monto or 0
+
+
+def _acumular(fecha, metodo, origen, total, ingresado, cantidad):
+    """Agrega un aporte a caja_movimientos y encola su consolidación (sin commit)."""
+    db.session.execute(
+        insert(CajaMovimiento).values(
+            fecha=fecha, metodo_pago=metodo, origen=origen,
+            total=total, ingresado=ingresado, cantidad=cantidad,
+        ),
+        execution_options={"synchronize_session": False},
+    )
+    encolar("consolidar_caja", {}, clave="caja")
+
+
+def _sumar_a_fila(fecha, metodo, origen, total, ingresado, cantidad):
+    """
+    Suma a la fila (fecha, metodo, origen) de caja_diaria, creándola si no
+    existe, en una sola sentencia (INSERT ... ON CONFLICT DO UPDATE). Solo la
+    usa la consolidación, así que el bloqueo de la fila no frena a las ventas.
+    """
+    insertar = pg_insert if db.session.get_bind().dialect.name == "postgresql" else sqlite_insert
+    sentencia = insertar(CajaDiaria).values(
+        fecha=fecha, metodo_pago=metodo, origen=origen,
+        total=total, ingresado=ingresado, cantidad=cantidad,
+    )
+    db.session.execute(
+        sentencia.on_conflict_do_update(
+            index_elements=[CajaDiaria.fecha, CajaDiaria.metodo_pago, CajaDiaria.origen],
+            set_={
+                "total": CajaDiaria.total + sentencia.excluded.total,
+                "ingresado": CajaDiaria.ingresado + sentencia.excluded.ingresado,
+                "cantidad": CajaDiaria.cantidad + sentencia.excluded.cantidad,
+            },
+        ),
+        execution_options={"synchronize_session": False},
+    )
+
+    if cantidad < 0:
+        # Si el día/método quedó sin movimientos se borra la fila
+        db.session.execute(
+            delete(CajaDiaria)
+            .where(
+                CajaDiaria.fecha == fecha,
+                CajaDiaria.metodo_pago == metodo,
+                CajaDiaria.origen == origen,
+                CajaDiaria.cantidad <= 0,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+
+def sumar_a_caja(movimiento):
+    """Suma una venta o pago recién creado a la caja del día (sin commit)."""
+    fecha, metodo, origen, total, ingresado = _valores(movimiento)
+    _acumular(fecha, metodo, origen, total, ingresado, 1)
+
+
+def sumar_lote_a_caja(origen, filas):
+    """
+    Suma a caja ventas o pagos insertados en bloque (dicts con las columnas
+    del modelo), agrupados por día y método de pago (sin commit).
+    """
+    grupos = {}
+    for fila in filas:
+        clave = (a_local(fila["fecha"]).date(), fila.get("metodo_pago") or "")
+        total, ingresado, cantidad = grupos.get(clave, (0, 0, 0))
+        if origen == "venta":
+            total += fila.get("total") or 0
+            ingresado += fila.get("pago_a_cuenta") or 0
+        else:
+            ingresado += fila.get("monto") or 0
+        grupos[clave] = (total, ingresado, cantidad + 1)
+    # Siempre en el mismo orden: dos importaciones no se bloquean cruzadas
+    for (fecha, metodo), (total, ingresado, cantidad) in sorted(grupos.items()):
+        _acumular(fecha, metodo, origen, total, ingresado, cantidad)
+
+
+def restar_de_caja(movimiento):
+    """Descuenta una venta o pago eliminado de la caja del día (sin commit)."""
+    fecha, metodo, origen, total, ingresado = _valores(movimiento)
+    _acumular(fecha, metodo, origen, -total, -ingresado, -1)
+
+
+def _agrupado_por_dia(filtro_ventas=None, filtro_pagos=None,
+                      ventas_t=Venta.__table__, pagos_t=PagoCliente.__table__):
+    """
+    Totales de ventas2 y pagos_clientes (o sus tablas de archivo) agrupados
+    por (día, método, origen). El día de Buenos Aires lo calcula la base.
+    """
+    dia_venta = dia_local(ventas_t.c.fecha)
+    ventas = db.session.query(
+        dia_venta, ventas_t.c.metodo_pago,
+        func.sum(func.coalesce(ventas_t.c.total, 0)),
+        func.sum(func.coalesce(ventas_t.c.pago_a_cuenta, 0)),
+        func.count(),
+    )
+    if filtro_ventas is not None:
+        ventas = ventas.filter(filtro_ventas)
+
+    dia_pago = dia_local(pagos_t.c.fecha)
+    pagos = db.session.query(
+        dia_pago, pagos_t.c.metodo_pago,
+        func.sum(pagos_t.c.monto),
+        func.count(),
+    )
+    if filtro_pagos is not None:
+        pagos = pagos.filter(filtro_pagos)
+
+    for dia, metodo, total, ingresado, cantidad in ventas.group_by(dia_venta, ventas_t.c.metodo_pago):
+        yield _a_fecha(dia), metodo or "", "venta", float(total or 0), float(ingresado or 0), cantidad
+    for dia, metodo, monto, cantidad in pagos.group_by(dia_pago, pagos_t.c.metodo_pago):
+        yield _a_fecha(dia), metodo or "", "pago", 0.0, float(monto or 0), cantidad
+
+
+def _a_fecha(valor):
+    # SQLite devuelve date() como texto
+    return date.fromisoformat(valor) if isinstance(valor, str) else valor
+
+
+def restar_cliente_de_caja(cliente_id):
+    """Descuenta de la caja todos los movimientos de un cliente que se va a eliminar (sin commit)."""
+    grupos = list(chain(
+        _agrupado_por_dia(Venta.cliente_id == cliente_id, PagoCliente.cliente_id == cliente_id),
+        # Sus movimientos de períodos cerrados (ver archivo.cerrar_periodo)
+        _agrupado_por_dia(VentaArchivo.c.cliente_id == cliente_id, PagoClienteArchivo.c.cliente_id == cliente_id,
+                          ventas_t=VentaArchivo, pagos_t=PagoClienteArchivo),
+    ))
+    for fecha, metodo, origen, total, ingresado, cantidad in grupos:
+        _acumular(fecha, metodo, origen, -total, -ingresado, -cantidad)
+
+
+@tarea("consolidar_caja")
+def consolidar_caja():
+    """
+    Pasa los aportes de caja_movimientos a caja_diaria (sin commit: el worker
+    confirma junto con la tarea). Devuelve cuántos aportes consolidó.
+
+    Los aportes se toman con DELETE ... RETURNING: si dos consolidaciones
+    corren a la vez, cada aporte lo suma una sola.
+    """
+    aportes = db.session.execute(
+        delete(CajaMovimiento).returning(
+            CajaMovimiento.fecha, CajaMovimiento.metodo_pago, CajaMovimiento.origen,
+            CajaMovimiento.total, CajaMovimiento.ingresado, CajaMovimiento.cantidad,
+        )
+    ).all()
+    grupos = {}
+    for fecha, metodo, origen, total, ingresado, cantidad in aportes:
+        previo = grupos.get((fecha, metodo, origen), (0, 0, 0))
+        grupos[(fecha, metodo, origen)] = (previo[0] + total, previo[1] + ingresado, previo[2] + cantidad)
+    # Siempre en el mismo orden: dos consolidaciones no se bloquean cruzadas
+    for (fecha, metodo, origen), valores in sorted(grupos.items()):
+        _sumar_a_fila(fecha, metodo, origen, *valores)
+    return len(aportes)
+
+
+def reconstruir_caja():
+    """
+    Vuelve a generar caja_diaria completa desde ventas y pagos. Hace commit.
+
+    Incluye los movimientos de clientes archivados: archivar no cambia la caja.
+    """
+    CajaMovimiento.query.delete()
+    CajaDiaria.query.delete()
+    grupos = chain(
+        _agrupado_por_dia(),
+        _agrupado_por_dia(ventas_t=VentaArchivo, pagos_t=PagoClienteArchivo),
+    )
+    filas = [
+        CajaDiaria(fecha=fecha, metodo_pago=metodo, origen=origen,
+                   total=total, ingresado=ingresado, cantidad=cantidad)
+        for fecha, metodo, origen, total, ingresado, cantidad in grupos
+    ]
+    # NULL y "" en metodo_pago llegan como grupos distintos: se combinan
+    combinadas = {}
+    for fila in filas:
+        clave = (fila.fecha, fila.metodo_pago, fila.origen)
+        if clave in combinadas:
+            previa = combinadas[clave]
+            previa.total += fila.total
+            previa.ingresado += fila.ingresado
+            previa.cantidad += fila.cantidad
+        else:
+            combinadas[clave] = fila
+    db.session.add_all(combinadas.values())
+    db.session.commit()
+    return len(combinadas)
+
+
+def resumen_caja(desde=None, hasta=None):
+    """
+    Totales de caja del rango [desde, hasta] (fechas inclusive) leyendo
+    caja_diaria más los aportes todavía sin consolidar, con detalle por método
+    de pago, por día y por mes.
+    """
+    consultas = []
+    for tabla in (CajaDiaria, CajaMovimiento):
+        q = db.session.query(tabla.fecha, tabla.metodo_pago, tabla.origen, tabla.total, tabla.ingresado)
+        if desde:
+            q = q.filter(tabla.fecha >= desde)
+        if hasta:
+            q = q.filter(tabla.fecha <= hasta)
+        consultas.append(q)
+    filas = sorted(chain.from_iterable(consultas), key=lambda fila: fila[0])
+
+    resumen = {
+        "total_ventas": 0.0,
+        "total_ingresado": 0.0,
+        "por_metodo": {},
+        "por_dia": {},
+        "por_mes": {},
+    }
+
+    for fecha, metodo, origen, total, ingresado in filas:
+        resumen["total_ventas"] += total
+        resumen["total_ingresado"] += ingresado
+        if metodo:
+            resumen["por_metodo"][metodo] = resumen["por_metodo"].get(metodo, 0) + ingresado
+
+        for periodo, clave in (("por_dia", fecha.isoformat()), ("por_mes", fecha.strftime("%Y-%m"))):
+            fila = resumen[periodo].setdefault(clave, {"ventas": 0.0, "ingresado": 0.0})
+            fila["ventas"] += total
+            fila["ingresado"] += ingresado
+
+    return resumen
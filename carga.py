@@ -0,0 +1,142 @@
+"""
+Prueba de carga: throughput de gunicorn con distintas configuraciones.
+
+    python carga.py --db postgresql://... --configs sync:1:1 gthread:2:4 gthread:4:8
+    python carga.py --db sqlite:///benchmark.db --no-generar --concurrencia 16 --duracion 20
+
+Cada configuración es clase:workers:threads y se pasa a gunicorn.conf.py por
+entorno (GUNICORN_WORKER_CLASS, WEB_CONCURRENCY, GUNICORN_THREADS), igual que
+en producción. Para cada una se lanzan --concurrencia clientes HTTP que piden
+rutas de lectura durante --duracion segundos y se informa requests/s,
+latencias y errores.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from datetime import date, timedelta
+
+from benchmark import ClienteHTTP, USUARIO, _percentil
+
+
+def _argumentos():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--db", default="sqlite:///benchmark.db", help="DATABASE_URL a usar")
+    p.add_argument("--clientes", type=int, default=1000)
+    p.add_argument("--no-generar", action="store_true", help="Usa los datos que ya están en la base")
+    p.add_argument("--configs", nargs="+", default=["sync:1:1", "gthread:2:4"], help="clase:workers:threads")
+    p.add_argument("--concurrencia", type=int, default=16, help="Clientes simultáneos")
+    p.add_argument("--duracion", type=float, default=15, help="Segundos por configuración")
+    p.add_argument("--puerto", type=int, default=8766)
+    p.add_argument("--salida", help="Archivo JSON con los resultados")
+    return p.parse_args()
+
+
+def _esperar(proceso, base, segundos=30):
+    limite = time.time() + segundos
+    while time.time() < limite and proceso.poll() is None:
+        try:
+            urllib.request.urlopen(base + "/login", timeout=1).read()
+            return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn no respondió")
+
+
+def _urls(rnd, ids_clientes, ids_ventas):
+    hoy = date.today()
+    return [
+        lambda: "/",
+        lambda: f"/movimientos?cliente_id={rnd.choice(ids_clientes)}",
+        lambda: "/morosos",
+        lambda: f"/caja?desde={hoy - timedelta(days=30)}&hasta={hoy}",
+        lambda: f"/comprobante/{rnd.choice(ids_ventas)}",
+        lambda: f"/api/clientes/buscar?q={rnd.choice('abcdefghilmnoprst')}",
+    ]
+
+
+def _correr(config, args, ids_clientes, ids_ventas):
+    clase, workers, threads = config.split(":")
+    entorno = dict(os.environ, GUNICORN_WORKER_CLASS=clase, WEB_CONCURRENCY=workers,
+                   GUNICORN_THREADS=threads, GUNICORN_ACCESSLOG="", PORT=str(args.puerto))
+    gunicorn = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:create_app()"],
+        env=entorno, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    base = f"http://127.0.0.1:{args.puerto}"
+    tiempos, errores = [], []
+    lock = threading.Lock()
+    try:
+        _esperar(gunicorn, base)
+        fin = time.perf_counter() + args.duracion
+
+        def trabajar(semilla):
+            rnd = random.Random(semilla)
+            urls = _urls(rnd, ids_clientes, ids_ventas)
+            cliente = ClienteHTTP(base)
+            cliente.pedir("POST", "/login", {"username": USUARIO[0], "password": USUARIO[1]})
+            while time.perf_counter() < fin:
+                inicio = time.perf_counter()
+                try:
+                    estado, _ = cliente.pedir("GET", rnd.choice(urls)())
+                except Exception:
+                    estado = 0
+                ms = (time.perf_counter() - inicio) * 1000
+                with lock:
+                    (errores if estado == 0 or estado >= 500 else tiempos).append(ms)
+
+        hilos = [threading.Thread(target=trabajar, args=(n,)) for n in range(args.concurrencia)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+    finally:
+        gunicorn.terminate()
+        gunicorn.wait()
+
+    return {
+        "requests_por_segundo": round(len(tiempos) / args.duracion, 1),
+        "p50_ms": round(_percentil(tiempos, 0.5), 2) if tiempos else None,
+        "p99_ms": round(_percentil(tiempos, 0.99), 2) if tiempos else None,
+        "errores": len(errores),
+    }
+
+
+def main():
+    args = _argumentos()
+    os.environ["DATABASE_URL"] = args.db
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+
+    from app import create_app
+    from migraciones import aplicar_migraciones
+    from models import db, Cliente, Venta
+    from datos_prueba import generar_datos, asegurar_usuario
+
+    app = create_app()
+    with app.app_context():
+        aplicar_migraciones(log=lambda *a: None)
+        if not args.no_generar:
+            generar_datos(clientes=args.clientes)
+        asegurar_usuario(*USUARIO)
+        ids_clientes = [i for (i,) in db.session.query(Cliente.id)]
+        ids_ventas = [i for (i,) in db.session.query(Venta.id)]
+
+    resultados = {}
+    for config in args.configs:
+        r = resultados[config] = _correr(config, args, ids_clientes, ids_ventas)
+        print(f"{config:<16} {r['requests_por_segundo']:>8} req/s  p50={r['p50_ms']} ms  "
+              f"p99={r['p99_ms']} ms  errores={r['errores']}")
+
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump({"concurrencia": args.concurrencia, "duracion": args.duracion, "configs": resultados}, f, indent=2)
+        print(f"\nResultados en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
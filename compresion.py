@@ -0,0 +1,60 @@
+import gzip
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # sin brotli solo se comprime con gzip
+    brotli = None
+
+
+TIPOS_COMPRIMIBLES = {"text/html", "application/json"}
+
+
+def _codificacion():
+    aceptadas = request.headers.get("Accept-Encoding", "")
+    if brotli is not None and "br" in aceptadas:
+        return "br"
+    if "gzip" in aceptadas:
+        return "gzip"
+    return None
+
+
+def init_compresion(app):
+    """
+    Comprime con brotli o gzip las respuestas HTML y JSON de más de
+    COMPRESION_MINIMO bytes. Las respuestas en streaming (exportaciones) y
+    los archivos (assets, que ya vienen precomprimidos) no se tocan.
+    """
+    minimo = app.config.get("COMPRESION_MINIMO", 1024)
+    if not minimo:
+        return
+
+    @app.after_request
+    def comprimir(respuesta):
+        if (
+            respuesta.status_code != 200
+            or respuesta.mimetype not in TIPOS_COMPRIMIBLES
+            or respuesta.direct_passthrough
+            or respuesta.is_streamed
+            or "Content-Encoding" in respuesta.headers
+        ):
+            return respuesta
+
+        respuesta.vary.add("Accept-Encoding")
+        codificacion = _codificacion()
+        if codificacion is None or respuesta.calculate_content_length() < minimo:
+            return respuesta
+
+        cuerpo = respuesta.get_data()
+        if codificacion == "br":
+            # Calidad media: lo que importa en respuestas dinámicas es la velocidad
+            respuesta.set_data(brotli.compress(cuerpo, quality=5))
+        else:
+            respuesta.set_data(gzip.compress(cuerpo, compresslevel=6))
+        respuesta.headers["Content-Encoding"] = codificacion
+
+        # El cuerpo comprimido es otra representación: el ETag pasa a débil
+        etag, debil = respuesta.get_etag()
+        if etag and not debil:
+            respuesta.set_etag(etag, weak=True)
+        return respuesta
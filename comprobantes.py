@@ -0,0 +1,174 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from flask import request, current_app, make_response, abort
+from sqlalchemy import update
+from models import db, Cliente, Venta, PagoCliente
+from fechas import ahora
+from tareas import encolar
+
+
+# Un comprobante solo cambia si cambian los datos del cliente o los snapshots
+# de saldo (al eliminar o insertar movimientos anteriores). Los dos casos suben
+# Cliente.version_comprobantes, así que (tipo, id, versión) identifica el HTML.
+# Además del cache del proceso, el HTML queda en COMPROBANTES_DIR, la carpeta
+# que comparten los workers web y el worker de tareas que los prerenderiza.
+
+PLANTILLAS = {"venta": "comprobante.html", "pago": "comprobante_pago.html"}
+MODELOS = {"venta": Venta, "pago": PagoCliente}
+
+# (tipo, id, versión, host) -> HTML, del menos al más usado
+_cache = OrderedDict()
+_lock = threading.Lock()
+_huella = None
+
+
+def invalidar_comprobantes(cliente_id):
+    """Invalida todos los comprobantes del cliente en todos los procesos (sin commit)."""
+    db.session.execute(
+        update(Cliente)
+        .where(Cliente.id == cliente_id)
+        .values(
+            version_comprobantes=Cliente.version_comprobantes + 1,
+            comprobantes_modificados=ahora(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _huella_plantillas():
+    """Hash de las plantillas: un deploy que las cambia cambia también los ETag."""
+    global _huella
+    if _huella is None:
+        entorno = current_app.jinja_env
+        fuentes = "".join(entorno.loader.get_source(entorno, p)[0] for p in PLANTILLAS.values())
+        _huella = hashlib.sha1(fuentes.encode()).hexdigest()[:8]
+    return _huella
+
+
+def _metadatos(tipo, id):
+    modelo = MODELOS[tipo]
+    return (
+        db.session.query(
+            modelo.cliente_id, modelo.fecha, modelo.saldo_anterior,
+            Cliente.version_comprobantes, Cliente.comprobantes_modificados,
+        )
+        .join(Cliente, Cliente.id == modelo.cliente_id)
+        .filter(modelo.id == id)
+        .first()
+    )
+
+
+def _obtener(clave):
+    with _lock:
+        html = _cache.get(clave)
+        if html is not None:
+            _cache.move_to_end(clave)
+        return html
+
+
+def _guardar(clave, html):
+    maximo = current_app.config.get("COMPROBANTES_CACHE_MAX", 500)
+    with _lock:
+        _cache[clave] = html
+        _cache.move_to_end(clave)
+        while len(_cache) > maximo:
+            _cache.popitem(last=False)
+
+
+def _archivo(clave):
+    tipo, id, version, host = clave
+    huella = hashlib.sha1(host.encode()).hexdigest()[:8]
+    return os.path.join(current_app.config["COMPROBANTES_DIR"], f"{tipo}-{id}-{version}-{huella}.html")
+
+
+def _leer_archivo(clave):
+    try:
+        with open(_archivo(clave), encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _escribir_archivo(clave, html):
+    """Escribe el HTML (reemplazo atómico) y borra las versiones viejas del mismo comprobante."""
+    ruta = _archivo(clave)
+    carpeta = os.path.dirname(ruta)
+    os.makedirs(carpeta, exist_ok=True)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        f.write(html)
+    os.replace(temporal, ruta)
+
+    tipo, id, version, _ = clave
+    for nombre in os.listdir(carpeta):
+        if nombre.startswith(f"{tipo}-{id}-") and not nombre.startswith(f"{tipo}-{id}-{version}-"):
+            try:
+                os.remove(os.path.join(carpeta, nombre))
+            except FileNotFoundError:
+                pass
+
+
+def _preparar(tipo, id):
+    """(metadatos, clave de cache), completando los snapshots si faltan."""
+    meta = _metadatos(tipo, id)
+    if meta is None:
+        abort(404)
+
+    # Movimientos anteriores a los snapshots: se completan una vez
+    if meta.saldo_anterior is None:
+        from saldos import recalcular_snapshots  # saldos importa este módulo
+        recalcular_snapshots(meta.cliente_id)
+        db.session.commit()
+        meta = _metadatos(tipo, id)
+
+    return meta, (tipo, id, meta.version_comprobantes, request.host_url)
+
+
+def responder_comprobante(tipo, id, renderizar):
+    """
+    Respuesta del comprobante `tipo` (venta o pago) `id`.
+
+    Con If-None-Match / If-Modified-Since vigentes devuelve 304 sin renderizar.
+    Si no, usa el HTML cacheado para la versión actual o llama a
+    `renderizar()` y lo guarda.
+    """
+    meta, clave = _preparar(tipo, id)
+
+    respuesta = make_response("")
+    respuesta.set_etag(f"{tipo}-{id}-{meta.version_comprobantes}-{_huella_plantillas()}")
+    respuesta.last_modified = max(filter(None, (meta.fecha, meta.comprobantes_modificados)), default=None)
+    respuesta.cache_control.no_cache = True
+    respuesta.make_conditional(request)
+    if respuesta.status_code == 304:
+        return respuesta
+
+    html = _obtener(clave)
+    if html is None:
+        html = _leer_archivo(clave)
+        if html is None:
+            html = renderizar()
+            _escribir_archivo(clave, html)
+        _guardar(clave, html)
+    respuesta.set_data(html)
+    return respuesta
+
+
+def encolar_prerender(tipo, id):
+    """
+    Con COMPROBANTES_PRERENDER=1 encola el render del comprobante en la
+    transacción actual (sin commit): el worker lo deja en COMPROBANTES_DIR.
+    """
+    if current_app.config.get("COMPROBANTES_PRERENDER"):
+        encolar("prerenderizar_comprobante", {"tipo": tipo, "id": id, "host": request.host_url},
+                clave=f"{tipo}-{id}")
+
+
+def prerenderizar(tipo, id, renderizar):
+    """Renderiza el comprobante en COMPROBANTES_DIR si todavía no está (necesita un request context)."""
+    if _metadatos(tipo, id) is None:
+        return  # se eliminó antes de que llegara el worker
+    _, clave = _preparar(tipo, id)
+    if _leer_archivo(clave) is None:
+        _escribir_archivo(clave, renderizar())
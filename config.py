@@ -1,7 +1,100 @@
 
 import os
+import tempfile
+
+
+def _entero(nombre, defecto):
+    return int(os.getenv(nombre, str(defecto)))
+
+
+def opciones_motor(url):
+    """
+    Opciones del pool de conexiones para `url`, tomadas del entorno.
+
+    DB_POOL_SIZE / DB_MAX_OVERFLOW: conexiones por proceso (conviene que
+    alcancen para los GUNICORN_THREADS de cada worker). DB_POOL_RECYCLE cierra
+    conexiones viejas antes de que las corte un balanceador, DB_POOL_PRE_PING
+    descarta las muertas antes de usarlas y DB_STATEMENT_TIMEOUT_MS corta
+    consultas colgadas.
+
+    Con PGBOUNCER=1 (pool en modo transacción) no se mantiene pool propio
+    (NullPool) y no se mandan parámetros de inicio que PgBouncer rechaza: el
+    statement_timeout se configura en el rol (ALTER ROLE ... SET).
+    """
+    if not url or url.startswith("sqlite"):
+        return {}
+
+    timeout_ms = _entero("DB_STATEMENT_TIMEOUT_MS", 30000)
+    connect_args = {"connect_timeout": _entero("DB_CONNECT_TIMEOUT", 10)}
+
+    if os.getenv("PGBOUNCER", "0") == "1":
+        from sqlalchemy.pool import NullPool
+        return {"poolclass": NullPool, "connect_args": connect_args}
+
+    if timeout_ms:
+        connect_args["options"] = f"-c statement_timeout={timeout_ms}"
+    return {
+        "pool_size": _entero("DB_POOL_SIZE", 5),
+        "max_overflow": _entero("DB_MAX_OVERFLOW", 10),
+        "pool_timeout": _entero("DB_POOL_TIMEOUT", 30),
+        "pool_recycle": _entero("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "1") == "1",
+        "connect_args": connect_args,
+    }
+
+
+def binds_replica(url):
+    """SQLALCHEMY_BINDS con la réplica de solo lectura, si hay DATABASE_REPLICA_URL."""
+    if not url:
+        return {}
+    return {"replica": {"url": url, **opciones_motor(url)}}
+
 
 class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL")
+    SQLALCHEMY_ENGINE_OPTIONS = opciones_motor(SQLALCHEMY_DATABASE_URI)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Réplica para las rutas de reportes (ver replica.py). Después de escribir,
+    # el usuario lee de la principal durante REPLICA_VENTANA_SEGUNDOS
+    SQLALCHEMY_BINDS = binds_replica(os.getenv("DATABASE_REPLICA_URL"))
+    REPLICA_VENTANA_SEGUNDOS = float(os.getenv("REPLICA_VENTANA_SEGUNDOS", "10"))
     SECRET_KEY = os.getenv("SECRET_KEY")
+
+    # Instrumentación por request (Server-Timing, log de consultas lentas, /metrics)
+    PERFILADO = os.getenv("PERFILADO", "0") == "1"
+    PERFILADO_LENTA_MS = float(os.getenv("PERFILADO_LENTA_MS", "200"))
+    # /metrics pide sesión iniciada o este token (Authorization: Bearer ...)
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+    # Horas que se guarda la respuesta de cada Idempotency-Key
+    IDEMPOTENCIA_TTL_HORAS = float(os.getenv("IDEMPOTENCIA_TTL_HORAS", "24"))
+
+    # Cache por proceso de los usuarios logueados (load_user)
+    USUARIOS_CACHE_TTL = float(os.getenv("USUARIOS_CACHE_TTL", "60"))
+    USUARIOS_CACHE_MAX = int(os.getenv("USUARIOS_CACHE_MAX", "1000"))
+
+    # Cache por proceso del HTML de los comprobantes, más una carpeta que
+    # comparten la web y el worker; con PRERENDER=1 cada venta y pago encola
+    # el render de su comprobante y el worker lo deja en esa carpeta
+    COMPROBANTES_CACHE_MAX = int(os.getenv("COMPROBANTES_CACHE_MAX", "500"))
+    COMPROBANTES_DIR = os.getenv("COMPROBANTES_DIR", os.path.join(tempfile.gettempdir(), "bando-comprobantes"))
+    COMPROBANTES_PRERENDER = os.getenv("COMPROBANTES_PRERENDER", "0") == "1"
+
+    # Respuestas HTML/JSON de al menos estos bytes se comprimen (0 desactiva)
+    COMPRESION_MINIMO = int(os.getenv("COMPRESION_MINIMO", "1024"))
+    # Bytecode de las plantillas compiladas, compartido entre workers ("" desactiva)
+    JINJA_CACHE_DIR = os.getenv("JINJA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "bando-jinja"))
+
+    # Estados de cuenta pedidos desde la web (zip + progreso, la carpeta la
+    # comparten la web y el worker) y procesos para renderizarlos (vacío: uno por CPU)
+    ESTADOS_CUENTA_DIR = os.getenv("ESTADOS_CUENTA_DIR", os.path.join(tempfile.gettempdir(), "bando-estados"))
+    ESTADOS_CUENTA_PROCESOS = int(os.getenv("ESTADOS_CUENTA_PROCESOS", "0")) or None
+
+    # Cola de tareas (ver tareas.py): intentos antes de darla por fallida, espera
+    # base entre reintentos (se duplica en cada uno), en curso por más de
+    # COLGADA_SEGUNDOS vuelve a la cola, y días que se guardan las hechas
+    TAREAS_INTENTOS = int(os.getenv("TAREAS_INTENTOS", "5"))
+    TAREAS_ESPERA_REINTENTO = float(os.getenv("TAREAS_ESPERA_REINTENTO", "30"))
+    TAREAS_COLGADA_SEGUNDOS = float(os.getenv("TAREAS_COLGADA_SEGUNDOS", "900"))
+    TAREAS_RETENER_DIAS = float(os.getenv("TAREAS_RETENER_DIAS", "7"))
@@ -0,0 +1,159 @@
+import random
+from datetime import timedelta
+import math
+from sqlalchemy import insert, update, func
+from models import db, Cliente, Garante, Venta, VentaItem, PagoCliente, SaldoCliente, Usuario
+from caja_diaria import reconstruir_caja
+from fechas import ahora
+
+
+NOMBRES = ["Ana", "Beto", "Carla", "Diego", "Elena", "Fabián", "Gabriela", "Hugo", "Inés", "Juan",
+           "Karina", "Luis", "María", "Nicolás", "Olga", "Pablo", "Rocío", "Sergio", "Tamara", "Valentín"]
+APELLIDOS = ["Gómez", "Fernández", "López", "Díaz", "Martínez", "Pérez", "García", "Sánchez",
+             "Romero", "Sosa", "Álvarez", "Torres", "Ruiz", "Ramírez", "Flores", "Benítez"]
+LOCALIDADES = ["Corrientes", "Resistencia", "Goya", "Posadas", "Formosa"]
+ARTICULOS = ["Zapatilla", "Bota", "Sandalia", "Mocasín", "Ojota", "Borcego", "Pantufla"]
+METODOS = ["efectivo", "debito", "credito", "transferencia"]
+
+LOTE = 5000
+
+
+def _insertar(modelo, filas, devolver_ids=False):
+    """Inserta `filas` en lotes con INSERT de varias filas. Opcionalmente devuelve los ids en orden."""
+    ids = []
+    for i in range(0, len(filas), LOTE):
+        lote = filas[i:i + LOTE]
+        if devolver_ids:
+            resultado = db.session.execute(
+                insert(modelo).returning(modelo.id, sort_by_parameter_order=True), lote
+            )
+            ids.extend(resultado.scalars())
+        else:
+            db.session.execute(insert(modelo), lote)
+    return ids
+
+
+def generar_datos(clientes=1000, ventas_por_cliente=50, items_por_venta=3, pagos_por_cliente=30,
+                  dias=730, semilla=1, log=print):
+    """
+    Llena la base con datos sintéticos reproducibles (misma semilla, mismos datos).
+
+    Además de clientes, garantes, ventas, ítems y pagos deja consistentes las
+    tablas derivadas: saldo_cliente, los snapshots de saldo y caja_diaria.
+    """
+    rnd = random.Random(semilla)
+    inicio = ahora().replace(microsecond=0) - timedelta(days=dias)
+    base_documento = 20000000 + (db.session.query(func.count(Cliente.id)).scalar() or 0)
+
+    log(f"Generando {clientes} clientes...")
+    filas_clientes = []
+    for n in range(clientes):
+        filas_clientes.append({
+            "nombre": f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)}",
+            "domicilio": f"Calle {rnd.randint(1, 999)} {rnd.randint(100, 9999)}",
+            "localidad": rnd.choice(LOCALIDADES),
+            "documento": str(base_documento + n),
+            "telefono": f"379{rnd.randint(4000000, 4999999)}",
+            "ingresos": round(rnd.uniform(200000, 2000000), 2),
+            "lugar_trabajo": "Comercio",
+            "monto_autorizado": round(rnd.uniform(50000, 500000), -3),
+        })
+    ids_clientes = _insertar(Cliente, filas_clientes, devolver_ids=True)
+
+    _insertar(Garante, [
+        {
+            "nombre": f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)}",
+            "localidad": rnd.choice(LOCALIDADES),
+            "documento": str(base_documento + clientes + n),
+            "telefono": f"379{rnd.randint(4000000, 4999999)}",
+            "cliente_id": cliente_id,
+        }
+        for n, cliente_id in enumerate(ids_clientes)
+    ])
+
+    log("Generando ventas y pagos...")
+    filas_ventas, items_por_fila, filas_pagos, filas_saldo, limites = [], [], [], [], []
+    for cliente_id, fila_cliente in zip(ids_clientes, filas_clientes):
+        movimientos = []
+        for _ in range(rnd.randint(0, 2 * ventas_por_cliente)):
+            items = []
+            for _ in range(rnd.randint(1, 2 * items_por_venta - 1)):
+                cantidad = rnd.randint(1, 3)
+                precio = round(rnd.uniform(5000, 60000), 2)
+                items.append({
+                    "cantidad": cantidad,
+                    "descripcion": f"{rnd.choice(ARTICULOS)} talle {rnd.randint(35, 45)}",
+                    "precio_unitario": precio,
+                    "total": round(cantidad * precio, 2),
+                })
+            total = round(sum(i["total"] for i in items), 2)
+            pago_a_cuenta = round(total * rnd.choice([0, 0, 0.1, 0.3, 0.5, 1]), 2)
+            fecha = inicio + timedelta(seconds=rnd.randint(0, dias * 86400))
+            movimientos.append(("venta", fecha, {
+                "cliente_id": cliente_id,
+                "fecha": fecha,
+                "total": total,
+                "pago_a_cuenta": pago_a_cuenta,
+                "saldo_resultante": round(total - pago_a_cuenta, 2),
+                "metodo_pago": rnd.choice(METODOS),
+            }, items))
+
+        for _ in range(rnd.randint(0, 2 * pagos_por_cliente)):
+            fecha = inicio + timedelta(seconds=rnd.randint(0, dias * 86400))
+            movimientos.append(("pago", fecha, {
+                "cliente_id": cliente_id,
+                "fecha": fecha,
+                "monto": round(rnd.uniform(2000, 40000), 2),
+                "metodo_pago": rnd.choice(METODOS),
+            }, None))
+
+        # Snapshots en el mismo orden que la línea de tiempo (fecha, tipo)
+        saldo = 0.0
+        for tipo, fecha, fila, items in sorted(movimientos, key=lambda m: (m[1], m[0])):
+            fila["saldo_anterior"] = round(saldo, 2)
+            saldo += fila["saldo_resultante"] if tipo == "venta" else -fila["monto"]
+            fila["saldo_posterior"] = round(saldo, 2)
+            if tipo == "venta":
+                filas_ventas.append(fila)
+                items_por_fila.append(items)
+            else:
+                filas_pagos.append(fila)
+        filas_saldo.append({"cliente_id": cliente_id, "saldo": round(saldo, 2)})
+        # El monto autorizado deja margen sobre la deuda generada, como en una cuenta real
+        limites.append({
+            "id": cliente_id,
+            "monto_autorizado": fila_cliente["monto_autorizado"] + math.ceil(max(saldo, 0) / 1000) * 1000,
+        })
+
+    ids_ventas = _insertar(Venta, filas_ventas, devolver_ids=True)
+    filas_items = [
+        dict(item, venta_id=venta_id)
+        for venta_id, items in zip(ids_ventas, items_por_fila)
+        for item in items
+    ]
+    _insertar(VentaItem, filas_items)
+    _insertar(PagoCliente, filas_pagos)
+    _insertar(SaldoCliente, filas_saldo)
+    db.session.execute(update(Cliente), limites)
+    db.session.commit()
+
+    log("Reconstruyendo caja_diaria...")
+    reconstruir_caja()
+
+    resumen = {
+        "clientes": len(ids_clientes),
+        "ventas": len(filas_ventas),
+        "items": len(filas_items),
+        "pagos": len(filas_pagos),
+    }
+    log(f"Listo: {resumen}")
+    return resumen
+
+
+def asegurar_usuario(username, password, role="admin"):
+    """Crea (si no existe) un usuario para correr el benchmark logueado."""
+    if not Usuario.query.filter_by(username=username).first():
+        usuario = Usuario(username=username, role=role)
+        usuario.set_password(password)
+        db.session.add(usuario)
+        db.session.commit()
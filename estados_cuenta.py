@@ -0,0 +1,293 @@
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime
+from itertools import groupby
+from multiprocessing import get_context
+from flask import current_app
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from sqlalchemy import select, func, union
+from models import db, Cliente, Venta, VentaItem, PagoCliente, SaldoApertura
+from saldos import DEUDA_VENTA
+from archivo import inicio_periodo
+from tareas import tarea, encolar
+from fechas import ahora, inicio_dia
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CARPETA_PLANTILLAS = os.path.join(BASE_DIR, "templates")
+PLANTILLA = "estado_cuenta.html"
+
+# Estados que renderiza cada tarea del pool: menos idas y vueltas entre procesos
+ESTADOS_POR_TAREA = 50
+
+
+def rango_mes(mes):
+    """"AAAA-MM" -> (primer instante del mes, primer instante del siguiente), en hora de Buenos Aires."""
+    try:
+        desde = datetime.strptime(mes, "%Y-%m").date()
+    except ValueError:
+        raise ValueError("El mes debe tener el formato AAAA-MM")
+    siguiente = date(desde.year + desde.month // 12, desde.month % 12 + 1, 1)
+    return inicio_dia(desde), inicio_dia(siguiente)
+
+
+# ---------- DATOS ----------
+
+def _agrupar(filas, clave):
+    return {k: list(grupo) for k, grupo in groupby(filas, key=clave)}
+
+
+def _datos(desde, hasta):
+    """
+    Estados de cuenta del mes [desde, hasta) de los clientes con movimientos,
+    como dicts listos para la plantilla. Son siete consultas en total, sin
+    importar cuántos clientes haya.
+    """
+    ventas_mes = (Venta.fecha >= desde) & (Venta.fecha < hasta)
+    pagos_mes = (PagoCliente.fecha >= desde) & (PagoCliente.fecha < hasta)
+    activos = union(
+        select(Venta.cliente_id).where(ventas_mes),
+        select(PagoCliente.cliente_id).where(pagos_mes),
+    ).subquery()
+    ids_activos = select(activos.c.cliente_id)
+
+    clientes = db.session.execute(
+        select(Cliente.id, Cliente.nombre, Cliente.documento, Cliente.domicilio, Cliente.localidad, Cliente.telefono)
+        .where(Cliente.id.in_(ids_activos))
+        .order_by(Cliente.id)
+    ).all()
+
+    # Saldo al empezar el mes: apertura del período más lo anterior al mes
+    aperturas = dict(db.session.execute(
+        select(SaldoApertura.cliente_id, SaldoApertura.saldo).where(SaldoApertura.cliente_id.in_(ids_activos))
+    ).all())
+    ventas_antes = dict(db.session.execute(
+        select(Venta.cliente_id, func.sum(DEUDA_VENTA))
+        .where(Venta.fecha < desde, Venta.cliente_id.in_(ids_activos))
+        .group_by(Venta.cliente_id)
+    ).all())
+    pagos_antes = dict(db.session.execute(
+        select(PagoCliente.cliente_id, func.sum(PagoCliente.monto))
+        .where(PagoCliente.fecha < desde, PagoCliente.cliente_id.in_(ids_activos))
+        .group_by(PagoCliente.cliente_id)
+    ).all())
+
+    ventas = _agrupar(db.session.execute(
+        select(Venta.id, Venta.cliente_id, Venta.fecha, Venta.total, Venta.pago_a_cuenta, Venta.metodo_pago)
+        .where(ventas_mes)
+        .order_by(Venta.cliente_id, Venta.fecha, Venta.id)
+    ).all(), lambda v: v.cliente_id)
+    items = _agrupar(db.session.execute(
+        select(VentaItem.venta_id, VentaItem.cantidad, VentaItem.descripcion, VentaItem.precio_unitario, VentaItem.total)
+        .where(VentaItem.venta_id.in_(select(Venta.id).where(ventas_mes)))
+        .order_by(VentaItem.venta_id, VentaItem.id)
+    ).all(), lambda i: i.venta_id)
+    pagos = _agrupar(db.session.execute(
+        select(PagoCliente.id, PagoCliente.cliente_id, PagoCliente.fecha, PagoCliente.monto, PagoCliente.metodo_pago)
+        .where(pagos_mes)
+        .order_by(PagoCliente.cliente_id, PagoCliente.fecha, PagoCliente.id)
+    ).all(), lambda p: p.cliente_id)
+
+    estados = []
+    for cliente in clientes:
+        movimientos = [
+            {
+                "tipo": "venta",
+                "id": v.id,
+                "fecha": v.fecha,
+                "metodo_pago": v.metodo_pago,
+                "total": v.total or 0,
+                "pago_a_cuenta": v.pago_a_cuenta or 0,
+                "importe": (v.total or 0) - (v.pago_a_cuenta or 0),
+                "items": [
+                    {"cantidad": i.cantidad, "descripcion": i.descripcion,
+                     "precio_unitario": i.precio_unitario or 0, "total": i.total or 0}
+                    for i in items.get(v.id, [])
+                ],
+            }
+            for v in ventas.get(cliente.id, [])
+        ] + [
+            {"tipo": "pago", "id": p.id, "fecha": p.fecha, "metodo_pago": p.metodo_pago, "importe": -(p.monto or 0)}
+            for p in pagos.get(cliente.id, [])
+        ]
+        # Mismo orden que los snapshots de saldo (ver saldos._clave)
+        movimientos.sort(key=lambda m: (m["fecha"], m["tipo"], m["id"]))
+
+        saldo_inicial = float(aperturas.get(cliente.id) or 0) \
+            + float(ventas_antes.get(cliente.id) or 0) - float(pagos_antes.get(cliente.id) or 0)
+        saldo = saldo_inicial
+        for m in movimientos:
+            saldo += m["importe"]
+            m["saldo"] = round(saldo, 2)
+
+        estados.append({
+            "cliente": dict(cliente._mapping),
+            "desde": desde,
+            "hasta": hasta,
+            "saldo_inicial": round(saldo_inicial, 2),
+            "movimientos": movimientos,
+            "total_ventas": round(sum(m["importe"] for m in movimientos if m["tipo"] == "venta"), 2),
+            "total_pagos": round(-sum(m["importe"] for m in movimientos if m["tipo"] == "pago"), 2),
+            "saldo_final": round(saldo, 2),
+        })
+    return estados
+
+
+# ---------- RENDER (en los procesos del pool) ----------
+
+_plantilla = None
+
+
+def _iniciar_proceso(carpeta):
+    """Cada proceso arma su propio entorno de Jinja: no necesita la app ni la base."""
+    global _plantilla
+    entorno = Environment(loader=FileSystemLoader(carpeta), autoescape=select_autoescape(["html"]))
+    _plantilla = entorno.get_template(PLANTILLA)
+
+
+def _nombre_archivo(estado):
+    cliente = estado["cliente"]
+    nombre = unicodedata.normalize("NFKD", cliente["nombre"] or "").encode("ascii", "ignore").decode().lower()
+    nombre = re.sub(r"[^a-z0-9]+", "-", nombre).strip("-")
+    return f"{estado['desde']:%Y-%m}/{cliente['id']:06d}-{nombre or 'cliente'}.html"
+
+
+def _renderizar_lote(estados):
+    return [(_nombre_archivo(e), _plantilla.render(**e, generado=ahora())) for e in estados]
+
+
+def _contexto():
+    # fork arranca al instante, pero no es seguro desde un proceso con otros
+    # hilos (gunicorn con threads): ahí los procesos arrancan de cero
+    return get_context("fork" if threading.active_count() == 1 else "spawn")
+
+
+# ---------- SALIDA ----------
+
+@contextmanager
+def _salida(destino):
+    """Función que escribe (nombre, html) en una carpeta o en un .zip."""
+    if destino.endswith(".zip"):
+        os.makedirs(os.path.dirname(os.path.abspath(destino)), exist_ok=True)
+        with zipfile.ZipFile(destino, "w", compression=zipfile.ZIP_DEFLATED) as archivo_zip:
+            yield lambda nombre, html: archivo_zip.writestr(nombre, html)
+        return
+
+    def escribir(nombre, html):
+        ruta = os.path.join(destino, nombre)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with open(ruta, "w", encoding="utf-8") as f:
+            f.write(html)
+    yield escribir
+
+
+def generar_estados(mes, destino, procesos=None, progreso=None):
+    """
+    Genera los estados de cuenta de `mes` ("AAAA-MM") de todos los clientes
+    con movimientos en el mes y los escribe en `destino` (carpeta o .zip).
+
+    Los datos se leen en pocas consultas y el HTML se renderiza en un pool
+    de `procesos` procesos (por defecto uno por CPU; con 1 se renderiza acá
+    mismo). `progreso(hechos, total)` se llama después de cada lote.
+    Devuelve la cantidad de estados generados.
+    """
+    desde, hasta = rango_mes(mes)
+    inicio = inicio_periodo()
+    if inicio is not None and desde < inicio:
+        raise ValueError(f"{mes} es de un período cerrado (el vigente empieza el {inicio:%d/%m/%Y})")
+
+    estados = _datos(desde, hasta)
+    # El render no toca la base: la conexión vuelve al pool mientras tanto
+    db.session.remove()
+    total = len(estados)
+    lotes = [estados[i:i + ESTADOS_POR_TAREA] for i in range(0, total, ESTADOS_POR_TAREA)]
+    if progreso:
+        progreso(0, total)
+
+    procesos = procesos or os.cpu_count() or 1
+    hechos = 0
+    with _salida(destino) as escribir:
+        pool = None
+        if procesos == 1 or len(lotes) <= 1:
+            _iniciar_proceso(CARPETA_PLANTILLAS)
+            renderizados = map(_renderizar_lote, lotes)
+        else:
+            pool = ProcessPoolExecutor(
+                max_workers=procesos,
+                mp_context=_contexto(),
+                initializer=_iniciar_proceso,
+                initargs=(CARPETA_PLANTILLAS,),
+            )
+            renderizados = pool.map(_renderizar_lote, lotes)
+        try:
+            for lote in renderizados:
+                for nombre, html in lote:
+                    escribir(nombre, html)
+                hechos += len(lote)
+                if progreso:
+                    progreso(hechos, total)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+    return total
+
+
+# ---------- GENERACIÓN DESDE LA WEB ----------
+# La web encola la tarea y la corre `flask worker`. El zip y su progreso
+# quedan en ESTADOS_CUENTA_DIR, que tiene que ser la misma carpeta para la
+# web y el worker (mismo contenedor o un volumen compartido).
+
+def ruta_zip(mes):
+    return os.path.join(current_app.config["ESTADOS_CUENTA_DIR"], f"estados-{mes}.zip")
+
+
+def _ruta_estado(mes):
+    return ruta_zip(mes) + ".json"
+
+
+def _guardar_estado(mes, **datos):
+    ruta = _ruta_estado(mes)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = ruta + ".tmp"
+    with open(temporal, "w") as f:
+        json.dump({**datos, "actualizado": time.time()}, f)
+    os.replace(temporal, ruta)
+
+
+def estado_generacion(mes):
+    """Progreso de la generación de `mes` (None si nunca se pidió)."""
+    try:
+        with open(_ruta_estado(mes)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def iniciar_generacion(mes):
+    """Encola la generación de `mes` (sin commit), salvo que ya haya una esperando."""
+    rango_mes(mes)
+    if encolar("estados_cuenta", {"mes": mes}, clave=mes) is not None:
+        _guardar_estado(mes, estado="pendiente", hechos=0, total=None)
+
+
+@tarea("estados_cuenta")
+def generar_zip(mes):
+    """Tarea: genera el zip de `mes` para descargarlo desde /estados-cuenta."""
+    temporal = ruta_zip(mes)[:-len(".zip")] + ".parcial.zip"
+    try:
+        total = generar_estados(
+            mes, temporal, procesos=current_app.config.get("ESTADOS_CUENTA_PROCESOS"),
+            progreso=lambda hechos, total: _guardar_estado(mes, estado="generando", hechos=hechos, total=total),
+        )
+    except Exception as e:
+        _guardar_estado(mes, estado="error", error=str(e))
+        raise
+    os.replace(temporal, ruta_zip(mes))
+    _guardar_estado(mes, estado="listo", hechos=total, total=total)
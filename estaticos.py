@@ -0,0 +1,163 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+import urllib.request
+from flask import current_app, send_from_directory, request, url_for, abort
+from jinja2 import FileSystemBytecodeCache
+
+try:
+    import brotli
+except ImportError:  # sin brotli solo se sirve gzip
+    brotli = None
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Versiones fijas: `flask assets` siempre genera lo mismo
+TAILWIND_VERSION = "v3.4.17"
+LUCIDE_VERSION = "0.460.0"
+LUCIDE_URL = f"https://unpkg.com/lucide@{LUCIDE_VERSION}/dist/umd/lucide.min.js"
+
+# Los assets con huella no cambian nunca: el navegador los guarda un año
+MAX_AGE_INMUTABLE = 365 * 24 * 3600
+EXTENSIONES_COMPRIMIBLES = (".css", ".js", ".svg", ".json")
+# Versión precomprimida que se busca para cada Accept-Encoding, en orden de preferencia
+PRECOMPRIMIDOS = (("br", ".br"), ("gzip", ".gz"))
+
+# nombre -> (mtime, huella)
+_huellas = {}
+_lock = threading.Lock()
+
+
+def init_estaticos(app):
+    """
+    Assets con huella en /assets, `asset()` en las plantillas y cache de
+    bytecode de Jinja en JINJA_CACHE_DIR (compartido entre workers y
+    reinicios). Las plantillas se compilan al armar la app: con
+    GUNICORN_PRELOAD=1 los workers ya arrancan con todas cargadas.
+    """
+    app.add_url_rule("/assets/<path:archivo>", "asset", servir_asset)
+    app.jinja_env.globals["asset"] = url_asset
+
+    directorio = app.config.get("JINJA_CACHE_DIR")
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directorio)
+    for nombre in app.jinja_env.list_templates(extensions=["html"]):
+        app.jinja_env.get_template(nombre)
+
+
+def _huella(nombre):
+    """sha256 corto del archivo de static/, o None si no existe."""
+    ruta = os.path.join(current_app.static_folder, nombre)
+    try:
+        mtime = os.stat(ruta).st_mtime
+    except OSError:
+        return None
+    with _lock:
+        guardada = _huellas.get(nombre)
+    if guardada and guardada[0] == mtime:
+        return guardada[1]
+
+    with open(ruta, "rb") as f:
+        huella = hashlib.sha256(f.read()).hexdigest()[:12]
+    with _lock:
+        _huellas[nombre] = (mtime, huella)
+    return huella
+
+
+def url_asset(nombre):
+    """
+    URL con huella de un archivo de static/ ("tailwind.css" ->
+    /assets/tailwind.<huella>.css), o None si todavía no se generó con
+    `flask assets` (las plantillas usan el CDN).
+    """
+    huella = _huella(nombre)
+    if huella is None:
+        return None
+    base, extension = os.path.splitext(nombre)
+    return url_for("asset", archivo=f"{base}.{huella}{extension}")
+
+
+def servir_asset(archivo):
+    """Sirve /assets/<nombre>.<huella>.<ext>, precomprimido si el navegador lo acepta."""
+    partes = archivo.rsplit(".", 2)
+    if len(partes) != 3:
+        abort(404)
+    base, huella, extension = partes
+    nombre = f"{base}.{extension}"
+    actual = _huella(nombre)
+    if actual is None:
+        abort(404)
+
+    aceptadas = request.headers.get("Accept-Encoding", "")
+    codificacion, sufijo = None, ""
+    for candidata, extension_comprimida in PRECOMPRIMIDOS:
+        if candidata in aceptadas and os.path.exists(os.path.join(current_app.static_folder, nombre + extension_comprimida)):
+            codificacion, sufijo = candidata, extension_comprimida
+            break
+
+    # Una huella vieja (HTML cacheado de antes de un deploy) recibe el
+    # archivo actual, pero sin cache largo
+    inmutable = huella == actual
+    respuesta = send_from_directory(
+        current_app.static_folder,
+        nombre + sufijo,
+        mimetype=mimetypes.guess_type(nombre)[0],
+        max_age=MAX_AGE_INMUTABLE if inmutable else 0,
+    )
+    if inmutable:
+        respuesta.cache_control.public = True
+        respuesta.cache_control.immutable = True
+    if codificacion:
+        respuesta.headers["Content-Encoding"] = codificacion
+    respuesta.vary.add("Accept-Encoding")
+    return respuesta
+
+
+# ---------- GENERACIÓN (flask assets) ----------
+
+def _tailwind(destino, log):
+    # Dependencia solo de build: descarga el binario de Tailwind la primera vez
+    import pytailwindcss
+
+    log(f"Compilando Tailwind {TAILWIND_VERSION}")
+    pytailwindcss.run(
+        ["-c", "tailwind.config.js", "-i", os.path.join("estilos", "tailwind.css"), "-o", destino, "--minify"],
+        cwd=BASE_DIR, version=TAILWIND_VERSION, auto_install=True,
+    )
+
+
+def _lucide(destino, log):
+    log(f"Descargando lucide {LUCIDE_VERSION}")
+    with urllib.request.urlopen(LUCIDE_URL, timeout=60) as respuesta, open(destino, "wb") as f:
+        f.write(respuesta.read())
+
+
+def _precomprimir(carpeta, log):
+    for nombre in sorted(os.listdir(carpeta)):
+        if not nombre.endswith(EXTENSIONES_COMPRIMIBLES):
+            continue
+        with open(os.path.join(carpeta, nombre), "rb") as f:
+            contenido = f.read()
+        versiones = {".gz": gzip.compress(contenido, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            versiones[".br"] = brotli.compress(contenido, quality=11)
+        for sufijo, comprimido in versiones.items():
+            with open(os.path.join(carpeta, nombre + sufijo), "wb") as f:
+                f.write(comprimido)
+        detalle = ", ".join(f"{sufijo} {len(c)}" for sufijo, c in versiones.items())
+        log(f"{nombre}: {len(contenido)} bytes ({detalle})")
+
+
+def construir_assets(tailwind=True, lucide=True, log=print):
+    """Genera static/tailwind.css y static/lucide.min.js y sus versiones .gz/.br."""
+    carpeta = current_app.static_folder
+    os.makedirs(carpeta, exist_ok=True)
+    if tailwind:
+        _tailwind(os.path.join(carpeta, "tailwind.css"), log)
+    if lucide:
+        _lucide(os.path.join(carpeta, "lucide.min.js"), log)
+    _precomprimir(carpeta, log)
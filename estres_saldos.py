@@ -0,0 +1,150 @@
+"""
+Prueba de estrés del límite de crédito con muchas cajas a la vez.
+
+    python estres_saldos.py --db sqlite:///estres.db
+    python estres_saldos.py --db postgresql://... --workers 32 --operaciones 2000
+
+Crea unos pocos clientes con un monto autorizado chico y lanza ventas y pagos
+en paralelo (un hilo por caja, cada uno con su conexión). Al final verifica
+que no se perdió ninguna actualización del saldo y que ningún cliente quedó
+por encima de su límite. Sale con código 1 si algo falla.
+
+Los tests la corren con `estresar` sobre una base SQLite temporal
+(tests/test_saldos_concurrencia.py).
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+USUARIO = ("estres", "estres")
+
+
+def _argumentos():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--db", default="sqlite:///estres.db", help="DATABASE_URL a usar")
+    p.add_argument("--workers", type=int, default=8, help="Cajas en paralelo")
+    p.add_argument("--operaciones", type=int, default=400)
+    p.add_argument("--clientes", type=int, default=3, help="Pocos clientes: más choques por el mismo saldo")
+    p.add_argument("--limite", type=float, default=5000, help="Monto autorizado de cada cliente")
+    p.add_argument("--semilla", type=int, default=1)
+    return p.parse_args()
+
+
+def _crear_clientes(cantidad, limite):
+    from models import db, Cliente, SaldoCliente
+
+    ids = []
+    for n in range(cantidad):
+        cliente = Cliente(nombre=f"Estrés {n}", documento=f"estres-{time.time_ns()}-{n}", monto_autorizado=limite)
+        db.session.add(cliente)
+        db.session.flush()
+        db.session.add(SaldoCliente(cliente_id=cliente.id, saldo=0))
+        ids.append(cliente.id)
+    db.session.commit()
+    return ids
+
+
+def _verificar(ids, limite):
+    """Lista de problemas encontrados (vacía si todo está bien)."""
+    from models import db, Venta, SaldoCliente
+    from saldos import calcular_saldo
+
+    problemas = []
+    for cliente_id in ids:
+        guardado = db.session.query(SaldoCliente.saldo).filter_by(cliente_id=cliente_id).scalar()
+        calculado = calcular_saldo(cliente_id)
+        if abs(guardado - calculado) > 0.005:
+            problemas.append(f"cliente {cliente_id}: saldo guardado {guardado} != historia {calculado}")
+        if calculado > limite + 0.005:
+            problemas.append(f"cliente {cliente_id}: saldo {calculado} supera el límite {limite}")
+
+        # Cada snapshot se tomó con el saldo bloqueado: ninguno puede pasarse del límite
+        excedidas = db.session.query(Venta.id).filter(
+            Venta.cliente_id == cliente_id, Venta.saldo_posterior > limite + 0.005
+        ).count()
+        if excedidas:
+            problemas.append(f"cliente {cliente_id}: {excedidas} ventas sobre el límite")
+    return problemas
+
+
+def estresar(app, workers=8, operaciones=400, clientes=3, limite=5000, semilla=1, log=print):
+    """
+    Corre la prueba sobre `app` (con la base ya migrada) y devuelve la lista
+    de problemas encontrados, vacía si todo está bien.
+    """
+    from datos_prueba import asegurar_usuario
+
+    with app.app_context():
+        asegurar_usuario(*USUARIO)
+        ids = _crear_clientes(clientes, limite)
+
+    local = threading.local()
+    rnd = random.Random(semilla)
+    pedidos = []
+    for _ in range(operaciones):
+        cliente_id = rnd.choice(ids)
+        if rnd.random() < 0.6:
+            importe = round(rnd.uniform(100, 1500), 2)
+            items = [{"cantidad": 1, "descripcion": "Estrés", "precio_unitario": importe, "total": importe}]
+            pedidos.append(("/ventas/guardar", {
+                "cliente_id": cliente_id, "metodo_pago": "efectivo",
+                "pago_a_cuenta": "0", "items_json": json.dumps(items),
+            }))
+        else:
+            pedidos.append(("/pagos", {
+                "cliente_id": cliente_id, "monto": str(round(rnd.uniform(50, 800), 2)), "metodo_pago": "efectivo",
+            }))
+
+    def ejecutar(pedido):
+        if not hasattr(local, "cliente"):
+            local.cliente = app.test_client()
+            local.cliente.post("/login", data={"username": USUARIO[0], "password": USUARIO[1]})
+        url, datos = pedido
+        return url, local.cliente.post(url, data=datos).status_code
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        estados = Counter(pool.map(ejecutar, pedidos))
+    segundos = time.perf_counter() - inicio
+
+    for (url, estado), cantidad in sorted(estados.items()):
+        log(f"{url:<16} {estado}: {cantidad}")
+    log(f"{operaciones} operaciones en {segundos:.1f} s con {workers} cajas")
+
+    inesperados = sum(c for (_, estado), c in estados.items() if estado not in (200, 302, 409))
+    with app.app_context():
+        problemas = _verificar(ids, limite)
+    if inesperados:
+        problemas.append(f"{inesperados} respuestas con error inesperado")
+    return problemas
+
+
+def main():
+    args = _argumentos()
+    os.environ["DATABASE_URL"] = args.db
+    os.environ.setdefault("SECRET_KEY", "estres")
+
+    from app import create_app
+    from migraciones import aplicar_migraciones
+
+    app = create_app()
+    with app.app_context():
+        aplicar_migraciones(log=lambda *a: None)
+
+    problemas = estresar(app, args.workers, args.operaciones, args.clientes, args.limite, args.semilla)
+    for problema in problemas:
+        print(f"ERROR: {problema}")
+    if problemas:
+        sys.exit(1)
+    print("Sin actualizaciones perdidas ni límites superados")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+from datetime import datetime, time, timedelta, timezone
+import pytz
+from sqlalchemy import types
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+
+# Las fechas se guardan en UTC con zona horaria (timestamptz en Postgres) y en
+# Python se usan siempre con zona horaria, en hora de Buenos Aires. Los
+# reportes por día cortan en la medianoche de Buenos Aires.
+
+TZ_AR = pytz.timezone("America/Argentina/Buenos_Aires")
+
+
+def ahora():
+    """Momento actual en hora de Buenos Aires, con zona horaria."""
+    return datetime.now(TZ_AR)
+
+
+def hoy():
+    return ahora().date()
+
+
+def a_local(valor):
+    """Interpreta una fecha sin zona horaria como hora de Buenos Aires; las que tienen zona se convierten."""
+    if valor.tzinfo is None:
+        return TZ_AR.localize(valor)
+    return valor.astimezone(TZ_AR)
+
+
+def inicio_dia(dia):
+    """Medianoche de Buenos Aires del día `dia`."""
+    return TZ_AR.localize(datetime.combine(dia, time()))
+
+
+def rango_dias(desde, hasta):
+    """
+    Rango semiabierto [desde, hasta + 1 día) de dos días inclusive, para
+    filtrar columnas FechaHora por el índice. Cualquiera de los dos puede ser None.
+    """
+    return (
+        inicio_dia(desde) if desde else None,
+        inicio_dia(hasta + timedelta(days=1)) if hasta else None,
+    )
+
+
+class FechaHora(types.TypeDecorator):
+    """
+    DateTime con zona horaria: guarda en UTC y devuelve hora de Buenos Aires.
+    Rechaza fechas sin zona para que no se vuelvan a mezclar convenciones.
+    """
+    impl = types.DateTime(timezone=True)
+    cache_ok = True
+
+    def process_bind_param(self, valor, dialect):
+        if valor is None:
+            return None
+        if not isinstance(valor, datetime) or valor.tzinfo is None:
+            raise ValueError(f"Se esperaba una fecha con zona horaria: {valor!r}")
+        valor = valor.astimezone(timezone.utc)
+        # SQLite no tiene tipo con zona: queda el texto en UTC
+        return valor.replace(tzinfo=None) if dialect.name == "sqlite" else valor
+
+    def process_result_value(self, valor, dialect):
+        if valor is None:
+            return None
+        if valor.tzinfo is None:
+            valor = valor.replace(tzinfo=timezone.utc)
+        return valor.astimezone(TZ_AR)
+
+
+class dia_local(FunctionElement):
+    """Día de Buenos Aires de una columna FechaHora, calculado por la base."""
+    type = types.Date()
+    name = "dia_local"
+    inherit_cache = True
+
+
+@compiles(dia_local, "postgresql")
+def _dia_local_postgres(elemento, compilador, **kw):
+    return f"CAST(timezone('{TZ_AR.zone}', {compilador.process(elemento.clauses, **kw)}) AS DATE)"
+
+
+@compiles(dia_local)
+def _dia_local(elemento, compilador, **kw):
+    # SQLite no conoce zonas horarias: Argentina está en UTC-3 fijo (sin horario de verano desde 2009)
+    return f"date({compilador.process(elemento.clauses, **kw)}, '-3 hours')"
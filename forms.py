@@ -0,0 +1,20 @@
+def safe_float(value):
+    """Convierte cadenas vacías o con coma a float o None."""
+    try:
+        if not value or value.strip() == "":
+            return None
+        value = value.replace(",", ".")
+        return float(value)
+    except ValueError:
+        return None
+
+
+def safe_id(value):
+    """Id positivo de un formulario o JSON (entero o texto con dígitos) o None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value if value > 0 else None
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value) or None
+    return None
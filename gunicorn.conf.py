@@ -0,0 +1,28 @@
+# Configuración de gunicorn (la toma sola si se corre desde esta carpeta).
+# Todo se puede cambiar por entorno sin tocar el Procfile.
+import multiprocessing
+import os
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+# gthread: cada worker atiende varias requests a la vez mientras espera a la
+# base. Con "sync" cada worker atiende de a una.
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.getenv("WEB_CONCURRENCY", min(2 * multiprocessing.cpu_count() + 1, 8)))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# GUNICORN_PRELOAD=1 importa la app una vez en el master y los workers arrancan
+# con fork (más rápido y comparten memoria). create_app no abre conexiones.
+preload_app = os.getenv("GUNICORN_PRELOAD", "0") == "1"
+
+# Reinicia cada worker cada tantas requests (con jitter para que no lo hagan todos juntos)
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "2000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "200"))
+
+# Vacío desactiva el log de accesos
+accesslog = os.getenv("GUNICORN_ACCESSLOG", "-") or None
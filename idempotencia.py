@@ -0,0 +1,152 @@
+import hashlib
+import json
+import uuid
+from datetime import timedelta
+from functools import wraps
+from flask import g, request, current_app, make_response, jsonify
+from sqlalchemy import update, delete
+from sqlalchemy.exc import IntegrityError
+from models import db, ClaveIdempotencia
+from fechas import ahora
+
+
+CABECERA = "Idempotency-Key"
+# Los formularios HTML no pueden mandar cabeceras: la clave va en un campo oculto
+CAMPO = "idempotency_key"
+LARGO_MAXIMO = 100
+
+
+def nueva_clave():
+    return uuid.uuid4().hex
+
+
+def _vencimiento():
+    return ahora() - timedelta(hours=current_app.config.get("IDEMPOTENCIA_TTL_HORAS", 24))
+
+
+def _huella():
+    """sha256 del contenido del pedido (sin la clave) para detectar claves reutilizadas."""
+    datos = {
+        "endpoint": request.endpoint,
+        "form": sorted((k, v) for k, v in request.form.items(multi=True) if k != CAMPO),
+        "json": request.get_json(silent=True),
+    }
+    return hashlib.sha256(json.dumps(datos, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _reservar(clave, huella):
+    """
+    Inserta la clave en la transacción del pedido. Devuelve None si quedó
+    reservada o la fila ya existente si otra request la usó antes.
+
+    La fila se confirma junto con la venta o el pago: si la operación falla y
+    hace rollback, la clave se libera y el reintento vuelve a ejecutarla. En
+    Postgres un reintento simultáneo espera en el índice único hasta que la
+    primera termine.
+    """
+    for _ in range(2):
+        db.session.add(ClaveIdempotencia(clave=clave, endpoint=request.endpoint, huella=huella))
+        try:
+            db.session.flush()
+            return None
+        except IntegrityError:
+            db.session.rollback()
+
+        existente = db.session.get(ClaveIdempotencia, clave)
+        if existente is None or existente.creada >= _vencimiento():
+            return existente
+        # Vencida: se descarta y se vuelve a reservar
+        db.session.delete(existente)
+        db.session.commit()
+    return existente
+
+
+def _repetir(guardada):
+    respuesta = make_response(guardada.cuerpo or "", guardada.codigo)
+    respuesta.mimetype = guardada.mimetype or "text/html"
+    if guardada.location:
+        respuesta.headers["Location"] = guardada.location
+    respuesta.headers["Idempotent-Replayed"] = "true"
+    return respuesta
+
+
+def _guardar(clave, respuesta):
+    db.session.execute(
+        update(ClaveIdempotencia)
+        .where(ClaveIdempotencia.clave == clave)
+        .values(
+            codigo=respuesta.status_code,
+            cuerpo=respuesta.get_data(as_text=True),
+            mimetype=respuesta.mimetype,
+            location=respuesta.headers.get("Location"),
+        )
+    )
+
+
+def guardar_respuesta(respuesta):
+    """
+    Guarda la respuesta en la fila de la clave del pedido, en la transacción
+    de la venta o el pago (sin commit). La vista la llama justo antes de su
+    commit: si el proceso muere después, los reintentos reciben la respuesta
+    en lugar de un 409 hasta que venza la clave. Sin clave no hace nada.
+    """
+    clave = g.get("clave_idempotencia")
+    if clave is None:
+        return respuesta
+    respuesta = make_response(respuesta)
+    _guardar(clave, respuesta)
+    g.respuesta_guardada = True
+    return respuesta
+
+
+def idempotente(vista):
+    """
+    Hace que un POST con Idempotency-Key (o el campo `idempotency_key`) se
+    ejecute una sola vez: los reintentos con la misma clave reciben la
+    respuesta original. Sin clave la vista se ejecuta normalmente.
+
+    Solo se guardan las respuestas exitosas; un rechazo (4xx) no consume la
+    clave. La vista tiene que hacer commit de su trabajo, después de
+    `guardar_respuesta` (si no, la respuesta se guarda en un segundo commit).
+    """
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        clave = request.headers.get(CABECERA) or request.form.get(CAMPO)
+        if request.method != "POST" or not clave:
+            return vista(*args, **kwargs)
+        if len(clave) > LARGO_MAXIMO:
+            return jsonify({"error": f"{CABECERA} demasiado larga"}), 400
+
+        huella = _huella()
+        existente = _reservar(clave, huella)
+        if existente is not None:
+            if existente.huella != huella or existente.endpoint != request.endpoint:
+                return jsonify({"error": f"{CABECERA} ya usada con otro pedido"}), 422
+            if existente.codigo is None:
+                respuesta = jsonify({"error": "La operación original todavía está en curso"})
+                respuesta.status_code = 409
+                respuesta.headers["Retry-After"] = "1"
+                return respuesta
+            return _repetir(existente)
+
+        g.clave_idempotencia = clave
+        respuesta = make_response(vista(*args, **kwargs))
+        if respuesta.status_code >= 400:
+            db.session.rollback()
+            return respuesta
+
+        if not g.get("respuesta_guardada"):
+            _guardar(clave, respuesta)
+            db.session.commit()
+        return respuesta
+
+    return envoltura
+
+
+def purgar_claves():
+    """Borra las claves vencidas. Devuelve cuántas borró."""
+    borradas = db.session.execute(
+        delete(ClaveIdempotencia).where(ClaveIdempotencia.creada < _vencimiento())
+    ).rowcount
+    db.session.commit()
+    return borradas
@@ -0,0 +1,490 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from itertools import groupby
+from sqlalchemy import insert
+from models import db, Cliente, Garante, Venta, VentaItem, PagoCliente, SaldoCliente
+from forms import safe_float
+from saldos import ajustar_saldo, recalcular_snapshots
+from caja_diaria import sumar_lote_a_caja
+from operaciones import OperacionRechazada, insertar_items
+from archivo import inicio_periodo
+from fechas import ahora, a_local
+
+
+# Filas que se leen de la base (yield_per) y se escriben por vez
+LOTE_EXPORTACION = 1000
+# Filas que se insertan por vez al importar
+LOTE_IMPORTACION = 1000
+# Máximo de errores que se devuelven en el resumen de una importación
+MAX_ERRORES = 100
+
+ENTIDADES = ("clientes", "ventas", "pagos")
+FORMATOS = ("csv", "jsonl")
+
+CAMPOS_CLIENTE = ["nombre", "domicilio", "localidad", "documento", "telefono",
+                  "ingresos", "lugar_trabajo", "monto_autorizado"]
+CAMPOS_GARANTE = ["nombre", "domicilio", "localidad", "documento", "telefono",
+                  "ingresos", "lugar_trabajo"]
+CAMPOS_VENTA = ["fecha", "total", "pago_a_cuenta", "saldo_resultante", "descripcion", "metodo_pago"]
+CAMPOS_ITEM = ["cantidad", "descripcion", "precio_unitario", "total"]
+CAMPOS_PAGO = ["fecha", "monto", "metodo_pago"]
+
+COLUMNAS = {
+    "clientes": ["id"] + CAMPOS_CLIENTE + [f"garante_{c}" for c in CAMPOS_GARANTE],
+    "ventas": ["id", "cliente_id", "cliente_documento"] + CAMPOS_VENTA + [f"item_{c}" for c in CAMPOS_ITEM],
+    "pagos": ["id", "cliente_id", "cliente_documento"] + CAMPOS_PAGO,
+}
+
+
+# ---------- EXPORTACIÓN ----------
+
+def _filas_clientes():
+    q = (
+        db.session.query(
+            Cliente.id,
+            *[getattr(Cliente, c) for c in CAMPOS_CLIENTE],
+            *[getattr(Garante, c) for c in CAMPOS_GARANTE],
+        )
+        .outerjoin(Garante, Garante.cliente_id == Cliente.id)
+        .order_by(Cliente.id)
+        .yield_per(LOTE_EXPORTACION)
+    )
+    for fila in q:
+        yield dict(zip(COLUMNAS["clientes"], fila))
+
+
+def _filas_ventas():
+    """Una fila por ítem (las ventas sin ítems salen con los campos item_ vacíos)."""
+    q = (
+        db.session.query(
+            Venta.id, Venta.cliente_id, Cliente.documento,
+            *[getattr(Venta, c) for c in CAMPOS_VENTA],
+            *[getattr(VentaItem, c) for c in CAMPOS_ITEM],
+        )
+        .outerjoin(Cliente, Cliente.id == Venta.cliente_id)
+        .outerjoin(VentaItem, VentaItem.venta_id == Venta.id)
+        .order_by(Venta.id, VentaItem.id)
+        .yield_per(LOTE_EXPORTACION)
+    )
+    for fila in q:
+        yield dict(zip(COLUMNAS["ventas"], fila))
+
+
+def _filas_pagos():
+    q = (
+        db.session.query(
+            PagoCliente.id, PagoCliente.cliente_id, Cliente.documento,
+            *[getattr(PagoCliente, c) for c in CAMPOS_PAGO],
+        )
+        .outerjoin(Cliente, Cliente.id == PagoCliente.cliente_id)
+        .order_by(PagoCliente.id)
+        .yield_per(LOTE_EXPORTACION)
+    )
+    for fila in q:
+        yield dict(zip(COLUMNAS["pagos"], fila))
+
+
+def _ventas_con_items(filas):
+    """Agrupa las filas por venta: un dict por venta con la lista `items`."""
+    for _, grupo in groupby(filas, key=lambda f: f["id"]):
+        grupo = list(grupo)
+        venta = {k: v for k, v in grupo[0].items() if not k.startswith("item_")}
+        venta["items"] = [
+            {c: f[f"item_{c}"] for c in CAMPOS_ITEM}
+            for f in grupo if f["item_cantidad"] is not None
+        ]
+        yield venta
+
+
+def _serializar(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    raise TypeError(f"No serializable: {type(valor)}")
+
+
+def exportar(entidad, formato):
+    """
+    Generador de texto con todos los registros de `entidad`.
+
+    Lee con cursor del lado del servidor y va entregando de a
+    LOTE_EXPORTACION filas, así la memoria no crece con la tabla.
+    """
+    filas = {"clientes": _filas_clientes, "ventas": _filas_ventas, "pagos": _filas_pagos}[entidad]()
+
+    if formato == "jsonl":
+        if entidad == "ventas":
+            filas = _ventas_con_items(filas)
+        buffer = []
+        for fila in filas:
+            buffer.append(json.dumps(fila, default=_serializar, ensure_ascii=False))
+            if len(buffer) >= LOTE_EXPORTACION:
+                yield "\n".join(buffer) + "\n"
+                buffer = []
+        if buffer:
+            yield "\n".join(buffer) + "\n"
+        return
+
+    salida = io.StringIO()
+    escritor = csv.DictWriter(salida, fieldnames=COLUMNAS[entidad])
+    escritor.writeheader()
+    for n, fila in enumerate(filas, start=1):
+        escritor.writerow({k: v.isoformat() if isinstance(v, (datetime, date)) else v for k, v in fila.items()})
+        if n % LOTE_EXPORTACION == 0:
+            yield salida.getvalue()
+            salida.seek(0)
+            salida.truncate()
+    yield salida.getvalue()
+
+
+# ---------- IMPORTACIÓN ----------
+
+class _RegistroInvalido:
+    """Línea de JSONL que no se pudo leer como objeto: se informa y se saltea."""
+    def __init__(self, mensaje):
+        self.mensaje = mensaje
+
+
+def _leer(archivo, formato):
+    """
+    Registros (dicts) de un archivo CSV o JSONL, de a uno, sin cargarlo entero.
+    Las líneas de JSONL inválidas o que no son un objeto llegan como _RegistroInvalido.
+    """
+    texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", newline="")
+    if formato == "jsonl":
+        for n, linea in enumerate(texto, start=1):
+            if not linea.strip():
+                continue
+            try:
+                registro = json.loads(linea)
+            except json.JSONDecodeError:
+                yield _RegistroInvalido(f"línea {n}: JSON inválido")
+                continue
+            if isinstance(registro, dict):
+                yield registro
+            else:
+                yield _RegistroInvalido(f"línea {n}: el registro no es un objeto")
+    else:
+        yield from csv.DictReader(texto)
+
+
+def _validos(lote):
+    return [r for r in lote if isinstance(r, dict)]
+
+
+def _registro_leido(registro, resumen):
+    """Cuenta el registro; False (y lo informa) si no se pudo leer."""
+    resumen.numero += 1
+    if isinstance(registro, _RegistroInvalido):
+        resumen.error(registro.mensaje)
+        return False
+    return True
+
+
+def _numero(valor):
+    """Igual que safe_float, pero acepta también números (JSONL)."""
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    return safe_float(valor if isinstance(valor, str) else None)
+
+
+def _texto(valor):
+    if valor is None:
+        return None
+    valor = str(valor).strip()
+    return valor or None
+
+
+def _fecha(valor):
+    valor = _texto(valor)
+    if not valor:
+        return ahora()
+    # Sin zona horaria se toma como hora de Buenos Aires
+    return a_local(datetime.fromisoformat(valor))
+
+
+def _fecha_abierta(valor, inicio):
+    """Fecha del registro: ValueError si es inválida, OperacionRechazada si cae en un período cerrado."""
+    fecha = _fecha(valor)
+    if inicio is not None and fecha < inicio:
+        raise OperacionRechazada(f"la fecha cae en un período cerrado (antes del {inicio:%d/%m/%Y})")
+    return fecha
+
+
+def _ajustar_saldos(deltas):
+    """Suma a saldo_cliente lo que agregó el lote a cada cliente (sin commit)."""
+    # En orden de id, como verificar_limite: sin bloqueos cruzados con las ventas
+    for cliente_id in sorted(deltas):
+        ajustar_saldo(cliente_id, deltas[cliente_id])
+
+
+def _lotes(registros, tamaño=LOTE_IMPORTACION):
+    lote = []
+    for registro in registros:
+        lote.append(registro)
+        if len(lote) >= tamaño:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def _agrupar_ventas_csv(filas):
+    """En CSV cada fila es un ítem: se juntan las filas consecutivas de la misma venta."""
+    for _, grupo in groupby(enumerate(filas, start=1), key=lambda nf: nf[1].get("id") or f"sin-id-{nf[0]}"):
+        grupo = list(grupo)
+        venta = {k: v for k, v in grupo[0][1].items() if not k.startswith("item_")}
+        venta["items"] = [
+            {c: f.get(f"item_{c}") for c in CAMPOS_ITEM}
+            for _, f in grupo if _texto(f.get("item_cantidad"))
+        ]
+        yield venta
+
+
+class _Resumen:
+    def __init__(self):
+        self.insertados = 0
+        self.errores = []
+        self.numero = 0
+
+    def error(self, mensaje):
+        if len(self.errores) < MAX_ERRORES:
+            self.errores.append({"registro": self.numero, "error": mensaje})
+
+    def como_dict(self):
+        return {"insertados": self.insertados, "errores": self.errores}
+
+
+def _clientes_por_referencia(registros):
+    """{documento: id} y el conjunto de ids existentes para los clientes que nombra el lote."""
+    registros = _validos(registros)
+    documentos = {_texto(r.get("cliente_documento")) for r in registros} - {None}
+    ids = {int(r["cliente_id"]) for r in registros if str(r.get("cliente_id") or "").isdigit()}
+    por_documento = dict(
+        db.session.query(Cliente.documento, Cliente.id).filter(Cliente.documento.in_(documentos))
+    ) if documentos else {}
+    existentes = {i for (i,) in db.session.query(Cliente.id).filter(Cliente.id.in_(ids))} if ids else set()
+    return por_documento, existentes
+
+
+def _resolver_cliente(registro, por_documento, existentes):
+    # El documento manda: los ids de otra sucursal no coinciden con los de esta base
+    documento = _texto(registro.get("cliente_documento"))
+    if documento:
+        return por_documento.get(documento)
+    cliente_id = str(registro.get("cliente_id") or "")
+    if cliente_id.isdigit() and int(cliente_id) in existentes:
+        return int(cliente_id)
+    return None
+
+
+def _importar_clientes(registros, resumen):
+    for lote in _lotes(registros):
+        documentos = {_texto(r.get("documento")) for r in _validos(lote)} - {None}
+        ya_cargados = {
+            d for (d,) in db.session.query(Cliente.documento).filter(Cliente.documento.in_(documentos))
+        } if documentos else set()
+
+        clientes, garantes = [], []
+        for registro in lote:
+            if not _registro_leido(registro, resumen):
+                continue
+            nombre = _texto(registro.get("nombre"))
+            documento = _texto(registro.get("documento"))
+            if not nombre:
+                resumen.error("falta el nombre")
+                continue
+            if documento and documento in ya_cargados:
+                resumen.error(f"ya existe un cliente con documento {documento}")
+                continue
+            ya_cargados.add(documento)
+
+            clientes.append({
+                "nombre": nombre,
+                "domicilio": _texto(registro.get("domicilio")),
+                "localidad": _texto(registro.get("localidad")),
+                "documento": documento,
+                "telefono": _texto(registro.get("telefono")),
+                "ingresos": _numero(registro.get("ingresos")),
+                "lugar_trabajo": _texto(registro.get("lugar_trabajo")),
+                "monto_autorizado": _numero(registro.get("monto_autorizado")),
+            })
+            garantes.append({
+                "nombre": _texto(registro.get("garante_nombre")),
+                "domicilio": _texto(registro.get("garante_domicilio")),
+                "localidad": _texto(registro.get("garante_localidad")),
+                "documento": _texto(registro.get("garante_documento")),
+                "telefono": _texto(registro.get("garante_telefono")),
+                "ingresos": _numero(registro.get("garante_ingresos")),
+                "lugar_trabajo": _texto(registro.get("garante_lugar_trabajo")),
+            })
+
+        if not clientes:
+            continue
+        ids = db.session.execute(
+            insert(Cliente).returning(Cliente.id, sort_by_parameter_order=True), clientes
+        ).scalars().all()
+        db.session.execute(insert(SaldoCliente), [{"cliente_id": i, "saldo": 0} for i in ids])
+        garantes = [dict(g, cliente_id=i) for g, i in zip(garantes, ids) if g["nombre"]]
+        if garantes:
+            db.session.execute(insert(Garante), garantes)
+        db.session.commit()
+        resumen.insertados += len(ids)
+
+
+def _importar_pagos(registros, resumen):
+    afectados = set()
+    inicio = inicio_periodo()
+    for lote in _lotes(registros):
+        por_documento, existentes = _clientes_por_referencia(lote)
+        pagos = []
+        for registro in lote:
+            if not _registro_leido(registro, resumen):
+                continue
+            cliente_id = _resolver_cliente(registro, por_documento, existentes)
+            monto = _numero(registro.get("monto"))
+            if cliente_id is None:
+                resumen.error("cliente inexistente")
+                continue
+            if not monto or monto <= 0:
+                resumen.error("monto inválido")
+                continue
+            try:
+                fecha = _fecha_abierta(registro.get("fecha"), inicio)
+            except OperacionRechazada as e:
+                resumen.error(str(e))
+                continue
+            except ValueError:
+                resumen.error("fecha inválida")
+                continue
+            pagos.append({
+                "cliente_id": cliente_id,
+                "fecha": fecha,
+                "monto": monto,
+                "metodo_pago": _texto(registro.get("metodo_pago")),
+            })
+            afectados.add(cliente_id)
+
+        if pagos:
+            db.session.execute(insert(PagoCliente), pagos)
+            deltas = {}
+            for pago in pagos:
+                deltas[pago["cliente_id"]] = deltas.get(pago["cliente_id"], 0) - pago["monto"]
+            _ajustar_saldos(deltas)
+            sumar_lote_a_caja("pago", pagos)
+            db.session.commit()
+            resumen.insertados += len(pagos)
+    return afectados
+
+
+def _importar_ventas(registros, resumen):
+    afectados = set()
+    inicio = inicio_periodo()
+    for lote in _lotes(registros):
+        por_documento, existentes = _clientes_por_referencia(lote)
+        ventas, items_por_venta = [], []
+        for registro in lote:
+            if not _registro_leido(registro, resumen):
+                continue
+            cliente_id = _resolver_cliente(registro, por_documento, existentes)
+            if cliente_id is None:
+                resumen.error("cliente inexistente")
+                continue
+            try:
+                fecha = _fecha_abierta(registro.get("fecha"), inicio)
+            except OperacionRechazada as e:
+                resumen.error(str(e))
+                continue
+            except ValueError:
+                resumen.error("fecha inválida")
+                continue
+
+            items = []
+            lista = registro.get("items") or []
+            for item in lista if isinstance(lista, list) else [None]:
+                if not isinstance(item, dict):
+                    items = None
+                    break
+                cantidad = _numero(item.get("cantidad"))
+                precio = _numero(item.get("precio_unitario"))
+                # venta_items.cantidad es entera: no se trunca en silencio
+                if cantidad is None or precio is None or cantidad <= 0 or not cantidad.is_integer():
+                    items = None
+                    break
+                total_item = _numero(item.get("total"))
+                items.append({
+                    "cantidad": int(cantidad),
+                    "descripcion": _texto(item.get("descripcion")),
+                    "precio_unitario": precio,
+                    "total": total_item if total_item is not None else cantidad * precio,
+                })
+            if items is None:
+                resumen.error("ítem inválido")
+                continue
+
+            total = sum(i["cantidad"] * i["precio_unitario"] for i in items) if items else _numero(registro.get("total"))
+            if total is None:
+                resumen.error("falta el total")
+                continue
+            pago_a_cuenta = _numero(registro.get("pago_a_cuenta")) or 0.0
+
+            ventas.append({
+                "cliente_id": cliente_id,
+                "fecha": fecha,
+                "total": total,
+                "pago_a_cuenta": pago_a_cuenta,
+                "saldo_resultante": total - pago_a_cuenta,
+                "descripcion": _texto(registro.get("descripcion")),
+                "metodo_pago": _texto(registro.get("metodo_pago")),
+            })
+            items_por_venta.append(items)
+            afectados.add(cliente_id)
+
+        if not ventas:
+            continue
+        ids = db.session.execute(
+            insert(Venta).returning(Venta.id, sort_by_parameter_order=True), ventas
+        ).scalars().all()
+        insertar_items([dict(item, venta_id=i) for i, items in zip(ids, items_por_venta) for item in items])
+        deltas = {}
+        for venta in ventas:
+            deltas[venta["cliente_id"]] = deltas.get(venta["cliente_id"], 0) + venta["saldo_resultante"]
+        _ajustar_saldos(deltas)
+        sumar_lote_a_caja("venta", ventas)
+        db.session.commit()
+        resumen.insertados += len(ids)
+    return afectados
+
+
+def importar(entidad, archivo, formato):
+    """
+    Importa un archivo CSV/JSONL (mismo formato que `exportar`) en lotes.
+
+    Los registros inválidos (o con fecha en un período cerrado) se saltean y
+    se informan. Cada lote suma al saldo de sus clientes y a caja_diaria en la
+    misma transacción en que se inserta; al final se recalculan los snapshots
+    de los clientes importados. Devuelve el resumen.
+    """
+    resumen = _Resumen()
+    registros = _leer(archivo, formato)
+
+    if entidad == "clientes":
+        _importar_clientes(registros, resumen)
+        return resumen.como_dict()
+
+    if entidad == "ventas":
+        if formato == "csv":
+            registros = _agrupar_ventas_csv(registros)
+        afectados = _importar_ventas(registros, resumen)
+    else:
+        afectados = _importar_pagos(registros, resumen)
+
+    if afectados:
+        for n, cliente_id in enumerate(afectados, start=1):
+            recalcular_snapshots(cliente_id)
+            if n % 200 == 0:
+                db.session.commit()
+        db.session.commit()
+
+    return resumen.como_dict()
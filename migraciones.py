@@ -0,0 +1,324 @@
+from datetime import date, timezone
+from sqlalchemy import inspect, select, update, table, column, bindparam, DateTime, Integer
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.sql import text
+from models import (
+    db, Cliente, Garante, Venta, VentaItem, PagoCliente, SaldoCliente, CajaDiaria, CajaMovimiento, Migracion, Usuario,
+    ClienteArchivo, Tarea
+)
+from caja_diaria import reconstruir_caja
+from saldos import recalcular_snapshots, reconstruir_saldos
+from fechas import FechaHora, TZ_AR, ahora, rango_dias
+
+
+# db.create_all() solo crea tablas nuevas: todo cambio sobre tablas existentes
+# va acá como una migración numerada. Cada migración tiene que poder correrse
+# de nuevo sin romper nada (IF NOT EXISTS, chequeo de columnas, etc.).
+
+
+def _ejecutar(sentencias):
+    with db.engine.begin() as conn:
+        for sentencia in sentencias:
+            conn.execute(text(sentencia))
+
+
+def _columnas_snapshot():
+    inspector = inspect(db.engine)
+    sentencias = []
+    for tabla in (Venta.__tablename__, PagoCliente.__tablename__):
+        existentes = {c["name"] for c in inspector.get_columns(tabla)}
+        for columna in ("saldo_anterior", "saldo_posterior"):
+            if columna not in existentes:
+                sentencias.append(f"ALTER TABLE {tabla} ADD COLUMN {columna} FLOAT")
+    _ejecutar(sentencias)
+
+
+def _indices_busqueda():
+    if db.engine.dialect.name == "postgresql":
+        _ejecutar([
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            "CREATE INDEX IF NOT EXISTS ix_cliente_nombre_trgm ON cliente USING gin (nombre gin_trgm_ops)",
+            "CREATE INDEX IF NOT EXISTS ix_cliente_documento_trgm ON cliente USING gin (documento gin_trgm_ops)",
+        ])
+    else:
+        _ejecutar([
+            "CREATE INDEX IF NOT EXISTS ix_cliente_nombre_nocase ON cliente (nombre COLLATE NOCASE)",
+            "CREATE INDEX IF NOT EXISTS ix_cliente_documento_nocase ON cliente (documento COLLATE NOCASE)",
+        ])
+
+
+def _indices_compuestos():
+    # Los mismos índices que declara models.py, para bases creadas antes
+    _ejecutar([
+        "CREATE INDEX IF NOT EXISTS ix_ventas2_cliente_fecha_id ON ventas2 (cliente_id, fecha, id)",
+        "CREATE INDEX IF NOT EXISTS ix_ventas2_fecha ON ventas2 (fecha)",
+        "CREATE INDEX IF NOT EXISTS ix_pagos_clientes_cliente_fecha_id ON pagos_clientes (cliente_id, fecha, id)",
+        "CREATE INDEX IF NOT EXISTS ix_pagos_clientes_fecha ON pagos_clientes (fecha)",
+        "CREATE INDEX IF NOT EXISTS ix_venta_items_venta_id ON venta_items (venta_id)",
+        "CREATE INDEX IF NOT EXISTS ix_garante_cliente_id ON garante (cliente_id)",
+    ])
+
+
+def _caja_diaria_inicial():
+    if not db.session.query(CajaDiaria.query.exists()).scalar():
+        reconstruir_caja()
+
+
+def _fks_sin_cascade(inspector):
+    """Tablas hijas cuyas claves foráneas todavía no tienen ON DELETE CASCADE."""
+    pendientes = []
+    for modelo in (Garante, Venta, VentaItem, PagoCliente, SaldoCliente):
+        tabla = modelo.__tablename__
+        for fk in inspector.get_foreign_keys(tabla):
+            if (fk.get("options") or {}).get("ondelete", "").upper() != "CASCADE":
+                pendientes.append((modelo.__table__, fk))
+    return pendientes
+
+
+def _borrado_en_cascada():
+    inspector = inspect(db.engine)
+    pendientes = _fks_sin_cascade(inspector)
+    if not pendientes:
+        return
+
+    if db.engine.dialect.name == "postgresql":
+        sentencias = []
+        for tabla, fk in pendientes:
+            columnas = ", ".join(fk["constrained_columns"])
+            referidas = ", ".join(fk["referred_columns"])
+            sentencias += [
+                f"ALTER TABLE {tabla.name} DROP CONSTRAINT {fk['name']}",
+                f"ALTER TABLE {tabla.name} ADD CONSTRAINT {fk['name']} FOREIGN KEY ({columnas}) "
+                f"REFERENCES {fk['referred_table']} ({referidas}) ON DELETE CASCADE",
+            ]
+        _ejecutar(sentencias)
+        return
+
+    # SQLite no permite cambiar una clave foránea: se rehace la tabla
+    # (crear la nueva, copiar, borrar la vieja, renombrar y recrear índices).
+    tablas = {tabla.name: tabla for tabla, _ in pendientes}
+    with db.engine.connect() as conn:
+        # PRAGMA foreign_keys no tiene efecto dentro de una transacción
+        conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        conn.commit()
+        try:
+            with conn.begin():
+                for nombre, tabla in tablas.items():
+                    existentes = {c["name"] for c in inspector.get_columns(nombre)}
+                    columnas = ", ".join(c.name for c in tabla.columns if c.name in existentes)
+                    ddl = str(CreateTable(tabla).compile(dialect=db.engine.dialect))
+                    conn.exec_driver_sql(ddl.replace(f"CREATE TABLE {nombre} ", f"CREATE TABLE {nombre}_nueva ", 1))
+                    conn.exec_driver_sql(f"INSERT INTO {nombre}_nueva ({columnas}) SELECT {columnas} FROM {nombre}")
+                    conn.exec_driver_sql(f"DROP TABLE {nombre}")
+                    conn.exec_driver_sql(f"ALTER TABLE {nombre}_nueva RENAME TO {nombre}")
+                    for indice in tabla.indexes:
+                        indice.create(conn)
+        finally:
+            conn.exec_driver_sql("PRAGMA foreign_keys=ON")
+            conn.commit()
+
+
+def _version_usuarios():
+    existentes = {c["name"] for c in inspect(db.engine).get_columns(Usuario.__tablename__)}
+    if "version" not in existentes:
+        _ejecutar([f"ALTER TABLE {Usuario.__tablename__} ADD COLUMN version INTEGER NOT NULL DEFAULT 1"])
+
+
+def _version_comprobantes():
+    inspector = inspect(db.engine)
+    sentencias = []
+    for tabla in (Cliente.__tablename__, ClienteArchivo.name):
+        if not inspector.has_table(tabla):
+            continue
+        existentes = {c["name"] for c in inspector.get_columns(tabla)}
+        if "version_comprobantes" not in existentes:
+            sentencias.append(f"ALTER TABLE {tabla} ADD COLUMN version_comprobantes INTEGER NOT NULL DEFAULT 1")
+        if "comprobantes_modificados" not in existentes:
+            sentencias.append(f"ALTER TABLE {tabla} ADD COLUMN comprobantes_modificados TIMESTAMP")
+    _ejecutar(sentencias)
+
+
+# Hasta la migración 8 estas columnas guardaban hora de Buenos Aires sin zona
+# (ventas y lo que se calcula a partir de ellas); las demás, UTC sin zona.
+_FECHAS_LOCALES = {
+    "ventas2": ("fecha",),
+    "ventas2_archivo": ("fecha",),
+    "saldo_apertura": ("desde", "primera_impaga"),
+    "cierres_periodo": ("hasta",),
+}
+
+
+def _columnas_fecha(inspector):
+    """{tabla: [columnas FechaHora]} de las tablas que existen en la base."""
+    columnas = {}
+    for tabla in db.metadata.sorted_tables:
+        if not inspector.has_table(tabla.name):
+            continue
+        existentes = {c["name"]: c["type"] for c in inspector.get_columns(tabla.name)}
+        for c in tabla.columns:
+            if isinstance(c.type, FechaHora) and c.name in existentes:
+                # Postgres: las que ya son timestamptz no se tocan
+                if not getattr(existentes[c.name], "timezone", False):
+                    columnas.setdefault(tabla.name, []).append(c.name)
+    return columnas
+
+
+def _fechas_con_zona():
+    inspector = inspect(db.engine)
+    columnas = _columnas_fecha(inspector)
+
+    if db.engine.dialect.name == "postgresql":
+        sentencias = []
+        for tabla, nombres in columnas.items():
+            cambios = ", ".join(
+                f"ALTER COLUMN {c} TYPE timestamptz USING {c} AT TIME ZONE "
+                f"'{TZ_AR.zone if c in _FECHAS_LOCALES.get(tabla, ()) else 'UTC'}'"
+                for c in nombres
+            )
+            # Un solo ALTER por tabla: se reescribe (con sus índices) una vez
+            sentencias.append(f"ALTER TABLE {tabla} {cambios}")
+        _ejecutar(sentencias)
+    else:
+        # SQLite no tiene tipo con zona: se pasan a UTC los valores en hora local
+        with db.engine.begin() as conn:
+            for tabla, nombres in _FECHAS_LOCALES.items():
+                for nombre in nombres:
+                    if nombre not in columnas.get(tabla, ()):
+                        continue
+                    t = table(tabla, column("rowid", Integer), column(nombre, DateTime()))
+                    filas = conn.execute(select(t.c.rowid, t.c[nombre]).where(t.c[nombre].is_not(None))).all()
+                    valores = [
+                        {"fila": fila, "utc": TZ_AR.localize(valor).astimezone(timezone.utc).replace(tzinfo=None)}
+                        for fila, valor in filas
+                    ]
+                    if valores:
+                        conn.execute(update(t).where(t.c.rowid == bindparam("fila")).values({nombre: bindparam("utc")}), valores)
+
+    # Los pagos pasan a quedar antes que las ventas de las 3 horas siguientes:
+    # cambian los días de caja y el orden de la línea de tiempo
+    reconstruir_caja()
+    for (cliente_id,) in db.session.query(Cliente.id).all():
+        recalcular_snapshots(cliente_id)
+    db.session.commit()
+
+
+def _saldos_iniciales():
+    # Clientes cargados antes del ledger (o sin fila en saldo_cliente)
+    reconstruir_saldos()
+
+
+MIGRACIONES = [
+    (1, "Columnas saldo_anterior/saldo_posterior en ventas y pagos", _columnas_snapshot),
+    (2, "Índices del buscador de clientes", _indices_busqueda),
+    (3, "Índices compuestos de ventas, pagos, ítems y garantes", _indices_compuestos),
+    (4, "Carga inicial de caja_diaria", _caja_diaria_inicial),
+    (5, "ON DELETE CASCADE en las tablas que dependen de cliente y de ventas", _borrado_en_cascada),
+    (6, "Columna version en usuarios", _version_usuarios),
+    (7, "Versión de los comprobantes de cada cliente", _version_comprobantes),
+    (8, "Fechas con zona horaria (UTC) en todas las tablas", _fechas_con_zona),
+    (9, "Carga de saldo_cliente para los clientes existentes", _saldos_iniciales),
+]
+
+
+# Migraciones que solo convierten datos con el formato viejo: en una base
+# cuyas tablas crea create_all ya no hay nada que convertir
+_SOLO_DATOS_VIEJOS = (8,)
+
+
+def crear_tablas():
+    """
+    Crea las tablas que falten en la base principal (la réplica es de solo
+    lectura). Si la base estaba vacía, nace con el formato actual y las
+    migraciones de _SOLO_DATOS_VIEJOS se marcan aplicadas: correrlas después
+    (por ejemplo `flask esquema` y luego `flask migrar`) correría las fechas
+    nuevas otras 3 horas.
+    """
+    nueva = not inspect(db.engine).has_table(Venta.__tablename__)
+    db.create_all(bind_key=None)
+    if nueva:
+        for version, descripcion, _ in MIGRACIONES:
+            if version in _SOLO_DATOS_VIEJOS and db.session.get(Migracion, version) is None:
+                db.session.add(Migracion(version=version, descripcion=descripcion))
+        db.session.commit()
+
+
+def migraciones_pendientes():
+    aplicadas = {v for (v,) in db.session.query(Migracion.version)}
+    return [m for m in MIGRACIONES if m[0] not in aplicadas]
+
+
+def aplicar_migraciones(log=print):
+    """
+    Crea las tablas que falten y aplica en orden las migraciones pendientes.
+    Devuelve cuántas migraciones aplicó.
+    """
+    crear_tablas()
+    pendientes = migraciones_pendientes()
+    for version, descripcion, migrar in pendientes:
+        log(f"Aplicando migración {version}: {descripcion}")
+        migrar()
+        db.session.add(Migracion(version=version, descripcion=descripcion))
+        db.session.commit()
+    return len(pendientes)
+
+
+# ---------- PLANES DE CONSULTA ----------
+# Consultas de las rutas más usadas que tienen que resolverse con un índice.
+
+def _consultas_criticas():
+    # Rango semiabierto de días de Buenos Aires, como los reportes y la API
+    desde, hasta = rango_dias(date(2024, 1, 1), date(2024, 1, 31))
+    return {
+        "ventas por cliente": select(Venta.id).where(Venta.cliente_id == 1).order_by(Venta.fecha, Venta.id),
+        "pagos por cliente": select(PagoCliente.id).where(PagoCliente.cliente_id == 1).order_by(PagoCliente.fecha, PagoCliente.id),
+        "ítems de ventas": select(VentaItem.id).where(VentaItem.venta_id.in_([1, 2, 3])),
+        "ventas por fecha": select(Venta.id).where(Venta.fecha >= desde, Venta.fecha < hasta),
+        "pagos por fecha": select(PagoCliente.id).where(PagoCliente.fecha >= desde, PagoCliente.fecha < hasta),
+        "ventas de un cliente por fecha": select(Venta.id).where(
+            Venta.cliente_id == 1, Venta.fecha >= desde, Venta.fecha < hasta),
+        "caja por fecha": select(CajaDiaria.total).where(CajaDiaria.fecha >= "2024-01-01", CajaDiaria.fecha <= "2024-01-31"),
+        "caja sin consolidar por fecha": select(CajaMovimiento.total).where(
+            CajaMovimiento.fecha >= "2024-01-01", CajaMovimiento.fecha <= "2024-01-31"),
+        "cliente por id": select(Cliente.nombre).where(Cliente.id == 1),
+        "próxima tarea": select(Tarea.id).where(Tarea.estado == "pendiente", Tarea.disponible <= ahora())
+                         .order_by(Tarea.disponible, Tarea.id).limit(1),
+    }
+
+
+def _plan(conn, consulta):
+    compilada = consulta.compile(dialect=db.engine.dialect, compile_kwargs={"render_postcompile": True})
+    parametros = compilada.params
+    if compilada.positiontup:
+        parametros = tuple(parametros[nombre] for nombre in compilada.positiontup)
+
+    if db.engine.dialect.name == "postgresql":
+        filas = conn.exec_driver_sql("EXPLAIN " + str(compilada), parametros).all()
+        return [f[0] for f in filas]
+    filas = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + str(compilada), parametros).all()
+    return [f[-1] for f in filas]
+
+
+def _es_escaneo_completo(linea):
+    if db.engine.dialect.name == "postgresql":
+        return "Seq Scan" in linea
+    # En SQLite "SCAN" es recorrer la tabla o un índice completo; "SEARCH" usa el índice
+    return linea.startswith("SCAN ") and linea != "SCAN CONSTANT ROW"
+
+
+def verificar_planes():
+    """
+    Devuelve {consulta: plan} de las consultas críticas que recorren una
+    tabla entera. Vacío si todas usan índices.
+
+    En Postgres se desactiva seq scan para la sesión: en tablas chicas el
+    planner lo elige igual, lo que interesa es que exista el camino por índice.
+    """
+    problemas = {}
+    with db.engine.connect() as conn:
+        if db.engine.dialect.name == "postgresql":
+            conn.exec_driver_sql("SET enable_seqscan = off")
+        for nombre, consulta in _consultas_criticas().items():
+            plan = _plan(conn, consulta)
+            if any(_es_escaneo_completo(linea) for linea in plan):
+                problemas[nombre] = plan
+    return problemas
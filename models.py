@@ -1,10 +1,43 @@
+from flask import g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func
-from datetime import datetime, timezone
+from flask_sqlalchemy.session import Session
+import sqlite3
+from sqlalchemy import func, event
+from sqlalchemy.engine import Engine
+from fechas import FechaHora, ahora
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 
-db = SQLAlchemy()
+# Bind de SQLALCHEMY_BINDS con la réplica de solo lectura (DATABASE_REPLICA_URL)
+REPLICA = "replica"
+
+
+class SesionConReplica(Session):
+    """
+    Sesión que manda las lecturas a la réplica mientras g.usar_replica esté
+    activo (ver replica.py). Los flush y los INSERT/UPDATE/DELETE siempre van
+    a la base principal.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        escritura = self._flushing or getattr(clause, "is_dml", False)
+        if escritura:
+            self.info["escribio"] = True
+        elif bind is None and has_app_context() and g.get("usar_replica"):
+            replica = self._db.engines.get(REPLICA)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={"class_": SesionConReplica})
+
+
+# SQLite no aplica las claves foráneas (ni ON DELETE CASCADE) si no se activan por conexión
+@event.listens_for(Engine, "connect")
+def _activar_claves_foraneas(dbapi_conn, connection_record):
+    if isinstance(dbapi_conn, sqlite3.Connection):
+        dbapi_conn.execute("PRAGMA foreign_keys=ON")
 
 
 class Cliente(db.Model):
@@ -19,18 +52,32 @@ class Cliente(db.Model):
     lugar_trabajo = db.Column(db.String(120))
     monto_autorizado = db.Column(db.Float)
 
+    # Sube cada vez que cambia algo que muestran sus comprobantes (ver comprobantes.py)
+    version_comprobantes = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+    comprobantes_modificados = db.Column(FechaHora)
+
+    # Las filas hijas las borra la base (ON DELETE CASCADE): passive_deletes
+    # evita que el ORM las cargue una por una antes de borrar al cliente.
+
     # Relación 1 a 1 con Garante
-    garante = db.relationship("Garante", backref="cliente", uselist=False, cascade="all, delete-orphan")
+    garante = db.relationship("Garante", backref="cliente", uselist=False, cascade="all, delete-orphan",
+                              passive_deletes=True)
 
     # Relación 1 a muchos con Ventas y Pagos
-    ventas = db.relationship("Venta", cascade="all, delete-orphan")
-    pagos = db.relationship("PagoCliente", cascade="all, delete-orphan")
+    ventas = db.relationship("Venta", cascade="all, delete-orphan", passive_deletes=True)
+    pagos = db.relationship("PagoCliente", cascade="all, delete-orphan", passive_deletes=True)
+
+    # Saldo persistido (se mantiene en cada venta/pago, ver saldos.py)
+    saldo_cuenta = db.relationship("SaldoCliente", uselist=False, lazy="joined", cascade="all, delete-orphan",
+                                   passive_deletes=True)
 
     @property
     def saldo_deudor(self):
-        total_deuda = sum((v.total or 0) - (v.pago_a_cuenta or 0) for v in self.ventas)
-        total_pagos = sum(p.monto for p in self.pagos)
-        return round(total_deuda - total_pagos, 2)
+        if self.saldo_cuenta is None:
+            # Cliente sin fila en saldo_cliente (base sin migrar): se calcula
+            from saldos import calcular_saldo
+            return round(calcular_saldo(self.id), 2)
+        return round(self.saldo_cuenta.saldo or 0, 2)
 
 
 class Garante(db.Model):
@@ -44,14 +91,18 @@ class Garante(db.Model):
     ingresos = db.Column(db.Float)
     lugar_trabajo = db.Column(db.String(120))
 
-    cliente_id = db.Column(db.Integer, db.ForeignKey("cliente.id"))
+    cliente_id = db.Column(db.Integer, db.ForeignKey("cliente.id", ondelete="CASCADE"), index=True)
 
 
 class Venta(db.Model):
     __tablename__ = "ventas2"
+    __table_args__ = (
+        db.Index("ix_ventas2_cliente_fecha_id", "cliente_id", "fecha", "id"),
+        db.Index("ix_ventas2_fecha", "fecha"),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    cliente_id = db.Column(db.Integer, db.ForeignKey("cliente.id"))
-    fecha = db.Column(db.DateTime, default=datetime.utcnow)
+    cliente_id = db.Column(db.Integer, db.ForeignKey("cliente.id", ondelete="CASCADE"))
+    fecha = db.Column(FechaHora, default=ahora)
 
     total = db.Column(db.Float)
     pago_a_cuenta = db.Column(db.Float)
@@ -59,14 +110,18 @@ class Venta(db.Model):
     descripcion = db.Column(db.Text)
     metodo_pago = db.Column(db.String(50))  # efectivo, debito, etc.
 
+    # Saldo de la cuenta del cliente antes y después de esta venta
+    saldo_anterior = db.Column(db.Float)
+    saldo_posterior = db.Column(db.Float)
+
     # Relación con items
-    items = db.relationship("VentaItem", back_populates="venta", cascade="all, delete-orphan")
+    items = db.relationship("VentaItem", back_populates="venta", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class VentaItem(db.Model):
     __tablename__ = "venta_items"
     id = db.Column(db.Integer, primary_key=True)
-    venta_id = db.Column(db.Integer, db.ForeignKey("ventas2.id"), nullable=False)
+    venta_id = db.Column(db.Integer, db.ForeignKey("ventas2.id", ondelete="CASCADE"), nullable=False, index=True)
     cantidad = db.Column(db.Integer)
     descripcion = db.Column(db.Text)
     precio_unitario = db.Column(db.Float)
@@ -77,12 +132,133 @@ class VentaItem(db.Model):
 
 class PagoCliente(db.Model):
     __tablename__ = "pagos_clientes"
+    __table_args__ = (
+        db.Index("ix_pagos_clientes_cliente_fecha_id", "cliente_id", "fecha", "id"),
+        db.Index("ix_pagos_clientes_fecha", "fecha"),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    cliente_id = db.Column(db.Integer, db.ForeignKey("cliente.id"), nullable=False)
-    fecha = db.Column(db.DateTime, default=datetime.utcnow)
+    cliente_id = db.Column(db.Integer, db.ForeignKey("cliente.id", ondelete="CASCADE"), nullable=False)
+    fecha = db.Column(FechaHora, default=ahora)
     monto = db.Column(db.Float, nullable=False)
     metodo_pago = db.Column(db.String(50))
 
+    # Saldo de la cuenta del cliente antes y después de este pago
+    saldo_anterior = db.Column(db.Float)
+    saldo_posterior = db.Column(db.Float)
+
+
+class SaldoCliente(db.Model):
+    __tablename__ = "saldo_cliente"
+    cliente_id = db.Column(db.Integer, db.ForeignKey("cliente.id", ondelete="CASCADE"), primary_key=True)
+    saldo = db.Column(db.Float, nullable=False, default=0)
+    actualizado = db.Column(FechaHora, default=ahora, onupdate=ahora)
+
+
+# Totales de caja por día, método de pago y origen (ver caja_diaria.py)
+class CajaDiaria(db.Model):
+    __tablename__ = "caja_diaria"
+    fecha = db.Column(db.Date, primary_key=True)
+    metodo_pago = db.Column(db.String(50), primary_key=True, default="")
+    origen = db.Column(db.String(10), primary_key=True)  # venta, pago
+    total = db.Column(db.Float, nullable=False, default=0)  # total vendido
+    ingresado = db.Column(db.Float, nullable=False, default=0)  # dinero que entró
+    cantidad = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Aportes de cada operación a caja_diaria todavía sin consolidar (ver caja_diaria.py)
+class CajaMovimiento(db.Model):
+    __tablename__ = "caja_movimientos"
+    id = db.Column(db.Integer, primary_key=True)
+    fecha = db.Column(db.Date, nullable=False, index=True)
+    metodo_pago = db.Column(db.String(50), nullable=False, default="")
+    origen = db.Column(db.String(10), nullable=False)
+    total = db.Column(db.Float, nullable=False, default=0)
+    ingresado = db.Column(db.Float, nullable=False, default=0)
+    cantidad = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Respuestas guardadas por Idempotency-Key (ver idempotencia.py)
+class ClaveIdempotencia(db.Model):
+    __tablename__ = "claves_idempotencia"
+    clave = db.Column(db.String(100), primary_key=True)
+    endpoint = db.Column(db.String(100), nullable=False)
+    huella = db.Column(db.String(64), nullable=False)  # sha256 del pedido original
+    codigo = db.Column(db.Integer)  # NULL mientras la operación no terminó
+    cuerpo = db.Column(db.Text)
+    mimetype = db.Column(db.String(100))
+    location = db.Column(db.String(500))
+    creada = db.Column(FechaHora, default=ahora, index=True)
+
+
+# Cola de tareas en segundo plano (ver tareas.py)
+class Tarea(db.Model):
+    __tablename__ = "tareas"
+    __table_args__ = (
+        db.Index("ix_tareas_estado_disponible_id", "estado", "disponible", "id"),
+        db.Index("ix_tareas_tipo_clave_estado", "tipo", "clave", "estado"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)
+    clave = db.Column(db.String(100))  # una sola tarea pendiente por (tipo, clave)
+    datos = db.Column(db.Text, nullable=False, default="{}")  # argumentos en JSON
+    estado = db.Column(db.String(20), nullable=False, default="pendiente")  # pendiente, en_curso, hecha, fallida
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    disponible = db.Column(FechaHora, nullable=False, default=ahora)  # no corre antes (reintentos)
+    creada = db.Column(FechaHora, default=ahora)
+    iniciada = db.Column(FechaHora)
+    terminada = db.Column(FechaHora)
+    error = db.Column(db.Text)
+
+
+# Clientes archivados y su historia (ver archivo.py): mismas columnas que la
+# tabla original más la fecha en que se archivó, sin claves foráneas.
+def _tabla_archivo(modelo, *indices):
+    columnas = [
+        db.Column(c.name, c.type, primary_key=c.primary_key, autoincrement=False)
+        for c in modelo.__table__.columns
+    ]
+    return db.Table(
+        f"{modelo.__tablename__}_archivo",
+        *columnas,
+        db.Column("archivado", FechaHora, default=ahora),
+        *indices,
+    )
+
+
+ClienteArchivo = _tabla_archivo(Cliente)
+GaranteArchivo = _tabla_archivo(Garante, db.Index("ix_garante_archivo_cliente_id", "cliente_id"))
+VentaArchivo = _tabla_archivo(Venta, db.Index("ix_ventas2_archivo_cliente_id", "cliente_id"))
+VentaItemArchivo = _tabla_archivo(VentaItem, db.Index("ix_venta_items_archivo_venta_id", "venta_id"))
+PagoClienteArchivo = _tabla_archivo(PagoCliente, db.Index("ix_pagos_clientes_archivo_cliente_id", "cliente_id"))
+
+
+# Saldo con que cada cliente empieza el período vigente: reemplaza a los
+# movimientos de los períodos cerrados, que pasan a *_archivo (ver archivo.py)
+class SaldoApertura(db.Model):
+    __tablename__ = "saldo_apertura"
+    cliente_id = db.Column(db.Integer, db.ForeignKey("cliente.id", ondelete="CASCADE"), primary_key=True)
+    desde = db.Column(FechaHora, nullable=False)
+    saldo = db.Column(db.Float, nullable=False, default=0)
+    # Venta impaga más vieja al cierre: antigüedad de la deuda de apertura en
+    # morosos (los pagos posteriores no la corren hasta cancelar la apertura)
+    primera_impaga = db.Column(FechaHora)
+
+
+class CierrePeriodo(db.Model):
+    __tablename__ = "cierres_periodo"
+    hasta = db.Column(FechaHora, primary_key=True)
+    iniciado = db.Column(FechaHora, default=ahora)
+    terminado = db.Column(FechaHora)
+    movimientos = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Migraciones de esquema aplicadas (ver migraciones.py)
+class Migracion(db.Model):
+    __tablename__ = "schema_migraciones"
+    version = db.Column(db.Integer, primary_key=True)
+    descripcion = db.Column(db.String(200))
+    aplicada = db.Column(FechaHora, default=ahora)
+
 
 class Usuario(db.Model, UserMixin):
     __tablename__ = 'usuarios'
@@ -90,6 +266,8 @@ class Usuario(db.Model, UserMixin):
     username = db.Column(db.String(64), unique=True, nullable=False)
     password = db.Column(db.String(128), nullable=False)  # volvemos al campo anterior
     role = db.Column(db.String(50))
+    # Sube con cada cambio de contraseña o rol (ver usuarios_cache.py)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
 
     def set_password(self, password):
         self.password = password  # temporalmente texto plano
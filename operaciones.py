@@ -0,0 +1,121 @@
+from sqlalchemy import insert
+from models import db, Cliente, Venta, VentaItem, PagoCliente
+from saldos import ajustar_saldo, bloquear_saldo, deuda_venta
+from caja_diaria import sumar_a_caja
+from archivo import inicio_periodo
+from fechas import ahora
+
+
+# Diferencias menores a esto se consideran redondeo
+TOLERANCIA = 0.005
+
+# Filas por INSERT de ítems (SQLite admite hasta 32766 parámetros por sentencia)
+ITEMS_POR_INSERT = 1000
+
+
+class OperacionRechazada(ValueError):
+    """La operación deja la cuenta del cliente en un estado no permitido."""
+
+
+def verificar_limite(cliente_id, deuda):
+    """
+    Bloquea el saldo del cliente y rechaza la operación si sumarle `deuda` lo
+    deja por encima del monto autorizado (sin monto autorizado no hay límite).
+
+    El lock dura hasta el commit: dos cajas que le venden al mismo cliente a
+    la vez se validan una después de la otra.
+    """
+    saldo = bloquear_saldo(cliente_id)
+    if saldo is None:
+        raise OperacionRechazada("cliente inexistente")
+
+    limite = db.session.query(Cliente.monto_autorizado).filter_by(id=cliente_id).scalar()
+    if deuda > 0 and limite is not None and saldo + deuda > limite + TOLERANCIA:
+        raise OperacionRechazada(
+            f"supera el monto autorizado: saldo {saldo:.2f} + {deuda:.2f} > {limite:.2f}"
+        )
+    return saldo
+
+
+def validar_items(items):
+    """Normaliza los ítems de una venta. Lanza OperacionRechazada si alguno es inválido."""
+    if not isinstance(items, list):
+        raise OperacionRechazada("items debe ser una lista")
+
+    validados = []
+    for n, item in enumerate(items, start=1):
+        try:
+            cantidad = float(item["cantidad"])
+            validado = {
+                "descripcion": item.get("descripcion"),
+                "precio_unitario": float(item["precio_unitario"]),
+                "total": float(item["total"]),
+            }
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise OperacionRechazada(f"ítem {n} inválido")
+        # venta_items.cantidad es entera: no se redondea en silencio
+        if not cantidad.is_integer() or cantidad <= 0:
+            raise OperacionRechazada(f"ítem {n}: la cantidad debe ser un entero mayor a 0")
+        validados.append({"cantidad": int(cantidad), **validado})
+    return validados
+
+
+def crear_venta(cliente_id, items, pago_a_cuenta, metodo_pago, fecha=None):
+    """
+    Crea la venta, ajusta el saldo del cliente y la caja del día (sin commit).
+    Lanza OperacionRechazada si supera el monto autorizado o si `fecha` cae en
+    un período cerrado.
+
+    Los ítems no se insertan acá: devuelve (venta, filas_de_items) para que el
+    que llama los escriba con `insertar_items`, de a muchos por sentencia.
+    """
+    if fecha is not None:
+        inicio = inicio_periodo()
+        if inicio is not None and fecha < inicio:
+            raise OperacionRechazada(f"la fecha cae en un período cerrado (antes del {inicio:%d/%m/%Y})")
+
+    total_operacion = sum(item["cantidad"] * item["precio_unitario"] for item in items)
+    verificar_limite(cliente_id, total_operacion - (pago_a_cuenta or 0))
+
+    venta = Venta(
+        cliente_id=cliente_id,
+        total=total_operacion,
+        pago_a_cuenta=pago_a_cuenta,
+        saldo_resultante=total_operacion - pago_a_cuenta,
+        fecha=fecha or ahora(),
+        metodo_pago=metodo_pago
+    )
+    db.session.add(venta)
+    db.session.flush()
+
+    venta.saldo_anterior, venta.saldo_posterior = ajustar_saldo(venta.cliente_id, deuda_venta(venta))
+    sumar_a_caja(venta)
+
+    return venta, [dict(item, venta_id=venta.id) for item in items]
+
+
+def crear_pago(cliente_id, monto, metodo_pago):
+    """
+    Registra un pago, ajusta el saldo del cliente y la caja del día (sin commit).
+
+    El saldo queda bloqueado hasta el commit, así dos cobros simultáneos del
+    mismo cliente no pierden ninguna actualización. Se aceptan pagos mayores a
+    la deuda: el saldo queda a favor del cliente (pago adelantado).
+    """
+    if not monto or monto <= 0:
+        raise OperacionRechazada("monto inválido")
+    verificar_limite(cliente_id, -monto)
+
+    pago = PagoCliente(cliente_id=cliente_id, monto=monto, metodo_pago=metodo_pago)
+    db.session.add(pago)
+    db.session.flush()
+
+    pago.saldo_anterior, pago.saldo_posterior = ajustar_saldo(cliente_id, -monto)
+    sumar_a_caja(pago)
+    return pago
+
+
+def insertar_items(filas):
+    """Escribe los ítems con INSERT de varias filas."""
+    for i in range(0, len(filas), ITEMS_POR_INSERT):
+        db.session.execute(insert(VentaItem).values(filas[i:i + ITEMS_POR_INSERT]))
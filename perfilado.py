@@ -0,0 +1,190 @@
+import hmac
+import time
+import threading
+from collections import defaultdict, deque
+from flask import (
+    g, request, current_app, has_request_context, before_render_template, template_rendered, Response, abort,
+)
+from flask_login import current_user
+from sqlalchemy import event
+from models import db
+
+
+# Se guardan las últimas N mediciones por endpoint para calcular percentiles
+MUESTRAS_POR_ENDPOINT = 1000
+CUANTILES = (0.5, 0.9, 0.99)
+
+SERIES = [
+    ("bando_request_duration_seconds", "duracion", "Duración de la request"),
+    ("bando_request_db_seconds", "db", "Tiempo en la base por request"),
+    ("bando_request_queries", "consultas", "Consultas SQL por request"),
+]
+
+# endpoint -> {"muestras": {serie: deque}, "sumas": {serie: acumulado}, "total": requests}
+_muestras = defaultdict(lambda: {
+    "muestras": {clave: deque(maxlen=MUESTRAS_POR_ENDPOINT) for _, clave, _ in SERIES},
+    "sumas": {clave: 0.0 for _, clave, _ in SERIES},
+    "total": 0,
+})
+_lock = threading.Lock()
+
+
+def _perfil():
+    if not has_request_context():
+        return None
+    return g.get("_perfil")
+
+
+def _antes_de_consulta(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("_inicio_consulta", []).append(time.perf_counter())
+
+
+def _despues_de_consulta(conn, cursor, statement, parameters, context, executemany):
+    inicio = conn.info["_inicio_consulta"].pop()
+    ms = (time.perf_counter() - inicio) * 1000
+
+    if ms >= current_app.config.get("PERFILADO_LENTA_MS", 200):
+        current_app.logger.warning("Consulta lenta (%.1f ms): %s %r", ms, statement, parameters)
+
+    perfil = _perfil()
+    if perfil is not None:
+        perfil["consultas"] += 1
+        perfil["db_ms"] += ms
+        if not statement.lstrip().upper().startswith("SELECT") and cursor.rowcount > 0:
+            perfil["filas"] += cursor.rowcount
+
+
+def _al_cargar(target, context):
+    perfil = _perfil()
+    if perfil is not None:
+        perfil["filas"] += 1
+
+
+def _escuchar(objetivo, evento, funcion, **kw):
+    # Una sola vez por objetivo aunque se llame a create_app varias veces
+    if not event.contains(objetivo, evento, funcion):
+        event.listen(objetivo, evento, funcion, **kw)
+
+
+def init_perfilado(app):
+    """
+    Instrumentación opcional (PERFILADO=1): por request cuenta consultas,
+    tiempo en la base, tiempo de plantillas y filas, lo devuelve en el header
+    Server-Timing y expone percentiles por endpoint en /metrics (con sesión
+    iniciada o METRICS_TOKEN).
+
+    Las filas son los objetos ORM cargados más las filas afectadas por
+    INSERT/UPDATE/DELETE: el driver no informa cuántas filas se leen en un
+    SELECT hecho con Core.
+    """
+    if not app.config.get("PERFILADO"):
+        return
+
+    with app.app_context():
+        for engine in db.engines.values():
+            _escuchar(engine, "before_cursor_execute", _antes_de_consulta)
+            _escuchar(engine, "after_cursor_execute", _despues_de_consulta)
+    _escuchar(db.Model, "load", _al_cargar, propagate=True)
+
+    def antes_de_plantilla(sender, template, context, **extra):
+        perfil = _perfil()
+        if perfil is not None:
+            perfil["_plantilla_inicio"].append(time.perf_counter())
+
+    def plantilla_renderizada(sender, template, context, **extra):
+        perfil = _perfil()
+        if perfil is not None and perfil["_plantilla_inicio"]:
+            perfil["plantillas_ms"] += (time.perf_counter() - perfil["_plantilla_inicio"].pop()) * 1000
+
+    before_render_template.connect(antes_de_plantilla, app, weak=False)
+    template_rendered.connect(plantilla_renderizada, app, weak=False)
+
+    @app.before_request
+    def iniciar_perfil():
+        g._perfil = {
+            "inicio": time.perf_counter(),
+            "consultas": 0,
+            "db_ms": 0.0,
+            "plantillas_ms": 0.0,
+            "filas": 0,
+            "_plantilla_inicio": [],
+        }
+
+    @app.after_request
+    def cerrar_perfil(response):
+        perfil = _perfil()
+        if perfil is None:
+            return response
+
+        total_ms = (time.perf_counter() - perfil["inicio"]) * 1000
+        response.headers["Server-Timing"] = ", ".join([
+            f'db;dur={perfil["db_ms"]:.1f};desc="{perfil["consultas"]} consultas"',
+            f'tpl;dur={perfil["plantillas_ms"]:.1f};desc="plantillas"',
+            f'filas;desc="{perfil["filas"]}"',
+            f'total;dur={total_ms:.1f}',
+        ])
+
+        valores = {
+            "duracion": total_ms / 1000,
+            "db": perfil["db_ms"] / 1000,
+            "consultas": perfil["consultas"],
+        }
+        endpoint = request.endpoint or "desconocido"
+        with _lock:
+            m = _muestras[endpoint]
+            for clave, valor in valores.items():
+                m["muestras"][clave].append(valor)
+                m["sumas"][clave] += valor
+            m["total"] += 1
+        return response
+
+    app.add_url_rule("/metrics", "metrics", metricas)
+
+
+def _percentil(valores, q):
+    ordenados = sorted(valores)
+    if not ordenados:
+        return 0
+    return ordenados[min(len(ordenados) - 1, int(q * len(ordenados)))]
+
+
+def _autorizado():
+    """Usuario logueado o `Authorization: Bearer <METRICS_TOKEN>` (para el scraper)."""
+    if current_user.is_authenticated:
+        return True
+    token = current_app.config.get("METRICS_TOKEN")
+    enviado = request.headers.get("Authorization", "")
+    return bool(token) and hmac.compare_digest(enviado, f"Bearer {token}")
+
+
+def metricas():
+    """Percentiles por endpoint en formato de texto de Prometheus (por proceso)."""
+    if not _autorizado():
+        abort(401)
+    with _lock:
+        copia = {
+            endpoint: {
+                "muestras": {clave: list(valores) for clave, valores in m["muestras"].items()},
+                "sumas": dict(m["sumas"]),
+                "total": m["total"],
+            }
+            for endpoint, m in _muestras.items()
+        }
+
+    lineas = []
+    for nombre, clave, ayuda in SERIES:
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} summary")
+        for endpoint, m in sorted(copia.items()):
+            for q in CUANTILES:
+                valor = _percentil(m["muestras"][clave], q)
+                lineas.append(f'{nombre}{{endpoint="{endpoint}",quantile="{q}"}} {valor}')
+            lineas.append(f'{nombre}_sum{{endpoint="{endpoint}"}} {m["sumas"][clave]}')
+            lineas.append(f'{nombre}_count{{endpoint="{endpoint}"}} {m["total"]}')
+
+    lineas.append("# HELP bando_requests_total Requests atendidas por endpoint")
+    lineas.append("# TYPE bando_requests_total counter")
+    for endpoint, m in sorted(copia.items()):
+        lineas.append(f'bando_requests_total{{endpoint="{endpoint}"}} {m["total"]}')
+
+    return Response("\n".join(lineas) + "\n", mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,65 @@
+import time
+from functools import wraps
+from flask import g, session, current_app, has_request_context
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from models import db, REPLICA, SesionConReplica
+
+
+# Momento (epoch) de la última escritura confirmada por el usuario
+CLAVE_SESION = "ultima_escritura"
+
+
+def init_replica(app):
+    """Si hay réplica, anota en la sesión del usuario cuándo escribió por última vez."""
+    if not app.config.get("SQLALCHEMY_BINDS", {}).get(REPLICA):
+        return
+
+    @app.after_request
+    def recordar_escritura(respuesta):
+        if g.get("escritura_confirmada"):
+            session[CLAVE_SESION] = time.time()
+        return respuesta
+
+
+@event.listens_for(SesionConReplica, "after_commit")
+def _escritura_confirmada(sesion):
+    if sesion.info.pop("escribio", False) and has_request_context():
+        g.escritura_confirmada = True
+
+
+@event.listens_for(SesionConReplica, "after_rollback")
+def _escritura_descartada(sesion):
+    sesion.info.pop("escribio", None)
+
+
+def _escritura_reciente():
+    ventana = current_app.config.get("REPLICA_VENTANA_SEGUNDOS", 10)
+    return time.time() - session.get(CLAVE_SESION, 0) < ventana
+
+
+def lectura_replica(vista):
+    """
+    Ejecuta la vista leyendo de la réplica (DATABASE_REPLICA_URL).
+
+    Lee de la principal si no hay réplica, si el usuario escribió hace menos
+    de REPLICA_VENTANA_SEGUNDOS (para que vea sus propias ventas y pagos
+    aunque la réplica venga atrasada) o si la réplica no responde.
+    """
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        if REPLICA not in db.engines or _escritura_reciente():
+            return vista(*args, **kwargs)
+
+        g.usar_replica = True
+        try:
+            return vista(*args, **kwargs)
+        except OperationalError as e:
+            current_app.logger.warning("Réplica no disponible, se lee de la principal: %s", e.orig)
+            db.session.rollback()
+            g.usar_replica = False
+            return vista(*args, **kwargs)
+        finally:
+            g.usar_replica = False
+
+    return envoltura
@@ -0,0 +1,234 @@
+from datetime import timedelta
+from sqlalchemy import select, func, case, and_, or_, literal, literal_column, null, union_all
+from models import db, Cliente, Venta, VentaItem, PagoCliente, SaldoApertura, VentaArchivo, VentaItemArchivo, PagoClienteArchivo
+from saldos import DEUDA_VENTA
+import fechas
+
+
+# Tramos de antigüedad: (etiqueta, días máximos desde la venta impaga más vieja)
+TRAMOS = [("0-30", 30), ("31-60", 60), ("61-90", 90), ("90+", None)]
+
+MOROSOS_POR_PAGINA = 50
+MOVIMIENTOS_POR_PAGINA = 50
+
+
+def _deudas(ahora=None, hasta=None):
+    """
+    Subconsulta con una fila por cliente deudor: saldo, fecha de la venta
+    impaga más vieja y tramo de antigüedad.
+
+    Los pagos se imputan a las ventas más viejas primero, así que la venta
+    impaga más vieja es la primera cuyo acumulado supera el total pagado. El
+    saldo de apertura cuenta como una venta de la fecha de su venta impaga
+    más vieja (o como un pago si es a favor). Con `hasta` solo se cuentan los
+    movimientos anteriores a esa fecha.
+    """
+    ahora = ahora or fechas.ahora()
+
+    ventas = select(Venta.cliente_id, Venta.fecha, Venta.id, DEUDA_VENTA.label("deuda"))
+    pagos = select(PagoCliente.cliente_id, PagoCliente.monto)
+    if hasta is not None:
+        ventas = ventas.where(Venta.fecha < hasta)
+        pagos = pagos.where(PagoCliente.fecha < hasta)
+
+    apertura_deudora = select(
+        SaldoApertura.cliente_id,
+        func.coalesce(SaldoApertura.primera_impaga, SaldoApertura.desde),
+        literal(0),
+        SaldoApertura.saldo,
+    ).where(SaldoApertura.saldo > 0)
+    apertura_a_favor = select(SaldoApertura.cliente_id, -SaldoApertura.saldo).where(SaldoApertura.saldo < 0)
+
+    todos_los_pagos = union_all(pagos, apertura_a_favor).subquery()
+    pagos = (
+        select(todos_los_pagos.c.cliente_id, func.sum(todos_los_pagos.c.monto).label("pagado"))
+        .group_by(todos_los_pagos.c.cliente_id)
+        .subquery()
+    )
+    deudas = union_all(ventas, apertura_deudora).subquery()
+    acumulado = (
+        select(
+            deudas.c.cliente_id,
+            deudas.c.fecha,
+            deudas.c.deuda,
+            func.sum(deudas.c.deuda).over(
+                partition_by=deudas.c.cliente_id,
+                order_by=(deudas.c.fecha, deudas.c.id)
+            ).label("acumulado"),
+        )
+        .subquery()
+    )
+
+    pagado = func.coalesce(pagos.c.pagado, 0)
+    saldo = (func.sum(acumulado.c.deuda) - func.max(pagado)).label("saldo")
+    primera_impaga = func.min(
+        case((acumulado.c.acumulado > pagado + 0.005, acumulado.c.fecha))
+    ).label("primera_impaga")
+
+    por_cliente = (
+        select(acumulado.c.cliente_id, saldo, primera_impaga)
+        .select_from(acumulado.outerjoin(pagos, pagos.c.cliente_id == acumulado.c.cliente_id))
+        .group_by(acumulado.c.cliente_id)
+        .subquery()
+    )
+
+    tramo = case(
+        *[
+            (por_cliente.c.primera_impaga >= ahora - timedelta(days=dias), literal(etiqueta))
+            for etiqueta, dias in TRAMOS if dias is not None
+        ],
+        else_=literal(TRAMOS[-1][0])
+    ).label("tramo")
+
+    return (
+        select(por_cliente.c.cliente_id, por_cliente.c.saldo, por_cliente.c.primera_impaga, tramo)
+        .where(por_cliente.c.saldo > 0.005)
+        .subquery()
+    )
+
+
+def consultar_morosos(despues=None, orden="desc", limite=MOROSOS_POR_PAGINA):
+    """
+    Una página de deudores ordenada por monto adeudado, con paginación por
+    cursor (`despues` = (saldo, id) de la última fila de la página anterior).
+
+    Devuelve (filas, cursor_siguiente).
+    """
+    deudas = _deudas()
+    descendente = orden != "asc"
+    saldo = deudas.c.saldo
+
+    q = (
+        select(
+            Cliente.id, Cliente.nombre, Cliente.documento, Cliente.telefono,
+            saldo, deudas.c.primera_impaga, deudas.c.tramo
+        )
+        .join(deudas, deudas.c.cliente_id == Cliente.id)
+    )
+
+    if despues:
+        saldo_cursor, id_cursor = despues
+        pasado = saldo < saldo_cursor if descendente else saldo > saldo_cursor
+        q = q.where(or_(pasado, and_(saldo == saldo_cursor, Cliente.id > id_cursor)))
+
+    q = q.order_by(saldo.desc() if descendente else saldo.asc(), Cliente.id).limit(limite + 1)
+    filas = db.session.execute(q).all()
+
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = (filas[-1].saldo, filas[-1].id)
+    return filas, siguiente
+
+
+def primeras_impagas(hasta):
+    """{cliente_id: fecha de la venta impaga más vieja} contando los movimientos anteriores a `hasta`."""
+    deudas = _deudas(hasta=hasta)
+    return dict(db.session.execute(select(deudas.c.cliente_id, deudas.c.primera_impaga)).all())
+
+
+def resumen_morosos():
+    """Cantidad de deudores y deuda total por tramo de antigüedad."""
+    deudas = _deudas()
+    filas = db.session.execute(
+        select(deudas.c.tramo, func.count(), func.sum(deudas.c.saldo))
+        .group_by(deudas.c.tramo)
+    ).all()
+
+    por_tramo = {etiqueta: {"clientes": 0, "deuda": 0.0} for etiqueta, _ in TRAMOS}
+    for tramo, cantidad, deuda in filas:
+        por_tramo[tramo] = {"clientes": cantidad, "deuda": float(deuda or 0)}
+    return por_tramo
+
+
+def consultar_movimientos(cliente_id, despues=None, limite=MOVIMIENTOS_POR_PAGINA, historial=False):
+    """
+    Una página de la línea de tiempo del cliente (ventas y pagos, más nuevos
+    primero) con el saldo de la cuenta después de cada movimiento.
+
+    Ventas y pagos se unen con UNION ALL y el saldo acumulado lo calcula la
+    base con una función ventana, partiendo del saldo de apertura del período
+    (que aparece como el movimiento más viejo). Con `historial` se leen los
+    períodos cerrados de las tablas de archivo. `despues` es el cursor
+    (fecha, tipo, id) de la última fila de la página anterior. Solo se cargan
+    los ítems de las ventas de la página.
+
+    Devuelve (movimientos, cursor_siguiente).
+    """
+    v = VentaArchivo if historial else Venta.__table__
+    p = PagoClienteArchivo if historial else PagoCliente.__table__
+
+    ventas = select(
+        literal_column("'venta'").label("tipo"),
+        v.c.id,
+        v.c.fecha,
+        v.c.total,
+        v.c.pago_a_cuenta,
+        v.c.saldo_resultante,
+        v.c.descripcion,
+        (func.coalesce(v.c.total, 0) - func.coalesce(v.c.pago_a_cuenta, 0)).label("efecto"),
+    ).where(v.c.cliente_id == cliente_id)
+
+    pagos = select(
+        literal_column("'pago'").label("tipo"),
+        p.c.id,
+        p.c.fecha,
+        literal_column("0.0").label("total"),
+        p.c.monto.label("pago_a_cuenta"),
+        null().label("saldo_resultante"),
+        literal_column("'Pago suelto'").label("descripcion"),
+        (-p.c.monto).label("efecto"),
+    ).where(p.c.cliente_id == cliente_id)
+
+    partes = [ventas, pagos]
+    if not historial:
+        partes.append(select(
+            literal_column("'apertura'").label("tipo"),
+            literal(0).label("id"),
+            SaldoApertura.desde,
+            literal_column("0.0").label("total"),
+            literal_column("0.0").label("pago_a_cuenta"),
+            null().label("saldo_resultante"),
+            literal_column("'Saldo de apertura'").label("descripcion"),
+            SaldoApertura.saldo.label("efecto"),
+        ).where(SaldoApertura.cliente_id == cliente_id))
+
+    timeline = union_all(*partes).subquery()
+    con_saldo = select(
+        timeline,
+        func.sum(timeline.c.efecto).over(
+            order_by=(timeline.c.fecha, timeline.c.tipo, timeline.c.id)
+        ).label("saldo_cuenta"),
+    ).subquery()
+
+    c = con_saldo.c
+    q = select(con_saldo)
+    if despues:
+        fecha, tipo, id_ = despues
+        q = q.where(or_(
+            c.fecha < fecha,
+            and_(c.fecha == fecha, c.tipo < tipo),
+            and_(c.fecha == fecha, c.tipo == tipo, c.id < id_),
+        ))
+    q = q.order_by(c.fecha.desc(), c.tipo.desc(), c.id.desc()).limit(limite + 1)
+
+    filas = db.session.execute(q).all()
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        ultima = filas[-1]
+        siguiente = (ultima.fecha, ultima.tipo, ultima.id)
+
+    ids_ventas = [f.id for f in filas if f.tipo == "venta"]
+    items_por_venta = {}
+    if ids_ventas:
+        items = VentaItemArchivo if historial else VentaItem.__table__
+        consulta = select(items).where(items.c.venta_id.in_(ids_ventas)).order_by(items.c.id)
+        for item in db.session.execute(consulta):
+            items_por_venta.setdefault(item.venta_id, []).append(item)
+
+    movimientos = [
+        dict(f._mapping, items=items_por_venta.get(f.id, []) if f.tipo == "venta" else [])
+        for f in filas
+    ]
+    return movimientos, siguiente
@@ -0,0 +1,271 @@
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import func, update, select, and_, or_
+from models import db, Cliente, Venta, PagoCliente, SaldoCliente, SaldoApertura
+from comprobantes import invalidar_comprobantes
+from tareas import tarea, encolar
+
+
+# Deuda que deja una venta: total menos lo que se pagó a cuenta en el momento
+DEUDA_VENTA = func.coalesce(Venta.total, 0) - func.coalesce(Venta.pago_a_cuenta, 0)
+
+
+def deuda_venta(venta):
+    return (venta.total or 0) - (venta.pago_a_cuenta or 0)
+
+
+def saldo_apertura(cliente_id):
+    """Saldo con que el cliente empezó el período vigente (0 si nunca se cerró uno)."""
+    saldo = db.session.query(SaldoApertura.saldo).filter(SaldoApertura.cliente_id == cliente_id).scalar()
+    return float(saldo or 0)
+
+
+def calcular_saldo(cliente_id):
+    """Recalcula el saldo de un cliente: apertura más ventas menos pagos del período vigente."""
+    ventas = db.session.query(func.coalesce(func.sum(DEUDA_VENTA), 0)) \
+        .filter(Venta.cliente_id == cliente_id).scalar()
+    pagos = db.session.query(func.coalesce(func.sum(PagoCliente.monto), 0)) \
+        .filter(PagoCliente.cliente_id == cliente_id).scalar()
+    return saldo_apertura(cliente_id) + float(ventas or 0) - float(pagos or 0)
+
+
+def ajustar_saldo(cliente_id, delta):
+    """
+    Suma `delta` al saldo persistido del cliente, dentro de la transacción actual.
+
+    Se llama después de hacer flush del movimiento. Si el cliente todavía no
+    tiene fila de saldo (datos previos al ledger) se calcula completo una vez.
+    Devuelve (saldo_anterior, saldo_nuevo).
+    """
+    actualizadas = db.session.execute(
+        update(SaldoCliente)
+        .where(SaldoCliente.cliente_id == cliente_id)
+        .values(saldo=SaldoCliente.saldo + delta)
+        .execution_options(synchronize_session="fetch")
+    ).rowcount
+
+    if not actualizadas:
+        nuevo = calcular_saldo(cliente_id)
+        db.session.add(SaldoCliente(cliente_id=cliente_id, saldo=nuevo))
+        db.session.flush()
+    else:
+        nuevo = db.session.query(SaldoCliente.saldo).filter_by(cliente_id=cliente_id).scalar()
+
+    return round(nuevo - delta, 2), round(nuevo, 2)
+
+
+def bloquear_saldo(cliente_id):
+    """
+    Bloquea la fila de saldo del cliente hasta el commit y devuelve el saldo
+    (None si el cliente no existe).
+
+    En Postgres es SELECT ... FOR UPDATE: solo espera otra transacción sobre el
+    mismo cliente. SQLite no tiene locks por fila: un UPDATE sin cambios toma
+    el lock de escritura de la base antes de leer el saldo.
+    """
+    if db.session.get_bind().dialect.name == "sqlite":
+        db.session.execute(
+            update(SaldoCliente)
+            .where(SaldoCliente.cliente_id == cliente_id)
+            .values(saldo=SaldoCliente.saldo)
+            .execution_options(synchronize_session=False)
+        )
+
+    consulta = select(SaldoCliente.saldo).where(SaldoCliente.cliente_id == cliente_id).with_for_update()
+    saldo = db.session.execute(consulta).scalar()
+    if saldo is None:
+        # Cliente sin fila de saldo (datos previos al ledger): se crea y se bloquea
+        if db.session.get(Cliente, cliente_id) is None:
+            return None
+        ajustar_saldo(cliente_id, 0)
+        saldo = db.session.execute(consulta).scalar()
+    return saldo
+
+
+def calcular_saldos():
+    """Saldo de todos los clientes con consultas agrupadas: {cliente_id: saldo}."""
+    ventas = dict(
+        db.session.query(Venta.cliente_id, func.sum(DEUDA_VENTA))
+        .group_by(Venta.cliente_id)
+        .all()
+    )
+    pagos = dict(
+        db.session.query(PagoCliente.cliente_id, func.sum(PagoCliente.monto))
+        .group_by(PagoCliente.cliente_id)
+        .all()
+    )
+    aperturas = dict(db.session.query(SaldoApertura.cliente_id, SaldoApertura.saldo).all())
+    ids = [cid for (cid,) in db.session.query(Cliente.id)]
+    return {
+        cid: float(aperturas.get(cid) or 0) + float(ventas.get(cid) or 0) - float(pagos.get(cid) or 0)
+        for cid in ids
+    }
+
+
+def reconstruir_saldos(solo_verificar=False):
+    """
+    Compara el ledger con el saldo recalculado desde cero.
+
+    Devuelve la lista de diferencias (cliente_id, guardado, calculado). Si no es
+    `solo_verificar`, además corrige las filas y hace commit.
+    """
+    calculados = calcular_saldos()
+    guardados = dict(db.session.query(SaldoCliente.cliente_id, SaldoCliente.saldo).all())
+
+    diferencias = []
+    for cid, saldo in calculados.items():
+        guardado = guardados.get(cid)
+        if guardado is None or round(guardado - saldo, 2) != 0:
+            diferencias.append((cid, guardado, round(saldo, 2)))
+
+    if not solo_verificar:
+        for cid, guardado, saldo in diferencias:
+            if guardado is None:
+                db.session.add(SaldoCliente(cliente_id=cid, saldo=saldo))
+            else:
+                db.session.query(SaldoCliente).filter_by(cliente_id=cid).update({"saldo": saldo})
+        db.session.commit()
+
+    return diferencias
+
+
+# ---------- SNAPSHOTS DE SALDO ----------
+# Cada venta y pago guarda el saldo del cliente antes y después del
+# movimiento, en el orden de la línea de tiempo (fecha, tipo, id).
+
+def _clave(movimiento):
+    tipo = "venta" if isinstance(movimiento, Venta) else "pago"
+    return (movimiento.fecha, tipo, movimiento.id)
+
+
+def _posteriores(modelo, tipo, clave):
+    """Filtro de los movimientos de `modelo` que van después de `clave`."""
+    fecha, tipo_clave, id_clave = clave
+    condicion = modelo.fecha > fecha
+    if tipo > tipo_clave:
+        condicion = or_(condicion, modelo.fecha == fecha)
+    elif tipo == tipo_clave:
+        condicion = or_(condicion, and_(modelo.fecha == fecha, modelo.id > id_clave))
+    return condicion
+
+
+def recalcular_snapshots(cliente_id, despues_de=None, saldo_inicial=None):
+    """
+    Reescribe saldo_anterior/saldo_posterior de los movimientos del cliente.
+
+    Sin `despues_de` recorre todo el período vigente partiendo del saldo de
+    apertura. Con `despues_de` (una clave fecha, tipo, id) solo los movimientos
+    posteriores, partiendo de `saldo_inicial`. Invalida los comprobantes del
+    cliente. No hace commit.
+    """
+    if saldo_inicial is None:
+        saldo_inicial = saldo_apertura(cliente_id) if despues_de is None else 0.0
+
+    ventas = Venta.query.filter(Venta.cliente_id == cliente_id)
+    pagos = PagoCliente.query.filter(PagoCliente.cliente_id == cliente_id)
+    if despues_de is not None:
+        ventas = ventas.filter(_posteriores(Venta, "venta", despues_de))
+        pagos = pagos.filter(_posteriores(PagoCliente, "pago", despues_de))
+
+    movimientos = sorted(list(ventas) + list(pagos), key=_clave)
+
+    saldo = saldo_inicial
+    for m in movimientos:
+        m.saldo_anterior = round(saldo, 2)
+        saldo += deuda_venta(m) if isinstance(m, Venta) else -(m.monto or 0)
+        m.saldo_posterior = round(saldo, 2)
+    db.session.flush()
+    invalidar_comprobantes(cliente_id)
+
+
+def _anteriores(modelo, tipo, clave):
+    """Filtro de los movimientos de `modelo` que van antes de `clave`."""
+    fecha, tipo_clave, id_clave = clave
+    condicion = modelo.fecha < fecha
+    if tipo < tipo_clave:
+        condicion = or_(condicion, modelo.fecha == fecha)
+    elif tipo == tipo_clave:
+        condicion = or_(condicion, and_(modelo.fecha == fecha, modelo.id < id_clave))
+    return condicion
+
+
+def _anterior(cliente_id, clave):
+    """El último movimiento del cliente antes de `clave` (None si no hay)."""
+    candidatos = [
+        modelo.query
+        .filter(modelo.cliente_id == cliente_id, _anteriores(modelo, tipo, clave))
+        .order_by(modelo.fecha.desc(), modelo.id.desc())
+        .first()
+        for modelo, tipo in ((Venta, "venta"), (PagoCliente, "pago"))
+    ]
+    candidatos = [m for m in candidatos if m is not None]
+    return max(candidatos, key=_clave) if candidatos else None
+
+
+def encolar_reparacion(eliminado):
+    """Tras eliminar un movimiento, encola la corrección de los snapshots de los que le siguen."""
+    fecha, tipo, id = _clave(eliminado)
+    encolar("snapshots", {"cliente_id": eliminado.cliente_id, "fecha": fecha.isoformat(), "tipo": tipo, "id": id})
+
+
+@tarea("snapshots")
+def reparar_snapshots(cliente_id, fecha, tipo, id):
+    """
+    Corrige los snapshots de los movimientos posteriores a (fecha, tipo, id).
+
+    Parte del snapshot del movimiento anterior, no del eliminado: si hubo otra
+    eliminación antes cuya tarea todavía no corrió, esa tarea recorre también
+    estos movimientos y el resultado final es el mismo en cualquier orden. Si
+    el anterior no tiene snapshot se recorre toda la historia.
+    """
+    if bloquear_saldo(cliente_id) is None:
+        return  # el cliente ya no existe
+    clave = (datetime.fromisoformat(fecha), tipo, id)
+    anterior = _anterior(cliente_id, clave)
+    if anterior is None:
+        recalcular_snapshots(cliente_id, despues_de=clave, saldo_inicial=saldo_apertura(cliente_id))
+    elif anterior.saldo_posterior is None:
+        recalcular_snapshots(cliente_id)
+    else:
+        recalcular_snapshots(cliente_id, despues_de=clave, saldo_inicial=anterior.saldo_posterior)
+
+
+def encolar_verificacion(cliente_id):
+    """Encola la verificación del saldo del cliente (una sola pendiente por cliente)."""
+    encolar("verificar_saldo", {"cliente_id": cliente_id}, clave=str(cliente_id))
+
+
+def encolar_verificaciones(muestra):
+    """
+    Encola la verificación de `muestra` clientes elegidos al azar y hace
+    commit. Devuelve los ids. Pensado para correr periódicamente
+    (`flask verificar-saldos`) en lugar de verificar en cada venta o pago.
+    """
+    ids = db.session.scalars(
+        select(SaldoCliente.cliente_id).order_by(func.random()).limit(muestra)
+    ).all()
+    for cliente_id in ids:
+        encolar_verificacion(cliente_id)
+    db.session.commit()
+    return ids
+
+
+@tarea("verificar_saldo")
+def verificar_saldo(cliente_id):
+    """
+    Compara el saldo persistido con el recalculado desde los movimientos y lo
+    corrige si difiere (lo mismo que `flask saldos`, para un solo cliente).
+    """
+    guardado = bloquear_saldo(cliente_id)
+    if guardado is None:
+        return
+    calculado = round(calcular_saldo(cliente_id), 2)
+    if round(guardado - calculado, 2) != 0:
+        current_app.logger.warning("Saldo del cliente %s corregido: guardado=%s calculado=%s",
+                                   cliente_id, guardado, calculado)
+        db.session.execute(
+            update(SaldoCliente)
+            .where(SaldoCliente.cliente_id == cliente_id)
+            .values(saldo=calculado)
+            .execution_options(synchronize_session=False)
+        )
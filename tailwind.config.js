@@ -0,0 +1,13 @@
+// Lo usa `flask assets` (Tailwind v3) para compilar estilos/tailwind.css
+const defaultTheme = require("tailwindcss/defaultTheme");
+
+module.exports = {
+  content: ["./templates/**/*.html"],
+  theme: {
+    extend: {
+      // Inter la carga login.html; en el resto queda la fuente del sistema
+      fontFamily: { sans: ["Inter", ...defaultTheme.fontFamily.sans] },
+      colors: { brand: "#2563eb" },
+    },
+  },
+};
@@ -0,0 +1,204 @@
+import json
+import signal
+import threading
+import traceback
+from datetime import timedelta
+from flask import current_app
+from sqlalchemy import select, update, delete, func
+from models import db, Tarea
+from fechas import ahora
+
+
+# Trabajo que no tiene que demorar la respuesta (snapshots, auditorías,
+# reportes) se encola en la tabla tareas dentro de la misma transacción que
+# lo origina: si la venta hace rollback, la tarea tampoco existe. Un proceso
+# aparte (`flask worker`) las toma y las ejecuta, cada una en su transacción.
+
+PENDIENTE, EN_CURSO, HECHA, FALLIDA = "pendiente", "en_curso", "hecha", "fallida"
+
+# tipo -> función que recibe los datos de la tarea como argumentos
+_TAREAS = {}
+
+
+def tarea(tipo):
+    """Registra la función que ejecuta las tareas de `tipo`."""
+    def registrar(funcion):
+        _TAREAS[tipo] = funcion
+        return funcion
+    return registrar
+
+
+def encolar(tipo, datos, clave=None):
+    """
+    Agrega una tarea en la transacción actual (sin commit). `datos` son los
+    argumentos de la función de la tarea. Con `clave`, si ya hay una del mismo
+    tipo y clave esperando no se agrega otra.
+    """
+    if clave is not None:
+        existente = db.session.execute(
+            select(Tarea.id).where(Tarea.tipo == tipo, Tarea.clave == clave, Tarea.estado == PENDIENTE).limit(1)
+        ).scalar()
+        if existente is not None:
+            return None
+    nueva = Tarea(tipo=tipo, clave=clave, datos=json.dumps(datos), estado=PENDIENTE, disponible=ahora())
+    db.session.add(nueva)
+    return nueva
+
+
+def _espera_reintento(intentos):
+    base = current_app.config.get("TAREAS_ESPERA_REINTENTO", 30)
+    return timedelta(seconds=min(base * 2 ** (intentos - 1), 3600))
+
+
+def tomar_tarea():
+    """
+    Marca en curso la próxima tarea disponible y la devuelve (None si no hay).
+
+    En Postgres dos workers no se pisan (SKIP LOCKED); en SQLite el UPDATE
+    condicionado al estado deja pasar a uno solo.
+    """
+    while True:
+        momento = ahora()
+        tarea_id = db.session.execute(
+            select(Tarea.id)
+            .where(Tarea.estado == PENDIENTE, Tarea.disponible <= momento)
+            .order_by(Tarea.disponible, Tarea.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        ).scalar()
+        if tarea_id is None:
+            db.session.rollback()
+            return None
+
+        tomada = db.session.execute(
+            update(Tarea)
+            .where(Tarea.id == tarea_id, Tarea.estado == PENDIENTE)
+            .values(estado=EN_CURSO, iniciada=momento, intentos=Tarea.intentos + 1)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if tomada:
+            return db.session.get(Tarea, tarea_id)
+
+
+def ejecutar(tarea_actual, log=print):
+    """
+    Ejecuta la tarea y la marca hecha en la misma transacción que su trabajo.
+    Si falla se reintenta más tarde, hasta TAREAS_INTENTOS veces.
+    """
+    tarea_id, tipo, intentos = tarea_actual.id, tarea_actual.tipo, tarea_actual.intentos
+    try:
+        funcion = _TAREAS.get(tipo)
+        if funcion is None:
+            raise LookupError(f"No hay función para las tareas '{tipo}'")
+        funcion(**json.loads(tarea_actual.datos or "{}"))
+        db.session.execute(
+            update(Tarea)
+            .where(Tarea.id == tarea_id)
+            .values(estado=HECHA, terminada=ahora(), error=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        log(f"tarea {tarea_id} ({tipo}) hecha")
+        return True
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception("Falló la tarea %s (%s)", tarea_id, tipo)
+        error = "".join(traceback.format_exception_only(e)).strip()
+
+    agotada = intentos >= current_app.config.get("TAREAS_INTENTOS", 5)
+    db.session.execute(
+        update(Tarea)
+        .where(Tarea.id == tarea_id)
+        .values(
+            estado=FALLIDA if agotada else PENDIENTE,
+            disponible=ahora() + _espera_reintento(intentos),
+            terminada=ahora() if agotada else None,
+            error=error[:2000],
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    log(f"tarea {tarea_id} ({tipo}) falló (intento {intentos}): {error}")
+    return False
+
+
+def rescatar_colgadas():
+    """Vuelve a pendientes las tareas en curso de un worker que murió (TAREAS_COLGADA_SEGUNDOS)."""
+    limite = ahora() - timedelta(seconds=current_app.config.get("TAREAS_COLGADA_SEGUNDOS", 900))
+    rescatadas = db.session.execute(
+        update(Tarea)
+        .where(Tarea.estado == EN_CURSO, Tarea.iniciada < limite)
+        .values(estado=PENDIENTE, disponible=ahora())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return rescatadas
+
+
+def trabajar(espera=1.0, una_vez=False, log=print):
+    """
+    Loop del worker: toma y ejecuta tareas hasta recibir SIGTERM/SIGINT
+    (termina la tarea en curso antes de salir). Sin tareas espera `espera`
+    segundos; con `una_vez` sale apenas se vacía la cola.
+    Devuelve la cantidad de tareas ejecutadas.
+    """
+    detener = threading.Event()
+    for senal in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(senal, lambda *_: detener.set())
+
+    ejecutadas = 0
+    ultimo_rescate = None
+    while not detener.is_set():
+        if ultimo_rescate is None or ahora() - ultimo_rescate > timedelta(minutes=1):
+            rescatadas = rescatar_colgadas()
+            if rescatadas:
+                log(f"{rescatadas} tareas colgadas vuelven a la cola")
+            ultimo_rescate = ahora()
+
+        siguiente = tomar_tarea()
+        if siguiente is None:
+            if una_vez:
+                break
+            detener.wait(espera)
+            continue
+        ejecutar(siguiente, log)
+        ejecutadas += 1
+        db.session.remove()
+    return ejecutadas
+
+
+def reintentar(tarea_id):
+    """Vuelve a encolar una tarea fallida con los intentos en cero."""
+    return db.session.execute(
+        update(Tarea)
+        .where(Tarea.id == tarea_id, Tarea.estado == FALLIDA)
+        .values(estado=PENDIENTE, intentos=0, disponible=ahora(), terminada=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def resumen_tareas(limite=50):
+    """Cantidad por tipo y estado, la pendiente más vieja y las últimas tareas sin terminar o fallidas."""
+    conteos = db.session.execute(
+        select(Tarea.tipo, Tarea.estado, func.count()).group_by(Tarea.tipo, Tarea.estado).order_by(Tarea.tipo)
+    ).all()
+    por_tipo = {}
+    for tipo, estado, cantidad in conteos:
+        por_tipo.setdefault(tipo, {})[estado] = cantidad
+
+    mas_vieja = db.session.execute(select(func.min(Tarea.creada)).where(Tarea.estado == PENDIENTE)).scalar()
+    recientes = db.session.execute(
+        select(Tarea).where(Tarea.estado != HECHA).order_by(Tarea.id.desc()).limit(limite)
+    ).scalars().all()
+    return {"por_tipo": por_tipo, "pendiente_mas_vieja": mas_vieja, "recientes": recientes}
+
+
+def purgar_tareas():
+    """Borra las tareas hechas hace más de TAREAS_RETENER_DIAS días."""
+    limite = ahora() - timedelta(days=current_app.config.get("TAREAS_RETENER_DIAS", 7))
+    borradas = db.session.execute(
+        delete(Tarea).where(Tarea.estado == HECHA, Tarea.terminada < limite)
+    ).rowcount
+    db.session.commit()
+    return borradas
@@ -0,0 +1,51 @@
+import pytest
+
+from app import create_app
+from config import Config
+from datos_prueba import asegurar_usuario
+from migraciones import aplicar_migraciones
+from models import db, Cliente, SaldoCliente
+
+
+def config_sqlite(ruta, **extra):
+    """Config de la app contra el archivo SQLite `ruta`, sin réplica."""
+    return type("ConfigPruebas", (Config,), {
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{ruta}",
+        "COMPROBANTES_DIR": str(ruta.parent / "comprobantes"),
+        "SQLALCHEMY_ENGINE_OPTIONS": {},
+        "SQLALCHEMY_BINDS": {},
+        "SECRET_KEY": "pruebas",
+        **extra,
+    })
+
+
+def crear_cliente(nombre="Prueba", limite=10000):
+    """Cliente con su fila de saldo en 0 (dentro de un app context). Devuelve el id."""
+    cliente = Cliente(nombre=nombre, documento=nombre.lower(), monto_autorizado=limite)
+    db.session.add(cliente)
+    db.session.flush()
+    db.session.add(SaldoCliente(cliente_id=cliente.id, saldo=0))
+    db.session.commit()
+    return cliente.id
+
+
+def logueado(app):
+    """Cliente HTTP con sesión iniciada."""
+    with app.app_context():
+        asegurar_usuario("pruebas", "pruebas")
+    http = app.test_client()
+    http.post("/login", data={"username": "pruebas", "password": "pruebas"})
+    return http
+
+
+@pytest.fixture
+def app(tmp_path):
+    """App con una base SQLite nueva y migrada."""
+    app = create_app(config_sqlite(tmp_path / "pruebas.db"))
+    with app.app_context():
+        aplicar_migraciones(log=lambda *a: None)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
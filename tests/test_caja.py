@@ -0,0 +1,39 @@
+import json
+
+from caja_diaria import reconstruir_caja, resumen_caja
+from conftest import crear_cliente, logueado
+from models import db, CajaDiaria, CajaMovimiento, Tarea
+
+
+def _filas_caja():
+    return sorted((c.fecha, c.metodo_pago, c.origen, round(c.total, 2), round(c.ingresado, 2), c.cantidad)
+                  for c in CajaDiaria.query)
+
+
+def test_las_ventas_no_tocan_caja_diaria_hasta_consolidar(app):
+    with app.app_context():
+        cliente_id = crear_cliente()
+    http = logueado(app)
+    items = [{"cantidad": 2, "descripcion": "Prueba", "precio_unitario": 100.0, "total": 200.0}]
+    for _ in range(3):
+        http.post("/ventas/guardar", data={
+            "cliente_id": cliente_id, "metodo_pago": "efectivo", "pago_a_cuenta": "50", "items_json": json.dumps(items),
+        })
+    http.post("/pagos", data={"cliente_id": cliente_id, "monto": "70", "metodo_pago": "transferencia"})
+
+    with app.app_context():
+        assert CajaDiaria.query.count() == 0
+        assert CajaMovimiento.query.count() == 4
+        assert Tarea.query.filter_by(tipo="consolidar_caja").count() == 1
+        # Los reportes ya ven los aportes sin consolidar
+        antes = resumen_caja()
+        assert (antes["total_ventas"], antes["total_ingresado"]) == (600, 220)
+
+    assert app.test_cli_runner().invoke(args=["worker", "--una-vez"]).exit_code == 0
+
+    with app.app_context():
+        assert CajaMovimiento.query.count() == 0
+        assert resumen_caja() == antes
+        consolidada = _filas_caja()
+        reconstruir_caja()
+        assert _filas_caja() == consolidada
@@ -0,0 +1,36 @@
+import json
+import os
+
+from app import create_app
+from conftest import config_sqlite, crear_cliente, logueado
+from migraciones import aplicar_migraciones
+from models import db, Tarea
+
+
+def test_el_comprobante_se_prerenderiza_en_el_worker(tmp_path):
+    app = create_app(config_sqlite(tmp_path / "pruebas.db", COMPROBANTES_PRERENDER=True))
+    with app.app_context():
+        aplicar_migraciones(log=lambda *a: None)
+        cliente_id = crear_cliente()
+
+    http = logueado(app)
+    items = [{"cantidad": 1, "descripcion": "Prueba", "precio_unitario": 100.0, "total": 100.0}]
+    respuesta = http.post("/ventas/guardar", data={
+        "cliente_id": cliente_id, "metodo_pago": "efectivo", "pago_a_cuenta": "0", "items_json": json.dumps(items),
+    })
+    assert respuesta.status_code == 200
+    http.post("/pagos", data={"cliente_id": cliente_id, "monto": "50", "metodo_pago": "efectivo"})
+
+    # La request solo encola: el HTML todavía no existe
+    carpeta = app.config["COMPROBANTES_DIR"]
+    assert not os.path.exists(carpeta) or not os.listdir(carpeta)
+    with app.app_context():
+        assert Tarea.query.filter_by(tipo="prerenderizar_comprobante").count() == 2
+
+    assert app.test_cli_runner().invoke(args=["worker", "--una-vez"]).exit_code == 0
+    archivos = sorted(os.listdir(carpeta))
+    assert [nombre.split("-")[0] for nombre in archivos] == ["pago", "venta"]
+
+    with open(os.path.join(carpeta, next(n for n in archivos if n.startswith("venta"))), encoding="utf-8") as f:
+        html = f.read()
+    assert http.get(respuesta.get_json()["redirect_url"]).get_data(as_text=True) == html
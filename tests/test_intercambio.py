@@ -0,0 +1,53 @@
+import io
+import json
+
+from conftest import crear_cliente, logueado
+from models import db, Venta
+
+
+def _importar(http, entidad, lineas):
+    archivo = (io.BytesIO("\n".join(lineas).encode()), f"{entidad}.jsonl")
+    respuesta = http.post(f"/importar/{entidad}", data={"archivo": archivo}, content_type="multipart/form-data")
+    assert respuesta.status_code == 200
+    return respuesta.get_json()
+
+
+def test_registros_jsonl_mal_formados_se_informan_y_se_saltean(app):
+    with app.app_context():
+        cliente_id = crear_cliente()
+    http = logueado(app)
+    venta = {"cliente_id": cliente_id, "metodo_pago": "efectivo",
+             "items": [{"cantidad": 1, "descripcion": "Prueba", "precio_unitario": 100}]}
+
+    resumen = _importar(http, "ventas", [
+        json.dumps(venta),
+        "{no es json",
+        "[1, 2]",
+        json.dumps(dict(venta, items=["no es un ítem"])),
+        json.dumps(dict(venta, items="tampoco")),
+        json.dumps(venta),
+    ])
+
+    assert resumen["insertados"] == 2
+    assert resumen["errores"] == [
+        {"registro": 2, "error": "línea 2: JSON inválido"},
+        {"registro": 3, "error": "línea 3: el registro no es un objeto"},
+        {"registro": 4, "error": "ítem inválido"},
+        {"registro": 5, "error": "ítem inválido"},
+    ]
+    with app.app_context():
+        assert db.session.query(Venta).count() == 2
+
+
+def test_pagos_y_clientes_saltean_lineas_invalidas(app):
+    with app.app_context():
+        cliente_id = crear_cliente()
+    http = logueado(app)
+
+    pagos = _importar(http, "pagos", ["7", json.dumps({"cliente_id": cliente_id, "monto": 10}), "{"])
+    assert pagos["insertados"] == 1
+    assert [e["registro"] for e in pagos["errores"]] == [1, 3]
+
+    clientes = _importar(http, "clientes", ['"texto"', json.dumps({"nombre": "Nuevo", "documento": "nuevo"})])
+    assert clientes["insertados"] == 1
+    assert clientes["errores"] == [{"registro": 1, "error": "línea 1: el registro no es un objeto"}]
@@ -0,0 +1,22 @@
+from app import create_app
+from conftest import config_sqlite, crear_cliente
+from fechas import ahora
+from models import db, Venta
+
+
+def test_esquema_y_despues_migrar_no_corre_las_fechas(tmp_path):
+    app = create_app(config_sqlite(tmp_path / "pruebas.db"))
+    cli = app.test_cli_runner()
+    assert cli.invoke(args=["esquema"]).exit_code == 0
+
+    momento = ahora().replace(microsecond=0)
+    with app.app_context():
+        venta = Venta(cliente_id=crear_cliente(), total=100, pago_a_cuenta=0, saldo_resultante=100,
+                      fecha=momento, metodo_pago="efectivo")
+        db.session.add(venta)
+        db.session.commit()
+        venta_id = venta.id
+
+    assert cli.invoke(args=["migrar"]).exit_code == 0
+    with app.app_context():
+        assert db.session.get(Venta, venta_id).fecha == momento
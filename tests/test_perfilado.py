@@ -0,0 +1,50 @@
+import re
+
+from sqlalchemy import event
+
+from app import create_app
+from conftest import config_sqlite
+from datos_prueba import asegurar_usuario
+from migraciones import aplicar_migraciones
+from models import db, Cliente
+from perfilado import _al_cargar
+
+
+def _app_perfilada(ruta):
+    return create_app(config_sqlite(ruta, PERFILADO=True, METRICS_TOKEN="secreto"))
+
+
+def _filas(http, ruta):
+    timing = http.get(ruta).headers["Server-Timing"]
+    return re.search(r'filas;desc="(\d+)"', timing).group(1)
+
+
+def test_listeners_se_registran_una_vez(tmp_path):
+    app = _app_perfilada(tmp_path / "a.db")
+    with app.app_context():
+        aplicar_migraciones(log=lambda *a: None)
+        asegurar_usuario("pruebas", "pruebas")
+        cliente = Cliente(nombre="Perfil", documento="perfil", monto_autorizado=0)
+        db.session.add(cliente)
+        db.session.commit()
+        ruta = f"/editar/{cliente.id}"
+
+    http = app.test_client()
+    http.post("/login", data={"username": "pruebas", "password": "pruebas"})
+    _filas(http, ruta)  # la primera carga además el usuario (cache de load_user)
+    antes = _filas(http, ruta)
+
+    # Otra app en el mismo proceso no duplica los listeners (ni las filas contadas)
+    _app_perfilada(tmp_path / "b.db")
+    assert event.contains(db.Model, "load", _al_cargar)
+    assert _filas(http, ruta) == antes
+
+
+def test_metrics_pide_sesion_o_token(tmp_path):
+    http = _app_perfilada(tmp_path / "c.db").test_client()
+    assert http.get("/metrics").status_code == 401
+    assert http.get("/metrics", headers={"Authorization": "Bearer otro"}).status_code == 401
+
+    respuesta = http.get("/metrics", headers={"Authorization": "Bearer secreto"})
+    assert respuesta.status_code == 200
+    assert b"bando_requests_total" in respuesta.data
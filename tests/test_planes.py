@@ -0,0 +1,22 @@
+from sqlalchemy import text
+
+from migraciones import verificar_planes
+from models import db
+
+
+def test_consultas_criticas_usan_indices(app):
+    resultado = app.test_cli_runner().invoke(args=["planes"])
+    assert resultado.exit_code == 0, resultado.output
+
+
+def test_detecta_consulta_sin_indice(app):
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(text("DROP INDEX ix_ventas2_fecha"))
+        # Conexiones nuevas: las del pool pueden tener el esquema viejo en cache
+        db.engine.dispose()
+        assert "ventas por fecha" in verificar_planes()
+
+    resultado = app.test_cli_runner().invoke(args=["planes"])
+    assert resultado.exit_code == 1
+    assert "ventas por fecha" in resultado.output
@@ -0,0 +1,6 @@
+from verificar_replica import verificar
+
+
+def test_ruteo_de_lecturas_a_la_replica(tmp_path):
+    problemas = verificar(str(tmp_path / "principal.db"), str(tmp_path / "replica.db"), ventana=0.3, log=lambda *a: None)
+    assert problemas == []
@@ -0,0 +1,27 @@
+from estres_saldos import estresar
+
+
+def test_cajas_en_paralelo_no_pierden_saldo_ni_pasan_el_limite(app):
+    assert estresar(app, workers=8, operaciones=150, log=lambda *a: None) == []
+
+
+def test_pago_mayor_a_la_deuda_deja_saldo_a_favor(app):
+    from datos_prueba import asegurar_usuario
+    from models import db, Cliente, SaldoCliente
+
+    with app.app_context():
+        asegurar_usuario("pruebas", "pruebas")
+        cliente = Cliente(nombre="A favor", documento="a-favor", monto_autorizado=1000)
+        db.session.add(cliente)
+        db.session.flush()
+        db.session.add(SaldoCliente(cliente_id=cliente.id, saldo=0))
+        db.session.commit()
+        cliente_id = cliente.id
+
+    http = app.test_client()
+    http.post("/login", data={"username": "pruebas", "password": "pruebas"})
+    respuesta = http.post("/pagos", data={"cliente_id": cliente_id, "monto": "300", "metodo_pago": "efectivo"})
+    assert respuesta.status_code in (200, 302)
+
+    with app.app_context():
+        assert db.session.get(Cliente, cliente_id).saldo_deudor == -300
@@ -0,0 +1,22 @@
+from conftest import crear_cliente, logueado
+
+
+def test_cliente_id_invalido_solo_rechaza_esa_venta(app):
+    with app.app_context():
+        cliente_id = crear_cliente()
+    http = logueado(app)
+    items = [{"cantidad": 1, "descripcion": "Prueba", "precio_unitario": 100, "total": 100}]
+    venta = {"cliente_id": cliente_id, "items": items, "metodo_pago": "efectivo"}
+
+    respuesta = http.post("/api/ventas/lote", json=[
+        dict(venta, cliente_id=[1]),
+        dict(venta, cliente_id={"id": 1}),
+        dict(venta, cliente_id=True),
+        dict(venta, cliente_id=str(cliente_id)),
+        venta,
+    ])
+
+    assert respuesta.status_code == 200
+    resultados = respuesta.get_json()["resultados"]
+    assert [r.get("error") for r in resultados[:3]] == ["cliente inexistente"] * 3
+    assert all("id" in r for r in resultados[3:])
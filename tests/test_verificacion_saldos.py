@@ -0,0 +1,23 @@
+from sqlalchemy import update
+
+from models import db, Cliente, SaldoCliente, Tarea
+
+
+def test_la_muestra_corrige_saldos_desde_el_worker(app):
+    with app.app_context():
+        cliente = Cliente(nombre="Verificar", documento="verificar", monto_autorizado=1000)
+        db.session.add(cliente)
+        db.session.flush()
+        db.session.add(SaldoCliente(cliente_id=cliente.id, saldo=0))
+        db.session.commit()
+        cliente_id = cliente.id
+        db.session.execute(update(SaldoCliente).where(SaldoCliente.cliente_id == cliente_id).values(saldo=123))
+        db.session.commit()
+
+    cli = app.test_cli_runner()
+    assert "1 verificaciones encoladas" in cli.invoke(args=["verificar-saldos", "--muestra", "10"]).output
+    assert cli.invoke(args=["worker", "--una-vez"]).exit_code == 0
+
+    with app.app_context():
+        assert db.session.get(Cliente, cliente_id).saldo_deudor == 0
+        assert Tarea.query.filter_by(tipo="verificar_saldo", estado="hecha").count() == 1
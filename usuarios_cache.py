@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import session, current_app
+from flask_login import UserMixin, login_user
+from sqlalchemy import event, inspect
+from models import db, Usuario
+
+
+# Versión del usuario con que se inició la sesión
+CLAVE_SESION = "usuario_version"
+
+# user_id -> (UsuarioSesion, vence), del menos al más usado
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+class UsuarioSesion(UserMixin):
+    """Copia liviana de Usuario para current_user: no depende de la sesión de SQLAlchemy."""
+
+    def __init__(self, usuario):
+        self.id = usuario.id
+        self.username = usuario.username
+        self.role = usuario.role
+        self.version = usuario.version or 1
+
+
+def _obtener(user_id):
+    with _lock:
+        entrada = _cache.get(user_id)
+        if entrada is None:
+            return None
+        if entrada[1] < time.monotonic():
+            del _cache[user_id]
+            return None
+        _cache.move_to_end(user_id)
+        return entrada[0]
+
+
+def _guardar(usuario):
+    ttl = current_app.config.get("USUARIOS_CACHE_TTL", 60)
+    maximo = current_app.config.get("USUARIOS_CACHE_MAX", 1000)
+    with _lock:
+        _cache[usuario.id] = (usuario, time.monotonic() + ttl)
+        _cache.move_to_end(usuario.id)
+        while len(_cache) > maximo:
+            _cache.popitem(last=False)
+
+
+def invalidar_usuario(user_id):
+    with _lock:
+        _cache.pop(user_id, None)
+
+
+def cargar_usuario(user_id):
+    """
+    user_loader de flask_login: sale del cache mientras la versión coincida
+    con la de la sesión, si no va a la base.
+
+    Si la versión de la base es distinta a la de la sesión (cambió la
+    contraseña o el rol después del login) se devuelve None y hay que volver a
+    iniciar sesión. Cada proceso tiene su cache: en otro worker el cambio se
+    nota como mucho USUARIOS_CACHE_TTL segundos después.
+    """
+    user_id = int(user_id)
+    version = session.get(CLAVE_SESION, 1)
+
+    usuario = _obtener(user_id)
+    if usuario is None or usuario.version != version:
+        fila = db.session.get(Usuario, user_id)
+        if fila is None:
+            invalidar_usuario(user_id)
+            return None
+        usuario = UsuarioSesion(fila)
+        _guardar(usuario)
+
+    if usuario.version != version:
+        return None
+    return usuario
+
+
+def iniciar_sesion(usuario, **kwargs):
+    """login_user que además guarda en la sesión la versión del usuario."""
+    session[CLAVE_SESION] = usuario.version or 1
+    return login_user(usuario, **kwargs)
+
+
+@event.listens_for(Usuario, "before_update")
+def _nueva_version(mapper, connection, target):
+    estado = inspect(target)
+    if estado.attrs.password.history.has_changes() or estado.attrs.role.history.has_changes():
+        target.version = (target.version or 1) + 1
+        invalidar_usuario(target.id)
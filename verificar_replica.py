@@ -0,0 +1,142 @@
+"""
+Verifica el ruteo de lecturas a la réplica con dos bases SQLite locales.
+
+    python verificar_replica.py
+    python verificar_replica.py --principal /tmp/principal.db --replica /tmp/replica.db
+
+La "replicación" es una copia del archivo principal (API de backup de
+SQLite): después se registra una venta solo en la principal, así la réplica
+queda atrasada y se puede ver de dónde lee cada request. Comprueba que:
+
+- las rutas de reportes leen de la réplica,
+- el usuario que acaba de escribir lee de la principal durante la ventana,
+- pasada la ventana vuelve a la réplica,
+- si la réplica no responde se lee de la principal.
+
+Sale con código 1 si algo falla. tests/test_replica.py corre lo mismo con
+`verificar` en una carpeta temporal.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+
+
+USUARIO = ("replica", "replica")
+
+
+def _argumentos():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--principal", default="replica_principal.db", help="Archivo SQLite de la base principal")
+    p.add_argument("--replica", default="replica_lectura.db", help="Archivo SQLite de la réplica")
+    p.add_argument("--ventana", type=float, default=1.0, help="REPLICA_VENTANA_SEGUNDOS para la prueba")
+    return p.parse_args()
+
+
+def _replicar(origen, destino):
+    with sqlite3.connect(origen) as fuente, sqlite3.connect(destino) as copia:
+        fuente.backup(copia)
+
+
+def verificar(principal, replica, ventana=1.0, log=print):
+    """
+    Corre las comprobaciones con las bases SQLite `principal` y `replica`
+    (se crean de cero) y devuelve la lista de las que fallaron.
+    """
+    from app import create_app
+    from config import Config, binds_replica
+    from migraciones import aplicar_migraciones
+    from datos_prueba import asegurar_usuario
+    from models import db, Cliente, SaldoCliente
+    from operaciones import crear_venta, insertar_items
+
+    for archivo in (principal, replica):
+        if os.path.exists(archivo):
+            os.remove(archivo)
+
+    class ConfigReplica(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{principal}"
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+        SQLALCHEMY_BINDS = binds_replica(f"sqlite:///{replica}")
+        REPLICA_VENTANA_SEGUNDOS = ventana
+        SECRET_KEY = Config.SECRET_KEY or "replica"
+
+    app = create_app(ConfigReplica)
+    items = [{"cantidad": 1, "descripcion": "Réplica", "precio_unitario": 100.0, "total": 100.0}]
+    with app.app_context():
+        aplicar_migraciones(log=lambda *a: None)
+        asegurar_usuario(*USUARIO)
+        cliente = Cliente(nombre="Réplica", documento="replica", monto_autorizado=10000)
+        db.session.add(cliente)
+        db.session.flush()
+        db.session.add(SaldoCliente(cliente_id=cliente.id, saldo=0))
+        db.session.commit()
+        cliente_id = cliente.id
+
+        db.session.remove()
+        _replicar(principal, replica)
+
+        # Venta que todavía no llegó a la réplica
+        _, filas = crear_venta(cliente_id, items, 0, "efectivo")
+        insertar_items(filas)
+        db.session.commit()
+
+    def saldo(cliente_http):
+        return cliente_http.get(f"/api/cliente/{cliente_id}").get_json()["saldo"]
+
+    problemas = []
+
+    def comprobar(descripcion, obtenido, esperado):
+        estado = "ok" if obtenido == esperado else "ERROR"
+        log(f"{estado:<5} {descripcion}: {obtenido} (esperado {esperado})")
+        if obtenido != esperado:
+            problemas.append(descripcion)
+
+    lector = app.test_client()
+    lector.post("/login", data={"username": USUARIO[0], "password": USUARIO[1]})
+    comprobar("lee de la réplica atrasada", saldo(lector), 0)
+    for ruta in ("/caja", "/morosos", f"/movimientos?cliente_id={cliente_id}"):
+        comprobar(f"GET {ruta} desde la réplica", lector.get(ruta).status_code, 200)
+
+    cajero = app.test_client()
+    cajero.post("/login", data={"username": USUARIO[0], "password": USUARIO[1]})
+    cajero.post("/ventas/guardar", data={
+        "cliente_id": cliente_id, "metodo_pago": "efectivo", "pago_a_cuenta": "0", "items_json": json.dumps(items),
+    })
+    comprobar("después de escribir lee sus cambios", saldo(cajero), 200)
+    comprobar("otro usuario sigue en la réplica", saldo(lector), 0)
+
+    time.sleep(ventana + 0.1)
+    comprobar("pasada la ventana vuelve a la réplica", saldo(cajero), 0)
+
+    # Réplica sin tablas: la consulta falla y se lee de la principal
+    with app.app_context():
+        db.engines["replica"].dispose()
+    os.remove(replica)
+    comprobar("réplica caída: lee de la principal", saldo(lector), 200)
+
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    return problemas
+
+
+def main():
+    args = _argumentos()
+    principal = os.path.abspath(args.principal)
+    replica = os.path.abspath(args.replica)
+    problemas = verificar(principal, replica, args.ventana)
+
+    for archivo in (principal, replica):
+        if os.path.exists(archivo):
+            os.remove(archivo)
+    if problemas:
+        sys.exit(1)
+    print("Ruteo a la réplica correcto")
+
+
+if __name__ == "__main__":
+    main()